@@ -0,0 +1,59 @@
+"""Compares scrapy's get_engine_status with EngineStatusCollector.
+
+PYTHONPATH=. python benchmarks/engine_status.py [number]
+"""
+
+import sys
+import timeit
+from time import time
+from types import SimpleNamespace
+
+from scrapy.utils.engine import get_engine_status
+
+from spider_info_webservice.collectors import EngineStatusCollector
+from spider_info_webservice.openmetrics import ENGINE_METRICS
+
+
+def fake_engine() -> SimpleNamespace:
+    scraper_slot = SimpleNamespace(
+        queue=[1, 2],
+        active={1, 2, 3},
+        active_size=24789,
+        itemproc_size=0,
+        needs_backout=lambda: False,
+    )
+    return SimpleNamespace(
+        start_time=time(),
+        downloader=SimpleNamespace(active={1, 2}),
+        scraper=SimpleNamespace(is_idle=lambda: False, slot=scraper_slot),
+        spider=SimpleNamespace(name="quotes"),
+        spider_is_idle=lambda: False,
+        slot=SimpleNamespace(
+            closing=None,
+            inprogress={1, 2},
+            scheduler=SimpleNamespace(dqs=None, mqs=[1, 2, 3]),
+        ),
+    )
+
+
+def main(number: int = 20_000) -> None:
+    engine = fake_engine()
+    collector = EngineStatusCollector(engine)
+    metrics = collector.subset(ENGINE_METRICS)
+    cases = {
+        "get_engine_status + dict": lambda: dict(get_engine_status(engine)),
+        "EngineStatusCollector.collect()": collector.collect,
+        "EngineStatusCollector.subset(metrics).collect()": metrics.collect,
+        "EngineStatusCollector.collect(1 field)": lambda: collector.collect(
+            ["len(engine.slot.inprogress)"]
+        ),
+    }
+    baseline = None
+    for name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=number, repeat=5)) / number
+        baseline = baseline or seconds
+        print(f"{name:<48} {seconds * 1e6:8.2f} us  x{baseline / seconds:.1f}")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:2]))
@@ -0,0 +1,67 @@
+"""Measures how long InfoService startup delays spider_opened, eager and lazy.
+
+Every start is measured in a new process, the way short-lived spiders start,
+and once more in the same process, the way crawlers of CrawlerProcess start.
+
+PYTHONPATH=. python benchmarks/startup.py [processes]
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+from time import perf_counter
+
+
+def start_once(lazy: bool) -> float:
+    from scrapy import Spider
+    from scrapy.utils.test import get_crawler
+
+    from spider_info_webservice import InfoService
+
+    crawler = get_crawler(
+        Spider,
+        {
+            "INFO_SERVICE_LAZY_START": lazy,
+            "TELNETCONSOLE_ENABLED": False,
+            "LOG_ENABLED": False,
+        },
+    )
+    crawler.spider = crawler._create_spider("startup")
+    crawler.engine = crawler._create_engine()
+    ext = InfoService.from_crawler(crawler)
+    start = perf_counter()
+    ext._start()
+    elapsed = perf_counter() - start
+    ext.port.stopListening()
+    return elapsed
+
+
+def child(lazy: bool) -> None:
+    cold = start_once(lazy)
+    warm = start_once(lazy)
+    json.dump({"cold": cold, "warm": warm}, sys.stdout)
+
+
+def main(processes: int = 10) -> None:
+    for name, lazy in (("eager", False), ("lazy", True)):
+        runs = [
+            json.loads(
+                subprocess.run(
+                    [sys.executable, __file__, "--child", str(int(lazy))],
+                    check=True,
+                    capture_output=True,
+                ).stdout
+            )
+            for _ in range(processes)
+        ]
+        cold = statistics.median(run["cold"] for run in runs)
+        warm = statistics.median(run["warm"] for run in runs)
+        print(f"{name:<6} first start {cold * 1e3:8.2f} ms  next {warm * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        child(bool(int(sys.argv[2])))
+    else:
+        main(*map(int, sys.argv[1:2]))
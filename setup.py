@@ -17,6 +17,14 @@ setup(
     url="https://github.com/abebus/spider-info-webservice",
     packages=find_packages(exclude=["test"]),
     install_requires=["scrapy>=2.6"],
+    entry_points={
+        "console_scripts": [
+            "spider-info-aggregator = spider_info_webservice.aggregator:main",
+            "spider-info-relay = spider_info_webservice.relay:main",
+            "spider-info-front = spider_info_webservice.front:main",
+            "spider-info-shm = spider_info_webservice.shm:main",
+        ],
+    },
     classifiers=[
         "Programming Language :: Python",
         "Programming Language :: Python :: 3.12",
@@ -1,24 +1,48 @@
 from __future__ import annotations
 
+import json
 import logging
+import os
+import random
 import warnings
+from numbers import Real
+from time import time
 from typing import TYPE_CHECKING
 
 import scrapy
 import scrapy.signals
 from scrapy.exceptions import NotConfigured
-from scrapy.utils.defer import maybe_deferred_to_future
+from scrapy.utils.defer import deferred_from_coro, maybe_deferred_to_future
+from twisted.internet import task
+from twisted.web import resource, server
 
-from .utils import create, get_child_resources, get_project_name_from_config
+from .auth import CredentialsChecker
+from .client import HTTPClient
+from .collectors import LatencyCollector, RequestAgeTracker, SchedulerCounters
+from .history import StatsHistory
+from .utils import (
+    LazyResource,
+    RateLimiter,
+    ResponseCompressor,
+    SerializationPool,
+    create,
+    get_child_resources,
+    get_process_data,
+    listen,
+)
 
 if TYPE_CHECKING:
     from typing import Any
 
+    from scrapy import Spider
     from scrapy.crawler import Crawler
+    from twisted.internet.base import DelayedCall
+    from twisted.internet.defer import Deferred
     from twisted.internet.tcp import Port
-    from twisted.web import resource
 
     from .resources import RootResource
+    from .shared import SharedService
+    from .shm import SnapshotPublisher
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +57,33 @@ class InfoService:
         crawler.signals.connect(
             self.default_stop_callback, signal=scrapy.signals.engine_stopped
         )
+        crawler.signals.connect(
+            self._record_finish_reason, signal=scrapy.signals.spider_closed
+        )
+        self.request_ages = RequestAgeTracker()
+        crawler.signals.connect(
+            self.request_ages.request_reached_downloader,
+            signal=scrapy.signals.request_reached_downloader,
+        )
+        self.scheduler_counters = SchedulerCounters()
+        crawler.signals.connect(
+            self.scheduler_counters.request_scheduled,
+            signal=scrapy.signals.request_scheduled,
+        )
+        crawler.signals.connect(
+            self.scheduler_counters.request_dropped,
+            signal=scrapy.signals.request_dropped,
+        )
+        self.latency_collector: LatencyCollector | None = None
+        if crawler.settings.getbool("INFO_SERVICE_LATENCY_ENABLED", False):
+            self.latency_collector = LatencyCollector(
+                crawler.settings.getint("INFO_SERVICE_LATENCY_MAX_DOMAINS", 1000)
+            )
+            for name in ("response_received", "item_scraped", "request_dropped"):
+                crawler.signals.connect(
+                    getattr(self.latency_collector, name),
+                    signal=getattr(scrapy.signals, name),
+                )
 
         portrange_deprecated = crawler.settings.get("STATS_SERVER_PORTRANGE")
         if portrange_deprecated:
@@ -58,8 +109,19 @@ class InfoService:
             [r"^INFO_SERVICE_USERS$", r".*_PASS(?:WORD)?$", r".*_USER(?:NAME)?$"],
         )
         self.users = crawler.settings.get("INFO_SERVICE_USERS", {"scrapy": b"scrapy"})
+        self.credentials_checker = CredentialsChecker(
+            self.users,
+            tokens=crawler.settings.getlist("INFO_SERVICE_TOKENS"),
+            cache_size=crawler.settings.getint("INFO_SERVICE_AUTH_CACHE_SIZE", 128),
+            verify_rate=crawler.settings.getfloat("INFO_SERVICE_AUTH_VERIFY_RATE", 1.0),
+            verify_burst=crawler.settings.getint("INFO_SERVICE_AUTH_VERIFY_BURST", 5),
+        )
         self.general_data = {}
         self.port: Port | None = None
+        self.shared = crawler.settings.getbool("INFO_SERVICE_SHARED", False)
+        self.lazy_start = crawler.settings.getbool("INFO_SERVICE_LAZY_START", False)
+        self.shared_service: SharedService | None = None
+        self.root_resource: RootResource | None = None
         self.crawler: Crawler = crawler
 
         self.resources_child_prefix = self.crawler.settings.get(
@@ -75,55 +137,248 @@ class InfoService:
         self.info_report_url = info_report_url_deprecated or self.crawler.settings.get(
             "INFO_SERVICE_REPORT_URL",
         )
+        self.report_interval = self.crawler.settings.getfloat(
+            "INFO_SERVICE_REPORT_INTERVAL", 0
+        )
+        self.report_timeout = self.crawler.settings.getfloat(
+            "INFO_SERVICE_REPORT_TIMEOUT", 10.0
+        )
+        self.report_retries = self.crawler.settings.getint(
+            "INFO_SERVICE_REPORT_RETRIES", 3
+        )
+        self.report_client: HTTPClient | None = None
+        self.finish_reason: str | None = None
+        self._heartbeat: task.LoopingCall | None = None
+        self._heartbeat_start: DelayedCall | None = None
+        self._start_report: Deferred | None = None
+        self.unix_socket = self.crawler.settings.get("INFO_SERVICE_UNIX_SOCKET")
+        self.socket_dir = self.crawler.settings.get("INFO_SERVICE_SOCKET_DIR")
+        self.spider_id = self.crawler.settings.get("INFO_SERVICE_SPIDER_ID")
+        self.shm_dir = self.crawler.settings.get("INFO_SERVICE_SHM_DIR")
+        self.shm_interval = self.crawler.settings.getfloat(
+            "INFO_SERVICE_SHM_INTERVAL", 1.0
+        )
+        self.shm_max_keys = self.crawler.settings.getint(
+            "INFO_SERVICE_SHM_MAX_KEYS", 1024
+        )
+        self.snapshot_publisher: SnapshotPublisher | None = None
         self.resources: list[dict[str, Any]] | None = None
 
+        self.serialization_pool: SerializationPool | None = None
+        offload_threshold = self.crawler.settings.get("INFO_SERVICE_OFFLOAD_THRESHOLD")
+        if offload_threshold is not None:
+            self.serialization_pool = SerializationPool(
+                size=self.crawler.settings.getint("INFO_SERVICE_OFFLOAD_POOL_SIZE", 2),
+                threshold=int(offload_threshold),
+            )
+
+        self.compressor: ResponseCompressor | None = None
+        if self.crawler.settings.getbool("INFO_SERVICE_COMPRESSION_ENABLED", True):
+            self.compressor = ResponseCompressor(
+                min_size=self.crawler.settings.getint(
+                    "INFO_SERVICE_COMPRESSION_MIN_SIZE", 1024
+                ),
+                level=self.crawler.settings.getint("INFO_SERVICE_COMPRESSION_LEVEL", 6),
+            )
+
+        # seconds for all resources or dict of resource names and seconds
+        self.cache_ttl = self.crawler.settings.get("INFO_SERVICE_CACHE_TTL", 0.0)
+        self.rate_limiter: RateLimiter | None = None
+        rate_limit = self.crawler.settings.getfloat("INFO_SERVICE_RATE_LIMIT", 0.0)
+        if rate_limit > 0:
+            self.rate_limiter = RateLimiter(
+                rate_limit,
+                burst=self.crawler.settings.getint("INFO_SERVICE_RATE_LIMIT_BURST", 10),
+            )
+
+        self.engine_status_extra = self.crawler.settings.get(
+            "INFO_SERVICE_ENGINE_STATUS_EXTRA"
+        )
+        if isinstance(self.engine_status_extra, str):
+            # -s value: JSON dict or list, or comma separated expressions
+            extra = self.engine_status_extra.strip()
+            if extra.startswith("{"):
+                self.engine_status_extra = self.crawler.settings.getdict(
+                    "INFO_SERVICE_ENGINE_STATUS_EXTRA"
+                )
+            elif extra.startswith("["):
+                self.engine_status_extra = json.loads(extra)
+            else:
+                self.engine_status_extra = self.crawler.settings.getlist(
+                    "INFO_SERVICE_ENGINE_STATUS_EXTRA"
+                )
+
+        self.stream_interval = self.crawler.settings.getfloat(
+            "INFO_SERVICE_STREAM_INTERVAL", 1.0
+        )
+        self.scheduler_sample_size = self.crawler.settings.getint(
+            "INFO_SERVICE_SCHEDULER_SAMPLE_SIZE", 1000
+        )
+        # tracemalloc snapshots could take a lot of memory and CPU
+        self.memory_enabled = self.crawler.settings.getbool(
+            "INFO_SERVICE_MEMORY_ENABLED", False
+        )
+        self.memory_max_snapshots = self.crawler.settings.getint(
+            "INFO_SERVICE_MEMORY_MAX_SNAPSHOTS", 3
+        )
+
+        self.stats_history: StatsHistory | None = None
+        self.stats_history_interval = self.crawler.settings.getfloat(
+            "INFO_SERVICE_STATS_HISTORY_INTERVAL", 0
+        )
+        if self.stats_history_interval:
+            self.stats_history = StatsHistory(
+                self.crawler.stats,
+                size=self.crawler.settings.getint(
+                    "INFO_SERVICE_STATS_HISTORY_SIZE", 360
+                ),
+                max_keys=self.crawler.settings.getint(
+                    "INFO_SERVICE_STATS_HISTORY_MAX_KEYS", 256
+                ),
+            )
+
     def prep_resources(self):
-        self.resources = self.crawler.settings.get(
-            "INFO_SERVICE_RESOURCES",
-            [
-                {
-                    "name": b"engine",
-                    "class": "spider_info_webservice.resources.EngineStatusResource",
-                    "args": [self.crawler.engine],
-                },
-                {
-                    "name": b"slot",
-                    "class": "spider_info_webservice.resources.SlotResource",
-                    "args": [self.crawler.engine.slot],
+        default_resources = [
+            {
+                "name": b"engine",
+                "class": "spider_info_webservice.resources.EngineStatusResource",
+                "args": [self.crawler.engine],
+                "kwargs": {"extra_expressions": self.engine_status_extra},
+            },
+            {
+                "name": b"slot",
+                "class": "spider_info_webservice.resources.SlotResource",
+                "args": [self.crawler.engine.slot],
+            },
+            {
+                "name": b"slot/summary",
+                "class": "spider_info_webservice.resources.SlotSummaryResource",
+                "args": [self.crawler.engine.slot, self.request_ages],
+            },
+            {
+                "name": b"downloader",
+                "class": "spider_info_webservice.resources.DownloaderResource",
+                "args": [self.crawler.engine.downloader],
+            },
+            {
+                "name": b"scheduler",
+                "class": "spider_info_webservice.resources.SchedulerResource",
+                "args": [self.crawler.engine, self.scheduler_counters],
+                "kwargs": {"max_sample_size": self.scheduler_sample_size},
+            },
+            {
+                "name": b"settings",
+                "class": "spider_info_webservice.resources.SettingsResource",
+                "args": [self.crawler.settings, self.settings_sensetive_keys],
+            },
+            {
+                "name": b"stats",
+                "class": "spider_info_webservice.resources.StatsResource",
+                "args": [self.crawler.stats],
+            },
+            {
+                "name": b"general",
+                "class": "spider_info_webservice.resources.GeneralDataResource",
+            },
+            {
+                "name": b"metrics",
+                "class": "spider_info_webservice.resources.MetricsResource",
+                "args": [self.crawler.stats, self.crawler.engine],
+            },
+            {
+                "name": b"stream",
+                "class": "spider_info_webservice.resources.StreamResource",
+                "args": [self.crawler.stats, self.crawler.engine],
+                "kwargs": {
+                    "interval": self.stream_interval,
+                    "extra_expressions": self.engine_status_extra,
                 },
+            },
+            {
+                "name": b"batch",
+                "class": "spider_info_webservice.resources.BatchResource",
+            },
+            {
+                "name": b"_service",
+                "class": "spider_info_webservice.resources.ServiceResource",
+            },
+        ]
+        if self.latency_collector is not None:
+            default_resources.append(
                 {
-                    "name": b"settings",
-                    "class": "spider_info_webservice.resources.SettingsResource",
-                    "args": [self.crawler.settings, self.settings_sensetive_keys],
-                },
+                    "name": b"latency",
+                    "class": "spider_info_webservice.resources.LatencyResource",
+                    "args": [self.latency_collector],
+                }
+            )
+        if self.memory_enabled:
+            default_resources.append(
                 {
-                    "name": b"stats",
-                    "class": "spider_info_webservice.resources.StatsResource",
-                    "args": [self.crawler.stats],
-                },
+                    "name": b"memory",
+                    "class": "spider_info_webservice.resources.MemoryResource",
+                    "kwargs": {"max_snapshots": self.memory_max_snapshots},
+                }
+            )
+        if self.stats_history is not None:
+            default_resources.append(
                 {
-                    "name": b"general",
-                    "class": "spider_info_webservice.resources.GeneralDataResource",
-                },
-            ],
+                    "name": b"stats/history",
+                    "class": "spider_info_webservice.resources.StatsHistoryResource",
+                    "args": [self.stats_history],
+                }
+            )
+        self.resources = self.crawler.settings.get(
+            "INFO_SERVICE_RESOURCES", default_resources
         )
 
     def _start(self):
         self.prep_resources()
+        if self.serialization_pool is not None:
+            self.serialization_pool.start()
+        if self.spider_id is None:
+            self.spider_id = f"{self.crawler.spider.name}-{os.getpid()}"
+        unix_socket = self.unix_socket
+        if unix_socket is None and self.socket_dir:
+            os.makedirs(self.socket_dir, exist_ok=True)
+            unix_socket = os.path.join(self.socket_dir, f"{self.spider_id}.sock")
         try:
-            r: resource.Resource
-            root_resource: RootResource
-            r, root_resource, self.port = create(
-                users=self.users,
-                host=self.host,
-                portrange=self.portrange,
-                crawler=self.crawler,
-                resources=self.resources,
-                resources_child_prefix=self.resources_child_prefix,
-            )
-            logger.info(
-                f"Service started on {self.port.getHost().host}:{self.port.getHost().port}"
-            )
+            if self.shared:
+                info_path = self._start_shared(unix_socket)
+            elif self.lazy_start:
+                from .auth import AuthResource
+
+                # resources module isn't even imported until the first request
+                r = resource.Resource()
+                r.putChild(b"info", LazyResource(self.load_resources))
+                self.port = listen(
+                    server.Site(AuthResource(r, self.credentials_checker)),
+                    self.host,
+                    self.portrange,
+                    unix_socket,
+                )
+                info_path = "/info/"
+            else:
+                r, self.root_resource, self.port = create(
+                    users=self.users,
+                    host=self.host,
+                    portrange=self.portrange,
+                    crawler=self.crawler,
+                    resources=self.resources,
+                    resources_child_prefix=self.resources_child_prefix,
+                    serialization_pool=self.serialization_pool,
+                    compressor=self.compressor,
+                    credentials_checker=self.credentials_checker,
+                    unix_socket=unix_socket,
+                    cache_ttl=self.cache_ttl,
+                    rate_limiter=self.rate_limiter,
+                )
+                info_path = "/info/"
+            if unix_socket is not None:
+                logger.info(f"Service started on {unix_socket}{info_path}")
+            else:
+                logger.info(
+                    f"Service started on {self.port.getHost().host}:{self.port.getHost().port}{info_path}"
+                )
         except OSError:
             raise NotConfigured(
                 f"Failed to start service in portrange {self.portrange}"
@@ -131,57 +386,221 @@ class InfoService:
         except Exception as e:
             raise NotConfigured(f"Failed to start service: {e}")
 
-        import os
-
-        from scrapy.utils.versions import scrapy_components_versions
-
+        address = self.port.getHost()
         self.general_data.update(
             {
                 "pid": os.getpid(),
-                "project_name": get_project_name_from_config(),
                 "bot_name": self.crawler.settings.get("BOT_NAME"),
                 "spider_name": self.crawler.spider.name,
-                "info_service_host": self.port.getHost().host,
-                "info_service_port": self.port.getHost().port,
-                "base_versions": {
-                    "Scrapy": scrapy.__version__,
-                    **{name: version for name, version in scrapy_components_versions()},
-                },
-                "available_resources": get_child_resources(r),
+                "spider_id": self.spider_id,
+                "info_service_host": getattr(address, "host", None),
+                "info_service_port": getattr(address, "port", None),
+                "info_service_socket": unix_socket,
+                "info_service_path": info_path,
             }
         )
-        getattr(
-            root_resource, self.resources_child_prefix + "general"
-        ).general_data = self.general_data
+        if not self.lazy_start:
+            self.load_resources()
+
+        if self.stats_history is not None:
+            self.stats_history.start(self.stats_history_interval)
+
+        if self.shm_dir:
+            from .collectors import EngineStatusCollector
+            from .shm import SnapshotPublisher
+
+            os.makedirs(self.shm_dir, exist_ok=True)
+            self.snapshot_publisher = SnapshotPublisher(
+                os.path.join(self.shm_dir, f"{self.spider_id}.snapshot"),
+                self.crawler.stats,
+                EngineStatusCollector(self.crawler.engine, self.engine_status_extra),
+                self.general_data,
+                max_keys=self.shm_max_keys,
+            )
+            self.snapshot_publisher.start(self.shm_interval)
+
+    def _start_shared(self, unix_socket: str | None) -> str:
+        """Serve resources under ``/info/<spider id>/`` of the process' service"""
+        from .shared import get_shared_service
+
+        self.shared_service = get_shared_service(
+            self.credentials_checker, self.host, self.portrange, unix_socket
+        )
+        self.spider_id = self.shared_service.crawler_id(self.spider_id)
+        self.shared_service.register(
+            self.spider_id,
+            self,
+            (
+                LazyResource(self.load_resources)
+                if self.lazy_start
+                else self.build_root_resource()
+            ),
+        )
+        self.port = self.shared_service.port
+        return f"/info/{self.spider_id}/"
+
+    def build_root_resource(self) -> RootResource:
+        from .resources import RootResource
+
+        self.root_resource = RootResource(
+            self.crawler,
+            self.resources,
+            self.resources_child_prefix,
+            self.serialization_pool,
+            self.compressor,
+            cache_ttl=self.cache_ttl,
+            rate_limiter=self.rate_limiter,
+        )
+        return self.root_resource
+
+    def load_resources(self) -> RootResource:
+        """Build resources if they aren't built yet and add data that takes
+        time to compute to general data, once"""
+        if self.root_resource is None:
+            self.build_root_resource()
+        if "available_resources" not in self.general_data:
+            path = self.general_data["info_service_path"].rstrip("/")
+            self.general_data.update(
+                {
+                    **get_process_data(),
+                    "available_resources": [
+                        {
+                            "name": path,
+                            "doc": self.root_resource.__doc__,
+                            "methods": ["GET"],
+                        },
+                        *get_child_resources(self.root_resource, path),
+                    ],
+                }
+            )
+            getattr(
+                self.root_resource, self.resources_child_prefix + "general"
+            ).general_data = self.general_data
+        return self.root_resource
 
     async def _stop(self):
-        if d := self.port.stopListening():
+        if self.shared_service is not None:
+            d = self.shared_service.unregister(self.spider_id)
+        else:
+            d = self.port.stopListening()
+        if d:
             await maybe_deferred_to_future(d)
+        # stopped listener keeps connections, subscribers would never be finished
+        stream = getattr(self.root_resource, "child_stream", None)
+        if stream is not None:
+            stream.close()
+        if self.serialization_pool is not None:
+            self.serialization_pool.stop()
+        if self.stats_history is not None:
+            self.stats_history.stop()
+        if self.snapshot_publisher is not None:
+            self.snapshot_publisher.stop()
 
     @classmethod
     def from_crawler(cls, crawler: Crawler):
         ext = cls(crawler)
         return ext
 
+    def _record_finish_reason(self, spider: Spider, reason: str) -> None:
+        self.finish_reason = reason
+
+    async def send_report(self, report: dict[str, Any]) -> None:
+        """POST ``report`` to ``INFO_SERVICE_REPORT_URL``, failures are only logged"""
+        if self.report_client is None:
+            # one request at a time keeps reports in order
+            self.report_client = HTTPClient(
+                concurrency=1,
+                timeout=self.report_timeout,
+                max_persistent_per_host=1,
+                retries=self.report_retries,
+            )
+        try:
+            await maybe_deferred_to_future(
+                self.report_client.post_json(self.info_report_url, report)
+            )
+        except Exception as e:
+            logger.warning(f"Failed to send report to {self.info_report_url}: {e!r}")
+
+    def compact_report(self, event: str) -> dict[str, Any]:
+        """Spider identity and numeric stats"""
+        return {
+            "event": event,
+            "time": time(),
+            **{
+                key: self.general_data.get(key)
+                for key in (
+                    "pid",
+                    "spider_name",
+                    "spider_id",
+                    "info_service_host",
+                    "info_service_port",
+                    "info_service_socket",
+                    "info_service_path",
+                )
+            },
+            "stats": {
+                key: value
+                for key, value in self.crawler.stats.get_stats().items()
+                if isinstance(value, Real) and not isinstance(value, bool)
+            },
+        }
+
+    async def send_heartbeat(self) -> None:
+        await self.send_report(self.compact_report("heartbeat"))
+
     async def default_start_callback(self):
         if not self.info_report_url:
             return
 
-        def send_report():
-            import json
-            import urllib.request
+        if self.lazy_start:
+            from twisted.internet import reactor
+
+            # the engine waits for spider_opened handlers before it schedules
+            # requests, so resources are loaded for the report on the next
+            # reactor iteration instead
+            reactor.callLater(0, self.send_start_report)
+        else:
+            self.send_start_report()
 
-            data = json.dumps(self.general_data).encode("utf-8")
-            req = urllib.request.Request(
-                self.info_report_url,
-                data=data,
-                headers={"Content-Type": "application/json"},
+        if self.report_interval:
+            from twisted.internet import reactor
+
+            self._heartbeat = task.LoopingCall(
+                lambda: deferred_from_coro(self.send_heartbeat())
+            )
+            # spiders started together should not report together
+            self._heartbeat_start = reactor.callLater(
+                random.uniform(0, self.report_interval),
+                self._heartbeat.start,
+                self.report_interval,
             )
-            urllib.request.urlopen(req)
 
-        from twisted.internet.threads import deferToThread
+    def send_start_report(self) -> None:
+        if self.lazy_start:
+            self.load_resources()
+        # spider_opened handlers delay the first request, so report (which could
+        # take a while with retries) isn't waited for
+        self._start_report = deferred_from_coro(self.send_report(self.general_data))
+        self._start_report.addErrback(
+            lambda failure: logger.error(
+                f"Failed to send report to {self.info_report_url}: "
+                f"{failure.getErrorMessage()}"
+            )
+        )
 
-        await maybe_deferred_to_future(deferToThread(send_report))
+    async def default_stop_callback(self):
+        if not self.info_report_url:
+            return
 
-    def default_stop_callback(self):
-        pass
+        if self._heartbeat_start is not None and self._heartbeat_start.active():
+            self._heartbeat_start.cancel()
+        if self._heartbeat is not None and self._heartbeat.running:
+            self._heartbeat.stop()
+
+        report = self.compact_report("stop")
+        report["finish_reason"] = self.finish_reason or self.crawler.stats.get_value(
+            "finish_reason"
+        )
+        await self.send_report(report)
+        if self.report_client is not None:
+            await maybe_deferred_to_future(self.report_client.close())
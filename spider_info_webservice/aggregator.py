@@ -0,0 +1,463 @@
+"""Aggregator of many spiders' info services.
+
+Spiders register themselves by reporting to it, e.g. with
+``INFO_SERVICE_REPORT_URL = "http://127.0.0.1:6023/register"``, run it with::
+
+    python -m spider_info_webservice.aggregator --port 6023 --spider-auth scrapy:scrapy
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import heapq
+import ipaddress
+import json
+import logging
+import os
+from numbers import Real
+from time import time
+from typing import TYPE_CHECKING
+from urllib.parse import quote, urlsplit
+
+from twisted.internet import defer, task
+from twisted.web import resource, server
+
+from .auth import AuthResource, CredentialsChecker
+from .client import HTTPClient, HTTPError
+from .front import SOCKET_SUFFIX
+from .utils import (
+    BadRequest,
+    dumps_as_bytes,
+    error_as_bytes,
+    finish_with,
+    get_arg,
+    get_int_arg,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+    from typing import Any
+
+    from twisted.internet.defer import Deferred
+    from twisted.web.http import Request
+
+logger = logging.getLogger(__name__)
+
+UNSPECIFIED_HOSTS = {"", "0.0.0.0", "::"}
+
+
+class SpiderRegistry:
+    """Live spiders by id (``host:port`` of their info service, followed by
+    crawler id for crawlers of a shared service, e.g. ``host:port/quotes-1``).
+
+    Spiders listening on Unix sockets are reached through the front listener
+    on ``front_port`` of their host, by ``host:front_port/spiders/<socket name>``.
+    Entries not refreshed by a report within ``ttl`` seconds are dropped by
+    ``expire``.
+
+    Spiders are ``trusted`` with credentials of their info services when
+    they are reached at the address they reported from, or at one of
+    ``trusted_hosts`` (host names, addresses or networks, e.g. ``10.0.0.0/8``),
+    otherwise anyone able to report could collect the credentials.
+    """
+
+    def __init__(
+        self,
+        ttl: float | None = None,
+        front_port: int | None = 6024,
+        trusted_hosts: Iterable[str] = (),
+    ):
+        self.ttl = ttl
+        self.front_port = front_port
+        self.trusted_names: set[str] = set()
+        self.trusted_networks: list[ipaddress.IPv4Network | ipaddress.IPv6Network] = []
+        for host in trusted_hosts:
+            try:
+                self.trusted_networks.append(ipaddress.ip_network(host, strict=False))
+            except ValueError:
+                self.trusted_names.add(host.lower())
+        self.spiders: dict[str, dict[str, Any]] = {}
+
+    def locate(
+        self, report: dict[str, Any], address: str | None = None
+    ) -> tuple[str, str]:
+        """Return id and URL of ``info/`` resources of reporting spider"""
+        path = report.get("info_service_path") or "/info/"
+        if not isinstance(path, str) or not path.startswith("/info/"):
+            raise BadRequest("info_service_path must start with /info/")
+        path = path.rstrip("/") + "/"
+        socket = report.get("info_service_socket")
+        host = report.get("info_service_host")
+        if socket and report.get("info_service_port") is None:
+            name = os.path.basename(str(socket))
+            if self.front_port is None or not name.endswith(SOCKET_SUFFIX):
+                raise BadRequest(
+                    "spiders listening on Unix sockets are reached through front "
+                    "listener, it needs aggregator --front-port and socket in "
+                    "INFO_SERVICE_SOCKET_DIR"
+                )
+            port = self.front_port
+            prefix = "/spiders/" + quote(name[: -len(SOCKET_SUFFIX)], safe="")
+        else:
+            try:
+                port = int(report["info_service_port"])
+            except (KeyError, TypeError, ValueError):
+                raise BadRequest("info_service_host and info_service_port are required")
+            prefix = ""
+        if host in UNSPECIFIED_HOSTS or host is None:
+            host = address
+        if not isinstance(host, str) or not host:
+            raise BadRequest("info_service_host and info_service_port are required")
+        url_host = f"[{host}]" if ":" in host else host
+        spider_id = f"{url_host}:{port}{prefix}{path[len('/info'):].rstrip('/')}"
+        return spider_id, f"http://{url_host}:{port}{prefix}{path}"
+
+    def trusts(self, url: str, address: str | None = None) -> bool:
+        host = urlsplit(url).hostname
+        if host is None:
+            return False
+        if host == address or host in self.trusted_names:
+            return True
+        try:
+            ip = ipaddress.ip_address(host)
+        except ValueError:
+            return False
+        return any(ip in network for network in self.trusted_networks)
+
+    def register(self, report: dict[str, Any], address: str | None = None) -> str:
+        """Handle spider's report: ``default_start_callback`` report (has no
+        ``event``) adds spider, ``"heartbeat"`` refreshes it and updates its
+        stats, ``"stop"`` removes it. ``address`` of the reporting peer
+        replaces unspecified bind host."""
+        spider_id, url = self.locate(report, address)
+        event = report.get("event", "start")
+        spider = self.spiders.get(spider_id)
+        same_process = spider is not None and spider["report"].get("pid") == report.get(
+            "pid"
+        )
+        if event == "stop":
+            if same_process:
+                self.unregister(spider_id)
+                logger.info(
+                    f"Spider {spider_id} finished: {report.get('finish_reason')}"
+                )
+            return spider_id
+
+        now = time()
+        if event != "heartbeat" or not same_process:
+            spider = self.spiders[spider_id] = {
+                "id": spider_id,
+                "url": url,
+                "trusted": self.trusts(url, address),
+                "registered_at": now,
+                "report": {k: v for k, v in report.items() if k != "stats"},
+            }
+        if "stats" in report:
+            spider["stats"] = report["stats"]
+        spider["last_seen"] = now
+        return spider_id
+
+    def unregister(self, spider_id: str) -> None:
+        self.spiders.pop(spider_id, None)
+
+    def expire(self, now: float | None = None) -> list[str]:
+        if self.ttl is None:
+            return []
+        deadline = (time() if now is None else now) - self.ttl
+        expired = [
+            spider_id
+            for spider_id, spider in self.spiders.items()
+            if spider["last_seen"] < deadline
+        ]
+        for spider_id in expired:
+            del self.spiders[spider_id]
+        return expired
+
+
+def sum_stats(stats: list[dict[str, Any]]) -> dict[str, Any]:
+    """Sum numeric values of the same keys, other values are skipped"""
+    total: dict[str, Any] = {}
+    for spider_stats in stats:
+        for key, value in spider_stats.items():
+            if isinstance(value, Real) and not isinstance(value, bool):
+                total[key] = total.get(key, 0) + value
+    return dict(sorted(total.items()))
+
+
+def error_rate(stats: dict[str, Any]) -> float:
+    """``log_count/ERROR`` per downloaded request"""
+    errors = stats.get("log_count/ERROR", 0)
+    requests = stats.get("downloader/request_count", 0)
+    return errors / max(requests, 1)
+
+
+def stats_value(stats: dict[str, Any], by: str) -> float | None:
+    if by == "error_rate":
+        return error_rate(stats)
+    value = stats.get(by)
+    if isinstance(value, Real) and not isinstance(value, bool):
+        return value
+    return None
+
+
+class Aggregator:
+    """Fans requests out to all registered spiders with ``client``,
+    which bounds parallelism and times out slow spiders. ``headers``, e.g.
+    spiders credentials, are sent only to ``trusted`` spiders."""
+
+    def __init__(
+        self,
+        registry: SpiderRegistry,
+        client: HTTPClient,
+        headers: dict[bytes, list[bytes]] | None = None,
+    ):
+        self.registry = registry
+        self.client = client
+        self.headers = headers or {}
+
+    def fetch(self, spider: dict[str, Any], path: str) -> Deferred:
+        """Fire with ``(ok, data or error message)``, never fail"""
+
+        def failed(failure) -> tuple[bool, str]:
+            if failure.check(HTTPError):
+                return False, f"HTTP {failure.value.code}"
+            if failure.check(defer.TimeoutError, defer.CancelledError):
+                return False, "timeout"
+            return False, failure.getErrorMessage()
+
+        headers = self.headers if spider.get("trusted") else None
+        d = self.client.get_json(spider["url"] + path, headers)
+        d.addCallbacks(lambda data: (True, data), failed)
+        return d
+
+    def fan_out(self, path: str) -> Deferred:
+        """Fire with ``{spider_id: (ok, data or error message)}``"""
+        spiders = list(self.registry.spiders.values())
+        d = defer.gatherResults([self.fetch(spider, path) for spider in spiders])
+        d.addCallback(
+            lambda results: {
+                spider["id"]: result for spider, result in zip(spiders, results)
+            }
+        )
+        return d
+
+    async def stats(self) -> dict[str, Any]:
+        results = await self.fan_out("stats")
+        return {
+            "spiders": sum(ok for ok, _ in results.values()),
+            "failed": {
+                spider_id: error for spider_id, (ok, error) in results.items() if not ok
+            },
+            "stats": sum_stats([data for ok, data in results.values() if ok]),
+        }
+
+    async def status(self) -> dict[str, Any]:
+        results = await self.fan_out("engine")
+        status = {}
+        for spider_id, (ok, data) in results.items():
+            spider = self.registry.spiders.get(spider_id, {})
+            status[spider_id] = {
+                "spider_name": spider.get("report", {}).get("spider_name"),
+                "ok": ok,
+                "engine" if ok else "error": data,
+            }
+        return status
+
+    async def top(self, by: str = "error_rate", n: int = 10) -> list[dict[str, Any]]:
+        results = await self.fan_out("stats")
+        values = []
+        for spider_id, (ok, data) in results.items():
+            if ok and (value := stats_value(data, by)) is not None:
+                values.append((value, spider_id))
+        return [
+            {
+                "id": spider_id,
+                "spider_name": self.registry.spiders.get(spider_id, {})
+                .get("report", {})
+                .get("spider_name"),
+                by: value,
+            }
+            for value, spider_id in heapq.nlargest(n, values)
+        ]
+
+
+class AggregatorResource(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, aggregator: Aggregator):
+        super().__init__()
+        self.aggregator = aggregator
+
+    def render_GET(self, request: Request) -> bytes | int:
+        request.setHeader(b"Content-Type", b"application/json")
+        try:
+            coro = self.view(request)
+        except BadRequest as e:
+            return error_as_bytes(request, 400, str(e))
+        d = defer.ensureDeferred(coro)
+        d.addCallback(dumps_as_bytes)
+        return finish_with(request, d)
+
+    async def view(self, request: Request) -> Any:
+        raise NotImplementedError
+
+
+class StatsResource(AggregatorResource):
+    def view(self, request: Request):
+        return self.aggregator.stats()
+
+
+class StatusResource(AggregatorResource):
+    def view(self, request: Request):
+        return self.aggregator.status()
+
+
+class TopResource(AggregatorResource):
+    def view(self, request: Request):
+        return self.aggregator.top(
+            by=get_arg(request, b"by", "error_rate"),
+            n=get_int_arg(request, b"n", 10, minimum=1),
+        )
+
+
+class SpidersResource(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, registry: SpiderRegistry):
+        super().__init__()
+        self.registry = registry
+
+    def render_GET(self, request: Request) -> bytes:
+        request.setHeader(b"Content-Type", b"application/json")
+        return dumps_as_bytes(list(self.registry.spiders.values()))
+
+
+class RegisterResource(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, registry: SpiderRegistry):
+        super().__init__()
+        self.registry = registry
+
+    def render_POST(self, request: Request) -> bytes:
+        """Accept a report or JSON list of reports, e.g. batched by relay"""
+        try:
+            reports = json.loads(request.content.read())
+        except ValueError:
+            return error_as_bytes(request, 400, "Body must be JSON")
+        batch = isinstance(reports, list)
+        if not batch:
+            reports = [reports]
+        if not all(isinstance(report, dict) for report in reports):
+            return error_as_bytes(request, 400, "Reports must be JSON objects")
+        address = request.getClientAddress().host
+        try:
+            ids = [self.registry.register(report, address) for report in reports]
+        except BadRequest as e:
+            return error_as_bytes(request, 400, str(e))
+        request.setHeader(b"Content-Type", b"application/json")
+        return dumps_as_bytes({"ids": ids} if batch else {"id": ids[0]})
+
+
+def build_resource(
+    aggregator: Aggregator, checker: CredentialsChecker | None = None
+) -> resource.Resource:
+    """Aggregator resources, behind ``checker`` if given, except for
+    ``/register`` spiders report to without credentials"""
+    root = resource.Resource()
+    root.putChild(b"spiders", SpidersResource(aggregator.registry))
+    root.putChild(b"stats", StatsResource(aggregator))
+    root.putChild(b"status", StatusResource(aggregator))
+    root.putChild(b"top", TopResource(aggregator))
+    if checker is not None:
+        root = AuthResource(root, checker)
+    root.putChild(b"register", RegisterResource(aggregator.registry))
+    return root
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m spider_info_webservice.aggregator", description=__doc__
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6023)
+    parser.add_argument(
+        "--user",
+        action="append",
+        default=[],
+        metavar="USER:PASSWORD",
+        help="protect aggregator with basic auth, could be repeated",
+    )
+    parser.add_argument(
+        "--spider-auth",
+        metavar="USER:PASSWORD",
+        help="credentials of spiders info services",
+    )
+    parser.add_argument("--spider-token", help="bearer token of spiders info services")
+    parser.add_argument(
+        "--spider-host",
+        action="append",
+        default=[],
+        metavar="HOST",
+        help="host name, address or network credentials are sent to besides "
+        "spiders reporting from their own address, could be repeated",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=100,
+        help="max requests to spiders in flight",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=5.0, help="spider request timeout, seconds"
+    )
+    parser.add_argument(
+        "--ttl",
+        type=float,
+        default=None,
+        help="forget spiders not reported for that many seconds",
+    )
+    parser.add_argument(
+        "--front-port",
+        type=int,
+        default=6024,
+        help="port of front listeners of spiders listening on Unix sockets, "
+        "0 to reject such spiders",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    from twisted.internet import reactor
+
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    headers = {}
+    if args.spider_auth:
+        credentials = base64.b64encode(args.spider_auth.encode())
+        headers[b"Authorization"] = [b"Basic " + credentials]
+    elif args.spider_token:
+        headers[b"Authorization"] = [b"Bearer " + args.spider_token.encode()]
+    client = HTTPClient(reactor, concurrency=args.concurrency, timeout=args.timeout)
+    registry = SpiderRegistry(
+        ttl=args.ttl,
+        front_port=args.front_port or None,
+        trusted_hosts=args.spider_host,
+    )
+    checker = None
+    if args.user:
+        checker = CredentialsChecker(dict(user.split(":", 1) for user in args.user))
+
+    if args.ttl:
+        task.LoopingCall(registry.expire).start(args.ttl / 2, now=False)
+    site = server.Site(build_resource(Aggregator(registry, client, headers), checker))
+    port = reactor.listenTCP(args.port, site, interface=args.host)
+    logger.info(f"Aggregator started on {args.host}:{port.getHost().port}")
+    reactor.addSystemEventTrigger("before", "shutdown", client.close)
+    reactor.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""Authentication of info service requests.
+
+Passwords in ``INFO_SERVICE_USERS`` could be plain (``bytes`` or ``str``)
+or hashed with ``hash_password``::
+
+    python -m spider_info_webservice.auth [pbkdf2_sha256|scrypt]
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import hashlib
+import hmac
+import math
+import os
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+from twisted.internet.defer import Deferred
+from twisted.web import resource
+from twisted.web.resource import getChildForRequest
+from twisted.web.server import NOT_DONE_YET
+
+from .utils import RateLimiter, client_key, error_as_bytes
+
+if TYPE_CHECKING:
+    from typing import Iterable
+
+    from twisted.python.failure import Failure
+    from twisted.web.http import Request
+
+
+PBKDF2_ITERATIONS = 600_000
+SCRYPT_PARAMS = {"n": 2**14, "r": 8, "p": 1}
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+def hash_password(password: str | bytes, method: str = "pbkdf2_sha256") -> str:
+    """Return hash to put in ``INFO_SERVICE_USERS`` instead of plain password"""
+    if isinstance(password, str):
+        password = password.encode()
+    salt = os.urandom(16)
+    if method == "pbkdf2_sha256":
+        digest = hashlib.pbkdf2_hmac("sha256", password, salt, PBKDF2_ITERATIONS)
+        return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64(salt)}${_b64(digest)}"
+    if method == "scrypt":
+        n, r, p = SCRYPT_PARAMS["n"], SCRYPT_PARAMS["r"], SCRYPT_PARAMS["p"]
+        digest = hashlib.scrypt(password, salt=salt, n=n, r=r, p=p)
+        return f"scrypt${n}${r}${p}${_b64(salt)}${_b64(digest)}"
+    raise ValueError(f"Unknown password hashing method {method!r}")
+
+
+def is_hashed(stored: str | bytes) -> bool:
+    """Whether stored value is a ``hash_password`` hash, slow to verify"""
+    return isinstance(stored, str) and stored.startswith(("pbkdf2_sha256$", "scrypt$"))
+
+
+def verify_password(password: bytes, stored: str | bytes) -> bool:
+    """Check password against plain or ``hash_password`` hashed stored value"""
+    if isinstance(stored, str):
+        if stored.startswith("pbkdf2_sha256$"):
+            _, iterations, salt, digest = stored.split("$")
+            computed = hashlib.pbkdf2_hmac(
+                "sha256", password, base64.b64decode(salt), int(iterations)
+            )
+            return hmac.compare_digest(computed, base64.b64decode(digest))
+        if stored.startswith("scrypt$"):
+            _, n, r, p, salt, digest = stored.split("$")
+            computed = hashlib.scrypt(
+                password, salt=base64.b64decode(salt), n=int(n), r=int(r), p=int(p)
+            )
+            return hmac.compare_digest(computed, base64.b64decode(digest))
+        stored = stored.encode()
+    return hmac.compare_digest(password, stored)
+
+
+class CredentialsChecker:
+    """Checks ``Authorization`` header values.
+
+    ``Basic`` credentials are checked against ``users`` and ``Bearer`` tokens
+    against ``tokens`` (plain or ``sha256$<hexdigest>``). Digests of accepted
+    and rejected headers are kept in LRU caches of ``cache_size``, so a password
+    hash is verified once per header, not once per request.
+
+    Verifying a password hash takes tenths of a second, ``lookup`` tells
+    whether it's needed and ``verify`` does it in a thread. Every client could
+    have hashes verified ``verify_rate`` times per second on average, up to
+    ``verify_burst`` at once (``verify_limiter``).
+    """
+
+    def __init__(
+        self,
+        users: dict[str, bytes | str],
+        tokens: Iterable[str] | None = None,
+        cache_size: int = 128,
+        verify_rate: float = 1.0,
+        verify_burst: int = 5,
+    ):
+        self.users = users
+        self.plain_tokens = set()
+        self.hashed_tokens = set()
+        for token in tokens or ():
+            if token.startswith("sha256$"):
+                self.hashed_tokens.add(token[len("sha256$") :].lower())
+            else:
+                self.plain_tokens.add(token.encode())
+        self.cache_size = cache_size
+        self.cache: OrderedDict[bytes, None] = OrderedDict()
+        self.rejected: OrderedDict[bytes, None] = OrderedDict()
+        # header digest -> Deferreds of requests waiting for its verification
+        self.pending: dict[bytes, list[Deferred]] = {}
+        self.verify_limiter = RateLimiter(verify_rate, verify_burst)
+
+    @property
+    def schemes(self) -> list[bytes]:
+        schemes = [b"Basic"]
+        if self.plain_tokens or self.hashed_tokens:
+            schemes.append(b"Bearer")
+        return schemes
+
+    def lookup(self, authorization: bytes | None) -> bool | None:
+        """Whether header is valid, if it's known without verifying password
+        hash, ``None`` otherwise"""
+        if not authorization:
+            return False
+        key = hashlib.sha256(authorization).digest()
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return True
+        if key in self.rejected:
+            self.rejected.move_to_end(key)
+            return False
+
+        scheme, _, credentials = authorization.partition(b" ")
+        scheme = scheme.lower()
+        if scheme == b"basic":
+            stored = self.stored_password(credentials.strip())
+            if stored is not None and is_hashed(stored[1]):
+                return None
+            valid = stored is not None and verify_password(*stored)
+        elif scheme == b"bearer":
+            valid = self.check_token(credentials.strip())
+        else:
+            return False
+        return self.remember(key, valid)
+
+    def verify(self, authorization: bytes) -> Deferred:
+        """Whether header ``lookup`` couldn't tell about is valid, password
+        hash is verified in a thread, once for concurrent requests with it"""
+        from twisted.internet.threads import deferToThread
+
+        key = hashlib.sha256(authorization).digest()
+        d = Deferred()
+        waiting = self.pending.get(key)
+        if waiting is not None:
+            waiting.append(d)
+            return d
+        self.pending[key] = [d]
+
+        def verified(valid: bool) -> None:
+            self.remember(key, valid)
+            for d in self.pending.pop(key, ()):
+                d.callback(valid)
+
+        def failed(failure: Failure) -> None:
+            for d in self.pending.pop(key, ()):
+                d.errback(failure)
+
+        deferToThread(self.check_header, authorization).addCallbacks(verified, failed)
+        return d
+
+    def remember(self, key: bytes, valid: bool) -> bool:
+        if self.cache_size:
+            cache = self.cache if valid else self.rejected
+            cache[key] = None
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return valid
+
+    def check_header(self, authorization: bytes) -> bool:
+        scheme, _, credentials = authorization.partition(b" ")
+        scheme = scheme.lower()
+        if scheme == b"basic":
+            return self.check_basic(credentials.strip())
+        if scheme == b"bearer":
+            return self.check_token(credentials.strip())
+        return False
+
+    def stored_password(self, credentials: bytes) -> tuple[bytes, str | bytes] | None:
+        """Password of ``Basic`` credentials and stored value to check it against"""
+        try:
+            username, _, password = base64.b64decode(credentials).partition(b":")
+            username = username.decode()
+        except (binascii.Error, UnicodeDecodeError):
+            return None
+        stored = self.users.get(username)
+        if stored is None:
+            return None
+        return password, stored
+
+    def check_basic(self, credentials: bytes) -> bool:
+        stored = self.stored_password(credentials)
+        if stored is None:
+            return False
+        try:
+            return verify_password(*stored)
+        except ValueError:
+            return False
+
+    def check_token(self, token: bytes) -> bool:
+        if any(hmac.compare_digest(token, plain) for plain in self.plain_tokens):
+            return True
+        digest = hashlib.sha256(token).hexdigest()
+        return any(hmac.compare_digest(digest, hashed) for hashed in self.hashed_tokens)
+
+
+class UnauthorizedResource(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, schemes: list[bytes], realm: bytes = b"auth"):
+        super().__init__()
+        self.challenges = [b'%s realm="%s"' % (scheme, realm) for scheme in schemes]
+
+    def render(self, request: Request) -> bytes:
+        request.setResponseCode(401)
+        request.responseHeaders.setRawHeaders(b"www-authenticate", self.challenges)
+        if request.method == b"HEAD":
+            return b""
+        return b"Unauthorized"
+
+
+class AuthResource(resource.Resource):
+    """Lets through only requests ``checker`` accepts, replaces twisted's
+    ``guard.HTTPAuthSessionWrapper`` with its portal, realm and credential
+    factories roundtrip on every request. Children put on it directly are
+    public."""
+
+    def __init__(self, wrapped: resource.Resource, checker: CredentialsChecker):
+        super().__init__()
+        self.wrapped = wrapped
+        self.checker = checker
+        self.unauthorized = UnauthorizedResource(checker.schemes)
+
+    def getChildWithDefault(self, path: bytes, request: Request) -> resource.Resource:
+        if path in self.children:
+            return self.children[path]
+        valid = self.checker.lookup(request.getHeader(b"authorization"))
+        if valid is None:
+            return VerifyingResource(self, path)
+        if not valid:
+            return self.unauthorized
+        return self.wrapped.getChildWithDefault(path, request)
+
+    def render(self, request: Request) -> bytes | int:
+        valid = self.checker.lookup(request.getHeader(b"authorization"))
+        if valid is None:
+            return VerifyingResource(self).render(request)
+        if not valid:
+            return self.unauthorized.render(request)
+        return self.wrapped.render(request)
+
+
+class VerifyingResource(resource.Resource):
+    """Verifies password hash off the reactor thread, then renders the
+    resource ``path`` of ``auth`` leads to, or ``auth`` itself"""
+
+    isLeaf = True
+
+    def __init__(self, auth: AuthResource, path: bytes | None = None):
+        super().__init__()
+        self.auth = auth
+        self.path = path
+
+    def render(self, request: Request) -> bytes | int:
+        checker = self.auth.checker
+        retry_after = checker.verify_limiter.acquire(client_key(request))
+        if retry_after:
+            request.setHeader(b"Retry-After", str(math.ceil(retry_after)).encode())
+            return error_as_bytes(request, 429, "Too many authentication attempts")
+
+        disconnected = []
+        request.notifyFinish().addErrback(disconnected.append)
+
+        def verified(valid: bool) -> None:
+            if disconnected:
+                return
+            if not valid:
+                target = self.auth.unauthorized
+            elif self.path is None:
+                target = self.auth.wrapped
+            else:
+                target = getChildForRequest(
+                    self.auth.wrapped.getChildWithDefault(self.path, request), request
+                )
+            request.render(target)
+
+        d = checker.verify(request.getHeader(b"authorization"))
+        d.addCallback(verified)
+        d.addErrback(lambda failure: disconnected or request.processingFailed(failure))
+        return NOT_DONE_YET
+
+
+if __name__ == "__main__":
+    import getpass
+    import sys
+
+    print(hash_password(getpass.getpass(), *sys.argv[1:2]))
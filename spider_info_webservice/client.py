@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import json
+import random
+from io import BytesIO
+from typing import TYPE_CHECKING
+
+from twisted.internet import defer, task
+from twisted.web.client import Agent, FileBodyProducer, HTTPConnectionPool, readBody
+from twisted.web.http_headers import Headers
+
+if TYPE_CHECKING:
+    from typing import Any
+
+    from twisted.internet.defer import Deferred
+
+
+class HTTPError(Exception):
+    def __init__(self, url: str, code: int, body: bytes):
+        super().__init__(f"{url} responded with {code}")
+        self.url = url
+        self.code = code
+        self.body = body
+
+
+class HTTPClient:
+    """Small reactor-native HTTP client.
+
+    Connections are kept alive in a shared pool, at most ``concurrency``
+    requests are in flight at once and every request is cancelled after
+    ``timeout`` seconds. Failed requests and 429 or 5xx responses are retried
+    up to ``retries`` times after random delay of up to ``backoff * 2 ** attempt``
+    seconds. Methods return Deferreds.
+    """
+
+    def __init__(
+        self,
+        reactor=None,
+        concurrency: int = 50,
+        timeout: float = 5.0,
+        max_persistent_per_host: int = 2,
+        headers: dict[bytes, list[bytes]] | None = None,
+        retries: int = 0,
+        backoff: float = 0.5,
+    ):
+        if reactor is None:
+            from twisted.internet import reactor
+        self.reactor = reactor
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.headers = headers or {}
+        self.pool = HTTPConnectionPool(reactor, persistent=True)
+        self.pool.maxPersistentPerHost = max_persistent_per_host
+        self.agent = Agent(reactor, connectTimeout=timeout, pool=self.pool)
+        self.semaphore = defer.DeferredSemaphore(concurrency)
+
+    def request(
+        self,
+        method: bytes,
+        url: str,
+        body: bytes | None = None,
+        headers: dict[bytes, list[bytes]] | None = None,
+    ) -> Deferred:
+        """Fire with ``(code, body)`` of the response"""
+        return defer.ensureDeferred(self._retrying(method, url, body, headers))
+
+    async def _retrying(
+        self,
+        method: bytes,
+        url: str,
+        body: bytes | None,
+        headers: dict[bytes, list[bytes]] | None,
+    ) -> tuple[int, bytes]:
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                result = await self.semaphore.run(
+                    self._request, method, url, body, headers
+                )
+            except Exception:
+                if last:
+                    raise
+            else:
+                if last or not (result[0] == 429 or result[0] >= 500):
+                    return result
+            delay = random.uniform(0, self.backoff * 2**attempt)
+            await task.deferLater(self.reactor, delay, lambda: None)
+
+    def _request(
+        self,
+        method: bytes,
+        url: str,
+        body: bytes | None,
+        headers: dict[bytes, list[bytes]] | None,
+    ) -> Deferred:
+        producer = FileBodyProducer(BytesIO(body)) if body is not None else None
+        d = self.agent.request(
+            method, url.encode(), Headers({**self.headers, **(headers or {})}), producer
+        )
+        d.addCallback(
+            lambda response: readBody(response).addCallback(
+                lambda content: (response.code, content)
+            )
+        )
+        d.addTimeout(self.timeout, self.reactor)
+        return d
+
+    def get_json(
+        self, url: str, headers: dict[bytes, list[bytes]] | None = None
+    ) -> Deferred:
+        """Fire with decoded JSON body, fail with ``HTTPError`` on non 2xx response"""
+        d = self.request(b"GET", url, headers=headers)
+        d.addCallback(self._decode_json, url)
+        return d
+
+    def post_json(self, url: str, data: Any) -> Deferred:
+        d = self.request(
+            b"POST",
+            url,
+            json.dumps(data, default=str).encode(),
+            {b"Content-Type": [b"application/json"]},
+        )
+        d.addCallback(self._check_code, url)
+        return d
+
+    @staticmethod
+    def _check_code(result: tuple[int, bytes], url: str) -> bytes:
+        code, content = result
+        if not 200 <= code < 300:
+            raise HTTPError(url, code, content)
+        return content
+
+    def _decode_json(self, result: tuple[int, bytes], url: str) -> Any:
+        return json.loads(self._check_code(result, url))
+
+    def close(self) -> Deferred:
+        return self.pool.closeCachedConnections()
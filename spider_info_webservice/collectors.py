@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+import math
+from array import array
+from collections import OrderedDict
+from collections.abc import Mapping
+from copy import copy
+from time import time
+from typing import TYPE_CHECKING
+from weakref import WeakKeyDictionary
+
+from scrapy.utils.httpobj import urlparse_cached
+
+if TYPE_CHECKING:
+    from typing import Any, Callable, Iterable
+
+    from scrapy import Request, Spider
+    from scrapy.core.engine import ExecutionEngine
+    from scrapy.http import Response
+
+
+# the same expressions scrapy.utils.engine.get_engine_status evaluates
+ENGINE_STATUS_EXPRESSIONS = (
+    "time()-engine.start_time",
+    "len(engine.downloader.active)",
+    "engine.scraper.is_idle()",
+    "engine.spider.name",
+    "engine.spider_is_idle()",
+    "engine.slot.closing",
+    "len(engine.slot.inprogress)",
+    "len(engine.slot.scheduler.dqs or [])",
+    "len(engine.slot.scheduler.mqs)",
+    "len(engine.scraper.slot.queue)",
+    "len(engine.scraper.slot.active)",
+    "engine.scraper.slot.active_size",
+    "engine.scraper.slot.itemproc_size",
+    "engine.scraper.slot.needs_backout()",
+)
+
+
+def compile_expression(expression: str) -> Callable[[ExecutionEngine], Any]:
+    """Compile engine status expression into function of ``engine``, once"""
+    code = compile(
+        f"lambda engine: ({expression})", f"<engine status {expression!r}>", "eval"
+    )
+    return eval(code, {"time": time})
+
+
+class EngineStatusCollector:
+    """Collects the same status as ``scrapy.utils.engine.get_engine_status``,
+    but expressions are compiled once, not ``eval``-ed from strings on every
+    call, and only requested ``fields`` are evaluated.
+
+    ``extra`` expressions are added to the default ones, given as list of
+    expressions or as dict of names to report them under and expressions.
+    They could use ``engine`` and ``time``.
+    """
+
+    def __init__(
+        self,
+        engine: ExecutionEngine,
+        extra: Iterable[str] | dict[str, str] | None = None,
+    ):
+        self.engine = engine
+        expressions = {
+            expression: expression for expression in ENGINE_STATUS_EXPRESSIONS
+        }
+        if isinstance(extra, Mapping):
+            expressions.update(extra)
+        else:
+            expressions.update((expression, expression) for expression in extra or ())
+        self.getters: dict[str, Callable[[ExecutionEngine], Any]] = {
+            name: compile_expression(expression)
+            for name, expression in expressions.items()
+        }
+
+    @property
+    def fields(self) -> list[str]:
+        return list(self.getters)
+
+    def subset(self, fields: Iterable[str]) -> EngineStatusCollector:
+        """Collector of only ``fields``, to not filter them on every call"""
+        collector = copy(self)
+        collector.getters = {
+            name: self.getters[name] for name in fields if name in self.getters
+        }
+        return collector
+
+    def collect(self, fields: Iterable[str] | None = None) -> dict[str, Any]:
+        """Status of ``fields`` (all by default), unknown fields are skipped"""
+        engine = self.engine
+        getters = self.getters
+        if fields is not None:
+            getters = {name: getters[name] for name in fields if name in getters}
+        status = {}
+        for name, getter in getters.items():
+            try:
+                status[name] = getter(engine)
+            except Exception as e:
+                status[name] = f"{type(e).__name__} (exception)"
+        return status
+
+    def __call__(self) -> list[tuple[str, Any]]:
+        """List of ``(field, value)``, like ``get_engine_status`` returns"""
+        return list(self.collect().items())
+
+
+class RequestAgeTracker:
+    """Remembers when requests reached the downloader, so age of requests
+    in progress is known. Requests are referenced weakly, entries go away
+    with them."""
+
+    def __init__(self):
+        self.started: WeakKeyDictionary[Request, float] = WeakKeyDictionary()
+
+    def request_reached_downloader(self, request: Request, spider: Spider) -> None:
+        self.started[request] = time()
+
+
+class SchedulerCounters:
+    """Requests scheduled and dropped by the scheduler, by domain and depth.
+
+    Kept up to date from signals, so they are known for queues that can't be
+    iterated cheaply (disk queues). They count requests that entered the
+    scheduler, not requests still in it. At most ``max_domains`` domains are
+    counted separately, the rest are counted under ``"<other>"``.
+    """
+
+    def __init__(self, max_domains: int = 10_000):
+        self.max_domains = max_domains
+        self.scheduled = 0
+        self.dropped = 0
+        self.domains: dict[str, int] = {}
+        self.depths: dict[int, int] = {}
+
+    def _count(self, request: Request, n: int) -> None:
+        domain = urlparse_cached(request).hostname or ""
+        if domain not in self.domains and len(self.domains) >= self.max_domains:
+            domain = "<other>"
+        self.domains[domain] = self.domains.get(domain, 0) + n
+        depth = request.meta.get("depth", 0)
+        self.depths[depth] = self.depths.get(depth, 0) + n
+
+    def request_scheduled(self, request: Request, spider: Spider) -> None:
+        self.scheduled += 1
+        self._count(request, 1)
+
+    def request_dropped(self, request: Request, spider: Spider) -> None:
+        self.dropped += 1
+        self._count(request, -1)
+
+
+class LogHistogram:
+    """Array backed histogram with log-linear buckets, HDR histogram style.
+
+    Every power of two between ``2**(min_exp - 1)`` and ``2**max_exp`` (both
+    ends included) is split into ``sub_buckets`` buckets, so values are kept with relative error of
+    at most ``1 / sub_buckets``, values out of range go to the first or the
+    last bucket.
+    """
+
+    __slots__ = ("min_exp", "sub_buckets", "counts", "count", "sum", "max")
+
+    def __init__(self, min_exp: int, max_exp: int, sub_buckets: int = 8):
+        self.min_exp = min_exp
+        self.sub_buckets = sub_buckets
+        # frexp exponent of values below 2**max_exp is at most max_exp
+        self.counts = array("I", [0]) * ((max_exp - min_exp + 1) * sub_buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, value: float) -> None:
+        if value > 0:
+            mantissa, exp = math.frexp(value)
+            i = (exp - self.min_exp) * self.sub_buckets + int(
+                (mantissa - 0.5) * 2 * self.sub_buckets
+            )
+            i = min(max(i, 0), len(self.counts) - 1)
+        else:
+            i = 0
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def upper_bound(self, i: int) -> float:
+        exp, sub = divmod(i, self.sub_buckets)
+        return math.ldexp(0.5 + (sub + 1) / (2 * self.sub_buckets), exp + self.min_exp)
+
+    def percentile(self, p: float) -> float | None:
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(p / 100 * self.count))
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(self.upper_bound(i), self.max)
+        return self.max
+
+    def copy(self) -> LogHistogram:
+        histogram = copy(self)
+        histogram.counts = array("I", self.counts)
+        return histogram
+
+    def summary(self, ps: Iterable[float]) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else None,
+            "max": self.max if self.count else None,
+            **{f"p{p:g}": self.percentile(p) for p in ps},
+        }
+
+
+class DomainLatency:
+    """Download latency and response size histograms and counters of a domain"""
+
+    __slots__ = (
+        "latency",
+        "size",
+        "responses",
+        "items",
+        "dropped",
+        "first_seen",
+        "last_seen",
+    )
+
+    def __init__(self):
+        # 2**-14 s (61 us) .. 2**11 s
+        self.latency = LogHistogram(-13, 11)
+        # 1 byte .. 2**34 bytes
+        self.size = LogHistogram(1, 34)
+        self.responses = 0
+        self.items = 0
+        self.dropped = 0
+        self.first_seen = self.last_seen = time()
+
+    def copy(self) -> DomainLatency:
+        domain = copy(self)
+        domain.latency = self.latency.copy()
+        domain.size = self.size.copy()
+        return domain
+
+    def summary(self, ps: Iterable[float]) -> dict[str, Any]:
+        elapsed = self.last_seen - self.first_seen
+        return {
+            "responses": self.responses,
+            "items": self.items,
+            "dropped": self.dropped,
+            "bytes": self.size.sum,
+            "responses_per_second": self.responses / elapsed if elapsed else None,
+            "latency": self.latency.summary(ps),
+            "size": self.size.summary(ps),
+        }
+
+
+class LatencyCollector:
+    """Download latency and response size histograms by domain, kept from
+    ``response_received``, ``item_scraped`` and ``request_dropped`` signals.
+
+    At most ``max_domains`` domains are kept, the least recently seen ones
+    are evicted (``total`` still counts them).
+    """
+
+    def __init__(self, max_domains: int = 1000):
+        self.max_domains = max_domains
+        self.domains: OrderedDict[str, DomainLatency] = OrderedDict()
+        self.total = DomainLatency()
+        self.evicted = 0
+
+    def domain(self, domain: str) -> DomainLatency:
+        entry = self.domains.get(domain)
+        if entry is None:
+            entry = self.domains[domain] = DomainLatency()
+            if len(self.domains) > self.max_domains:
+                self.domains.popitem(last=False)
+                self.evicted += 1
+        else:
+            self.domains.move_to_end(domain)
+        return entry
+
+    @staticmethod
+    def domain_of(request: Request) -> str:
+        return (
+            request.meta.get("download_slot") or urlparse_cached(request).hostname or ""
+        )
+
+    def response_received(
+        self, response: Response, request: Request, spider: Spider
+    ) -> None:
+        latency = request.meta.get("download_latency")
+        size = len(response.body)
+        now = time()
+        for entry in (self.total, self.domain(self.domain_of(request))):
+            entry.responses += 1
+            entry.last_seen = now
+            if latency is not None:
+                entry.latency.record(latency)
+            entry.size.record(size)
+
+    def item_scraped(self, item: Any, response: Response, spider: Spider) -> None:
+        self.total.items += 1
+        request = response.request
+        domain = (
+            self.domain_of(request)
+            if request is not None
+            else urlparse_cached(response).hostname or ""
+        )
+        self.domain(domain).items += 1
+
+    def request_dropped(self, request: Request, spider: Spider) -> None:
+        self.total.dropped += 1
+        self.domain(self.domain_of(request)).dropped += 1
@@ -0,0 +1,165 @@
+"""Per-host front listener for spiders listening on Unix sockets.
+
+Spiders with ``INFO_SERVICE_SOCKET_DIR`` listen on ``<dir>/<spider id>.sock``
+instead of a TCP port, the front routes ``/spiders/<spider id>/info/...``
+to them, run it with::
+
+    python -m spider_info_webservice.front --socket-dir /run/scrapy-info --port 6024
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+from typing import TYPE_CHECKING
+from urllib.parse import quote, urlparse
+
+from twisted.web import proxy, resource, server
+
+from .utils import dumps_as_bytes, error_as_bytes
+
+if TYPE_CHECKING:
+    from twisted.web.http import Request
+
+logger = logging.getLogger(__name__)
+
+SOCKET_SUFFIX = ".sock"
+
+
+class UnixSocketProxyResource(resource.Resource):
+    """Proxies request to HTTP server listening on Unix socket ``socket_path``.
+    Like twisted's ``ReverseProxyResource``, connection is opened per request,
+    response is streamed back as it arrives."""
+
+    def __init__(
+        self, socket_path: str, path: bytes = b"", reactor=None, timeout: float = 5.0
+    ):
+        super().__init__()
+        if reactor is None:
+            from twisted.internet import reactor
+        self.socket_path = socket_path
+        self.path = path
+        self.reactor = reactor
+        self.timeout = timeout
+
+    def getChild(self, path: bytes, request: Request) -> UnixSocketProxyResource:
+        return UnixSocketProxyResource(
+            self.socket_path,
+            self.path + b"/" + quote(path, safe="").encode(),
+            self.reactor,
+            self.timeout,
+        )
+
+    def render(self, request: Request) -> int:
+        request.requestHeaders.setRawHeaders(b"host", [b"localhost"])
+        # spider limits requests per client by it, client's own value is replaced
+        client = getattr(request.getClientAddress(), "host", None) or "unknown"
+        request.requestHeaders.setRawHeaders(b"x-forwarded-for", [client.encode()])
+        request.content.seek(0, 0)
+        query = urlparse(request.uri)[4]
+        rest = (self.path or b"/") + (b"?" + query if query else b"")
+        factory = proxy.ProxyClientFactory(
+            request.method,
+            rest,
+            request.clientproto,
+            request.getAllHeaders(),
+            request.content.read(),
+            request,
+        )
+        self.reactor.connectUNIX(self.socket_path, factory, timeout=self.timeout)
+        return server.NOT_DONE_YET
+
+
+class SpidersResource(resource.Resource):
+    """Lists spiders by their sockets in ``socket_dir``, routes to them"""
+
+    def __init__(self, socket_dir: str, reactor=None, timeout: float = 5.0):
+        super().__init__()
+        self.socket_dir = socket_dir
+        self.reactor = reactor
+        self.timeout = timeout
+
+    def spider_ids(self) -> list[str]:
+        try:
+            names = os.listdir(self.socket_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(
+            name[: -len(SOCKET_SUFFIX)]
+            for name in names
+            if name.endswith(SOCKET_SUFFIX)
+        )
+
+    def socket_path(self, spider_id: str) -> str | None:
+        """Socket of spider listed in ``socket_dir``, ``None`` for anything else,
+        e.g. ids with separators, which would lead out of the directory"""
+        if spider_id not in self.spider_ids():
+            return None
+        socket_path = os.path.join(self.socket_dir, spider_id + SOCKET_SUFFIX)
+        if os.path.dirname(os.path.realpath(socket_path)) != os.path.realpath(
+            self.socket_dir
+        ):
+            return None
+        return socket_path
+
+    def getChild(self, path: bytes, request: Request) -> resource.Resource:
+        if path == b"":
+            return self
+        spider_id = path.decode(errors="replace")
+        socket_path = self.socket_path(spider_id)
+        if socket_path is None:
+            return resource.NoResource(f"No spider {spider_id!r}")
+        return UnixSocketProxyResource(
+            socket_path, reactor=self.reactor, timeout=self.timeout
+        )
+
+    def render_GET(self, request: Request) -> bytes:
+        request.setHeader(b"Content-Type", b"application/json")
+        return dumps_as_bytes(self.spider_ids())
+
+
+class FrontRootResource(resource.Resource):
+    def render_GET(self, request: Request) -> bytes:
+        return error_as_bytes(request, 404, "See /spiders")
+
+
+def build_resource(
+    socket_dir: str, reactor=None, timeout: float = 5.0
+) -> resource.Resource:
+    root = FrontRootResource()
+    root.putChild(b"spiders", SpidersResource(socket_dir, reactor, timeout))
+    return root
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m spider_info_webservice.front", description=__doc__
+    )
+    parser.add_argument(
+        "--socket-dir", required=True, help="INFO_SERVICE_SOCKET_DIR of spiders"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6024)
+    parser.add_argument(
+        "--timeout", type=float, default=5.0, help="seconds to connect to spider"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    from twisted.internet import reactor
+
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    site = server.Site(build_resource(args.socket_dir, reactor, args.timeout))
+    port = reactor.listenTCP(args.port, site, interface=args.host)
+    logger.info(
+        f"Front started on {args.host}:{port.getHost().port} for {args.socket_dir}"
+    )
+    reactor.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import math
+from array import array
+from numbers import Real
+from time import time
+from typing import TYPE_CHECKING
+
+from twisted.internet import task
+
+if TYPE_CHECKING:
+    from typing import Any, Iterable
+
+    from scrapy.statscollectors import StatsCollector
+
+
+NAN = float("nan")
+
+
+class StatsHistory:
+    """Fixed size ring buffer of numeric stats samples.
+
+    Every sampled key gets its own ``array("d")`` column of ``size`` floats,
+    so memory is bounded by ``size * (max_keys + 1) * 8`` bytes. Keys that
+    appear after ``max_keys`` columns are taken are not recorded.
+    """
+
+    def __init__(self, stats: StatsCollector, size: int = 360, max_keys: int = 256):
+        self.stats = stats
+        self.size = size
+        self.max_keys = max_keys
+        self.timestamps = array("d", [NAN]) * size
+        self.columns: dict[str, array] = {}
+        self.position = 0  # index next sample is written at
+        self.count = 0
+        self.interval: float | None = None
+        self._loop: task.LoopingCall | None = None
+
+    def start(self, interval: float) -> None:
+        self.interval = interval
+        self._loop = task.LoopingCall(self.sample)
+        self._loop.start(interval, now=True)
+
+    def stop(self) -> None:
+        if self._loop is not None and self._loop.running:
+            self._loop.stop()
+
+    def sample(self, now: float | None = None) -> None:
+        i = self.position
+        self.timestamps[i] = time() if now is None else now
+        stats = self.stats.get_stats()
+        for key, column in self.columns.items():
+            if key not in stats:
+                column[i] = NAN
+        for key, value in stats.items():
+            if not isinstance(value, Real) or isinstance(value, bool):
+                continue
+            column = self.columns.get(key)
+            if column is None:
+                if len(self.columns) >= self.max_keys:
+                    continue
+                column = self.columns[key] = array("d", [NAN]) * self.size
+            column[i] = value
+        self.position = (i + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def _ordered(self, column: array, last: int | None) -> array:
+        """Column values from the oldest to the newest sample"""
+        if self.count < self.size:
+            values = column[: self.count]
+        else:
+            values = column[self.position :] + column[: self.position]
+        if last is not None:
+            values = values[-last:] if last else values[:0]
+        return values
+
+    def series(
+        self, keys: list[str] | None = None, last: int | None = None
+    ) -> tuple[array, dict[str, array]]:
+        if keys is None:
+            keys = list(self.columns)
+        return self._ordered(self.timestamps, last), {
+            key: self._ordered(self.columns[key], last)
+            for key in keys
+            if key in self.columns
+        }
+
+
+def rates(timestamps: array, values: array) -> list[float]:
+    """Per second change between adjacent samples, ``len(values) - 1`` items"""
+    return [
+        (v1 - v0) / (t1 - t0) if t1 > t0 else NAN
+        for t0, t1, v0, v1 in zip(timestamps, timestamps[1:], values, values[1:])
+    ]
+
+
+def moving_average(values: list[float] | array, window: int) -> list[float]:
+    """Trailing moving average, NaNs are skipped"""
+    averages = []
+    total, count = 0.0, 0
+    for i, value in enumerate(values):
+        if not math.isnan(value):
+            total += value
+            count += 1
+        if i >= window:
+            old = values[i - window]
+            if not math.isnan(old):
+                total -= old
+                count -= 1
+        averages.append(total / count if count else NAN)
+    return averages
+
+
+def nan_to_none(values: Any) -> list[float | None]:
+    return [None if math.isnan(value) else value for value in values]
+
+
+def percentiles(values: list[float], ps: Iterable[float]) -> dict[str, float]:
+    """Nearest-rank percentiles of sorted ``values``, e.g. ``{"p50": ..., "p99": ...}``"""
+    n = len(values)
+    return {
+        f"p{p:g}": values[min(n - 1, max(0, math.ceil(p / 100 * n) - 1))] for p in ps
+    }
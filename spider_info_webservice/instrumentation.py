@@ -0,0 +1,133 @@
+"""Counts and timings of requests served by the service itself.
+
+Every ``Resource`` render is timed on the reactor thread, serialisation of
+``JsonResource`` bodies is timed wherever it runs. Timings go to histograms
+with fixed buckets, so recording is a ``bisect`` and two increments.
+"""
+
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left
+from typing import TYPE_CHECKING
+
+from twisted.web.server import NOT_DONE_YET
+
+if TYPE_CHECKING:
+    from typing import Any
+
+    from twisted.web.http import Request
+
+
+# upper bounds of buckets in seconds, the last bucket has no bound
+BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+)
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = array("Q", [0]) * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"count": self.count, "sum": self.sum, "buckets": list(self.counts)}
+
+
+class ResourceStats:
+    """Requests, errors (responses with status >= 400), bytes out, render
+    and serialisation time of one resource"""
+
+    __slots__ = ("requests", "errors", "bytes_out", "offloaded", "render", "serialise")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.bytes_out = 0
+        self.offloaded = 0
+        self.render = Histogram()
+        self.serialise = Histogram()
+
+    def record_render(
+        self, request: Request, body: bytes | int, seconds: float
+    ) -> None:
+        self.requests += 1
+        self.render.observe(seconds)
+        if body is NOT_DONE_YET:
+            # body is written later, count it when the response is finished
+            request.notifyFinish().addBoth(lambda _: self._record_response(request))
+        else:
+            self._record_response(request, len(body))
+
+    def _record_response(self, request: Request, length: int | None = None) -> None:
+        self.bytes_out += request.sentLength if length is None else length
+        if request.code >= 400:
+            self.errors += 1
+
+    def record_serialise(self, seconds: float, offloaded: bool) -> None:
+        self.serialise.observe(seconds)
+        if offloaded:
+            self.offloaded += 1
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "bytes_out": self.bytes_out,
+            "offloaded": self.offloaded,
+            "render": self.render.to_dict(),
+            "serialise": self.serialise.to_dict(),
+        }
+
+
+class Instrumentation:
+    """``ResourceStats`` of all resources by their names"""
+
+    def __init__(self):
+        self.resources: dict[str, ResourceStats] = {}
+        # requests rejected by RootResource's rate limiter
+        self.rate_limited = 0
+
+    def resource(self, name: str) -> ResourceStats:
+        stats = self.resources.get(name)
+        if stats is None:
+            stats = self.resources[name] = ResourceStats()
+        return stats
+
+    def to_dict(self) -> dict[str, Any]:
+        resources = {name: stats.to_dict() for name, stats in self.resources.items()}
+        return {
+            "buckets": [*BUCKETS, None],
+            "total": {
+                "requests": sum(stats.requests for stats in self.resources.values()),
+                "bytes_out": sum(stats.bytes_out for stats in self.resources.values()),
+                "render_seconds": sum(
+                    stats.render.sum for stats in self.resources.values()
+                ),
+                "serialise_seconds": sum(
+                    stats.serialise.sum for stats in self.resources.values()
+                ),
+                "rate_limited": self.rate_limited,
+            },
+            "resources": resources,
+        }
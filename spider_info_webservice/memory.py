@@ -0,0 +1,156 @@
+"""Memory usage of the process: RSS, gc, objects tracked by scrapy's trackref
+and tracemalloc snapshots."""
+
+from __future__ import annotations
+
+import gc
+import os
+import sys
+import tracemalloc
+from collections import OrderedDict
+from time import time
+from typing import TYPE_CHECKING
+
+from scrapy.utils import trackref
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore
+
+if TYPE_CHECKING:
+    from typing import Any
+
+GROUP_BY = ("lineno", "filename", "traceback")
+# allocations of tracemalloc and import machinery itself aren't interesting
+FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def rss() -> int | None:
+    """Current resident set size in bytes, ``None`` if it's unknown"""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def max_rss() -> int | None:
+    """Peak resident set size in bytes"""
+    if resource is None:
+        return None
+    size = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return size if sys.platform == "darwin" else size * 1024
+
+
+def gc_info() -> dict[str, Any]:
+    stats = gc.get_stats()
+    return {
+        "enabled": gc.isenabled(),
+        "counts": gc.get_count(),
+        "thresholds": gc.get_threshold(),
+        "collections": [generation["collections"] for generation in stats],
+        "collected": [generation["collected"] for generation in stats],
+        "uncollectable": [generation["uncollectable"] for generation in stats],
+        "garbage": len(gc.garbage),
+    }
+
+
+def live_refs() -> dict[str, dict[str, Any]]:
+    """Number and age of oldest of live objects of classes scrapy tracks
+    (requests, responses, items, selectors, spiders), most numerous first"""
+    now = time()
+    refs = {
+        cls.__name__: {"count": len(objects), "oldest": now - min(objects.values())}
+        for cls, objects in list(trackref.live_refs.items())
+        if objects
+    }
+    return dict(sorted(refs.items(), key=lambda item: -item[1]["count"]))
+
+
+def tracemalloc_info() -> dict[str, Any]:
+    if not tracemalloc.is_tracing():
+        return {"tracing": False}
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "tracing": True,
+        "frames": tracemalloc.get_traceback_limit(),
+        "traced": current,
+        "peak": peak,
+        "overhead": tracemalloc.get_tracemalloc_memory(),
+    }
+
+
+def statistic_to_dict(statistic: Any, group_by: str) -> dict[str, Any]:
+    """``tracemalloc.Statistic`` or ``StatisticDiff`` as dict"""
+    frame = statistic.traceback[0]
+    result = {"file": frame.filename}
+    if group_by != "filename":
+        result["line"] = frame.lineno
+    if group_by == "traceback":
+        result["traceback"] = [
+            f"{frame.filename}:{frame.lineno}" for frame in statistic.traceback
+        ]
+    result["size"] = statistic.size
+    result["count"] = statistic.count
+    if hasattr(statistic, "size_diff"):
+        result["size_diff"] = statistic.size_diff
+        result["count_diff"] = statistic.count_diff
+    return result
+
+
+class TracemallocSnapshots:
+    """Kept ``tracemalloc`` snapshots by id, at most ``max_snapshots`` latest.
+
+    Taking and comparing snapshots (``analyse``) is slow and is meant to be
+    run in a thread, snapshots are kept and dropped on the reactor thread.
+    """
+
+    def __init__(self, max_snapshots: int = 3):
+        self.max_snapshots = max_snapshots
+        # id -> (time taken, snapshot)
+        self.snapshots: OrderedDict[int, tuple[float, tracemalloc.Snapshot]] = (
+            OrderedDict()
+        )
+        self.last_id = 0
+
+    def keep(self, snapshot: tracemalloc.Snapshot) -> int:
+        self.last_id += 1
+        self.snapshots[self.last_id] = (time(), snapshot)
+        while len(self.snapshots) > self.max_snapshots:
+            self.snapshots.popitem(last=False)
+        return self.last_id
+
+    def get(self, snapshot_id: int) -> tracemalloc.Snapshot | None:
+        kept = self.snapshots.get(snapshot_id)
+        return None if kept is None else kept[1]
+
+    def clear(self) -> None:
+        self.snapshots.clear()
+
+    def to_list(self) -> list[dict[str, Any]]:
+        return [
+            {"id": snapshot_id, "taken": taken}
+            for snapshot_id, (taken, _) in self.snapshots.items()
+        ]
+
+    @staticmethod
+    def analyse(
+        base: tracemalloc.Snapshot | None, group_by: str = "lineno", limit: int = 20
+    ) -> tuple[tracemalloc.Snapshot, list[dict[str, Any]]]:
+        """Take snapshot, return it and its top ``limit`` allocations or, with
+        ``base``, top ``limit`` differences from ``base``"""
+        snapshot = tracemalloc.take_snapshot().filter_traces(FILTERS)
+        if base is None:
+            statistics = snapshot.statistics(group_by)
+        else:
+            statistics = snapshot.compare_to(base, group_by)
+        return snapshot, [
+            statistic_to_dict(statistic, group_by) for statistic in statistics[:limit]
+        ]
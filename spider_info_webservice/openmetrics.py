@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import math
+import re
+from datetime import datetime
+from numbers import Real
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Any, Iterable
+
+
+CONTENT_TYPE = b"application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# stats key segments, everything after them is label value
+LABEL_SEGMENTS = {
+    "log_count": "level",
+    "spider_exceptions": "type",
+}
+
+# engine status expressions and names of metrics, after prefix
+ENGINE_METRICS = {
+    "time()-engine.start_time": "engine_uptime_seconds",
+    "len(engine.downloader.active)": "engine_downloader_active",
+    "engine.scraper.is_idle()": "engine_scraper_idle",
+    "engine.spider_is_idle()": "engine_spider_idle",
+    "len(engine.slot.inprogress)": "engine_slot_inprogress",
+    "len(engine.slot.scheduler.dqs or [])": "engine_scheduler_disk_queue",
+    "len(engine.slot.scheduler.mqs)": "engine_scheduler_memory_queue",
+    "len(engine.scraper.slot.queue)": "engine_scraper_queue",
+    "len(engine.scraper.slot.active)": "engine_scraper_active",
+    "engine.scraper.slot.active_size": "engine_scraper_active_size_bytes",
+    "engine.scraper.slot.itemproc_size": "engine_scraper_itemproc_size",
+    "engine.scraper.slot.needs_backout()": "engine_scraper_needs_backout",
+}
+
+_invalid_name_chars = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def metric_name(*parts: str) -> str:
+    name = _invalid_name_chars.sub("_", "_".join(parts))
+    return re.sub(r"_+", "_", name).strip("_")
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def parse_stats_key(key: str, prefix: str = "scrapy") -> tuple[str, str]:
+    """Return metric name and labels (already formatted, possibly empty) for stats key.
+
+    ``downloader/response_status_count/200`` -> ``scrapy_downloader_response_status_count``, ``{status="200"}``
+    ``log_count/INFO`` -> ``scrapy_log_count``, ``{level="INFO"}``
+    ``scheduler/enqueued/memory`` -> ``scrapy_scheduler_enqueued_memory``, ``""``
+    """
+    parts = key.split("/")
+    for i, part in enumerate(parts[:-1]):
+        if part in LABEL_SEGMENTS:
+            label = LABEL_SEGMENTS[part]
+        elif part.endswith("_count"):
+            # response_status_count -> status, request_method_count -> method
+            label = part[: -len("_count")].rsplit("_", 1)[-1]
+        else:
+            continue
+        value = escape_label_value("/".join(parts[i + 1 :]))
+        return metric_name(prefix, *parts[: i + 1]), f'{{{label}="{value}"}}'
+    return metric_name(prefix, *parts), ""
+
+
+def format_value(value: float | int) -> str:
+    """Sample value as OpenMetrics spells it, e.g. ``NaN`` and ``+Inf``"""
+    if isinstance(value, float):
+        if math.isnan(value):
+            return "NaN"
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+    return str(value)
+
+
+def metric_value(value: Any) -> float | int | None:
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, Real):
+        return value
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return None
+
+
+class MetricsRenderer:
+    """Renders stats and engine status in OpenMetrics text format.
+
+    Stats keys are parsed into metric names and labels once per new key.
+    """
+
+    def __init__(self, prefix: str = "scrapy"):
+        self.prefix = prefix
+        self.names: dict[str, tuple[str, str]] = {}
+        self.engine_names = {
+            expression: metric_name(prefix, name)
+            for expression, name in ENGINE_METRICS.items()
+        }
+
+    def stats_samples(self, stats: dict[str, Any]) -> Iterable[tuple[str, str, Any]]:
+        names = self.names
+        for key, value in stats.items():
+            value = metric_value(value)
+            if value is None:
+                continue
+            try:
+                name, labels = names[key]
+            except KeyError:
+                name, labels = names[key] = parse_stats_key(key, self.prefix)
+            yield name, labels, value
+
+    def engine_samples(
+        self, engine_status: Iterable[tuple[str, Any]]
+    ) -> Iterable[tuple[str, str, Any]]:
+        for expression, value in engine_status:
+            name = self.engine_names.get(expression)
+            value = metric_value(value)
+            if name is not None and value is not None:
+                yield name, "", value
+
+    def render(self, *samples: Iterable[tuple[str, str, Any]]) -> bytes:
+        families: dict[str, list[str]] = {}
+        for family_samples in samples:
+            for name, labels, value in family_samples:
+                families.setdefault(name, []).append(
+                    f"{name}{labels} {format_value(value)}"
+                )
+        lines = []
+        for name, family in families.items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(family)
+        lines.append("# EOF\n")
+        return "\n".join(lines).encode()
@@ -0,0 +1,182 @@
+"""Relay batching reports of many spiders on the same host into one POST.
+
+Point spiders to it with ``INFO_SERVICE_REPORT_URL = "http://127.0.0.1:6022/"``
+and run it with::
+
+    python -m spider_info_webservice.relay --upstream http://collector:6023/register
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+from typing import TYPE_CHECKING
+
+from twisted.internet import defer, task
+from twisted.web import resource, server
+
+from .client import HTTPClient
+from .utils import dumps_as_bytes, error_as_bytes
+
+if TYPE_CHECKING:
+    from typing import Any
+
+    from twisted.internet.defer import Deferred
+    from twisted.web.http import Request
+
+logger = logging.getLogger(__name__)
+
+
+class ReportRelay:
+    """Collects reports and sends them upstream as JSON list every ``interval``
+    seconds or as soon as ``max_batch`` reports are pending.
+
+    Only the latest report of the same event of the same spider process is
+    kept, so heartbeats of a spider are coalesced into one. At most
+    ``max_pending`` reports are kept while upstream is unavailable, the oldest
+    are dropped.
+    """
+
+    def __init__(
+        self,
+        client: HTTPClient,
+        upstream: str,
+        interval: float = 1.0,
+        max_batch: int = 500,
+        max_pending: int = 100_000,
+    ):
+        self.client = client
+        self.upstream = upstream
+        self.interval = interval
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.pending: dict[tuple, dict[str, Any]] = {}
+        self.sending: Deferred | None = None
+        self._loop: task.LoopingCall | None = None
+
+    @staticmethod
+    def key(report: dict[str, Any]) -> tuple:
+        return (
+            report.get("info_service_host"),
+            report.get("info_service_port"),
+            report.get("info_service_path"),
+            report.get("pid"),
+            report.get("event", "start"),
+        )
+
+    def add(self, report: dict[str, Any]) -> None:
+        key = self.key(report)
+        self.pending.pop(key, None)
+        self.pending[key] = report
+        while len(self.pending) > self.max_pending:
+            del self.pending[next(iter(self.pending))]
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+
+    def flush(self) -> Deferred | None:
+        """Send pending reports unless previous batch is still being sent"""
+        if not self.pending or self.sending is not None:
+            return self.sending
+        batch = list(self.pending.values())[: self.max_batch]
+        for _ in range(len(batch)):
+            del self.pending[next(iter(self.pending))]
+
+        def failed(failure) -> None:
+            logger.warning(
+                f"Failed to relay {len(batch)} reports to {self.upstream}: "
+                f"{failure.getErrorMessage()}"
+            )
+            for report in batch:
+                self.pending.setdefault(self.key(report), report)
+
+        def done(_) -> None:
+            self.sending = None
+
+        self.sending = self.client.post_json(self.upstream, batch)
+        self.sending.addCallbacks(lambda _: None, failed)
+        self.sending.addBoth(done)
+        return self.sending
+
+    def start(self) -> None:
+        self._loop = task.LoopingCall(self.flush)
+        self._loop.start(self.interval, now=False)
+
+    def stop(self) -> Deferred | None:
+        if self._loop is not None and self._loop.running:
+            self._loop.stop()
+        return self.flush()
+
+
+class RelayResource(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, relay: ReportRelay):
+        super().__init__()
+        self.relay = relay
+
+    def render_POST(self, request: Request) -> bytes:
+        try:
+            reports = json.loads(request.content.read())
+        except ValueError:
+            return error_as_bytes(request, 400, "Body must be JSON")
+        if not isinstance(reports, list):
+            reports = [reports]
+        if not all(isinstance(report, dict) for report in reports):
+            return error_as_bytes(request, 400, "Reports must be JSON objects")
+        host = request.getClientAddress().host
+        for report in reports:
+            if report.get("info_service_host") in {"", "0.0.0.0", "::"}:
+                # upstream sees relay's address, not the spider's one
+                report["info_service_host"] = host
+            self.relay.add(report)
+        request.setResponseCode(202)
+        request.setHeader(b"Content-Type", b"application/json")
+        return dumps_as_bytes({"accepted": len(reports)})
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m spider_info_webservice.relay", description=__doc__
+    )
+    parser.add_argument("--upstream", required=True, help="URL reports are sent to")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6022)
+    parser.add_argument(
+        "--interval", type=float, default=1.0, help="seconds between batches"
+    )
+    parser.add_argument("--max-batch", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--retries", type=int, default=3)
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    from twisted.internet import reactor
+
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    client = HTTPClient(
+        reactor,
+        concurrency=1,
+        timeout=args.timeout,
+        max_persistent_per_host=1,
+        retries=args.retries,
+    )
+    relay = ReportRelay(client, args.upstream, args.interval, args.max_batch)
+    relay.start()
+    port = reactor.listenTCP(
+        args.port, server.Site(RelayResource(relay)), interface=args.host
+    )
+    logger.info(f"Relay started on {args.host}:{port.getHost().port}")
+    reactor.addSystemEventTrigger(
+        "before",
+        "shutdown",
+        lambda: defer.maybeDeferred(relay.stop).addBoth(lambda _: client.close()),
+    )
+    reactor.run()
+
+
+if __name__ == "__main__":
+    main()
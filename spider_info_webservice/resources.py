@@ -1,73 +1,909 @@
 from __future__ import annotations
 
+import heapq
+import json
+import logging
+import math
+import tracemalloc
+from collections import deque
 from typing import TYPE_CHECKING
-from functools import wraps
+from itertools import islice
+from time import monotonic, perf_counter, time
 
 from scrapy.settings import BaseSettings
-from scrapy.utils.engine import get_engine_status
+from scrapy.utils.httpobj import urlparse_cached
 from scrapy.utils.misc import load_object
-from twisted.web import resource
+from twisted.internet.defer import Deferred
+from twisted.internet.interfaces import IPushProducer
+from twisted.internet.task import (
+    LoopingCall,
+    NotPaused,
+    TaskFinished,
+    TaskStopped,
+    cooperate,
+)
+from twisted.web import http, resource
+from twisted.web.http_headers import Headers
+from twisted.web.server import NOT_DONE_YET
+from zope.interface import implementer
 
+from . import openmetrics
+from .collectors import (
+    EngineStatusCollector,
+    LatencyCollector,
+    RequestAgeTracker,
+    SchedulerCounters,
+)
+from .history import moving_average, nan_to_none, percentiles, rates
+from .instrumentation import Instrumentation
+from .memory import (
+    GROUP_BY,
+    TracemallocSnapshots,
+    gc_info,
+    live_refs,
+    max_rss,
+    rss,
+    tracemalloc_info,
+)
+from .openmetrics import MetricsRenderer
 from .utils import (
-    build_single_regexp_for_keys,
+    BadRequest,
+    SensitiveDataRedactor,
+    bytes_to_str,
+    client_key,
     convert_bytes_to_str_in_dict,
     dumps_as_bytes,
-    hide_sensitive_data,
+    error_as_bytes,
+    finish_with,
+    get_arg,
+    get_int_arg,
+    get_list_arg,
+    get_request_fields_arg,
+    make_etag,
     not_default_settings,
     prepare_for_serialisation,
+    project_request,
 )
 
 if TYPE_CHECKING:
-    from typing import Any, Iterable
+    from typing import Any, Hashable, Iterable
 
+    from scrapy.core.downloader import Downloader
     from scrapy.core.engine import ExecutionEngine, Slot
     from scrapy.crawler import Crawler
     from scrapy.statscollectors import StatsCollector
+    from twisted.internet.task import CooperativeTask
+    from twisted.python.failure import Failure
     from twisted.web.http import Request
 
+    from .history import StatsHistory
+    from .instrumentation import ResourceStats
+    from .utils import RateLimiter, ResponseCompressor, SerializationPool
+
+
+def add_debug_logging_to_render(f):
+    """Deprecated, renders of all ``Resource``s are instrumented and logged
+    by ``Resource.render``"""
+    return f
+
 
 class Resource(resource.Resource):
     from . import logger
 
+    # could be requested through /info/batch
+    batchable = True
+    # set by RootResource
+    resource_stats: ResourceStats | None = None
 
-def add_debug_logging_to_render(f):
-    from . import logger
+    def render(self, request: Request) -> bytes | int:
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(
+                "%s request received from %s: %s",
+                request.method.decode(),
+                request.getClientAddress(),
+                request.uri.decode(errors="replace"),
+            )
+        stats = self.resource_stats
+        if stats is None:
+            return super().render(request)
+        start = perf_counter()
+        body = super().render(request)
+        stats.record_render(request, body, perf_counter() - start)
+        return body
+
+
+class JsonResource(Resource):
+    """Base JSON resource.
+
+    ``render_GET`` takes a cheap ``snapshot`` of the data on the reactor thread
+    and then ``convert``s and encodes it. If ``serialization_pool`` is set
+    and the snapshot is big enough, converting and encoding is done in the pool.
+    Bodies of resources with a ``cache_key`` are rendered once and served
+    with a strong ETag afterwards. With ``compressor`` set, bodies are compressed
+    with encoding negotiated from ``Accept-Encoding``, compressed cached bodies
+    are cached too.
+
+    GET requests with the same query args and ``Accept-Encoding`` arriving
+    while a body is serialised in the pool wait for it instead of rendering
+    their own. With ``cache_ttl`` set, bodies are reused for that many seconds.
+    """
+
+    serialization_pool: SerializationPool | None = None
+    compressor: ResponseCompressor | None = None
+    # set by RootResource
+    cache_ttl: float = 0.0
+    # False for resources which bodies depend on more than query args
+    coalesce = True
+    max_cached_bodies = 256
+
+    def __init__(self):
+        super().__init__()
+        self.body_cache: dict[Hashable, tuple[bytes, bytes]] = {}
+        self.compressed_cache: dict[tuple[Hashable, bytes], bytes] = {}
+        # flight key -> Deferreds of requests waiting for the body
+        self.in_flight: dict[Hashable, list[Deferred]] = {}
+        # flight key -> (expiration time, serialised body)
+        self.recent: dict[Hashable, tuple[float, tuple]] = {}
+
+    def snapshot(self, request: Request) -> Any:
+        """Return data to render. Called on the reactor thread, so must be cheap
+        and must not share mutable state with the crawl."""
+        raise NotImplementedError
+
+    def convert(self, snapshot: Any) -> Any:
+        """Make snapshot JSON serialisable, could be called from a pool thread"""
+        return snapshot
+
+    def putChild(self, path: bytes, child: resource.Resource) -> None:
+        # resource with children, e.g. /info/stats/history, can't be a leaf
+        self.isLeaf = False
+        super().putChild(path, child)
 
-    @wraps(f)
-    def wrapper(self, request: Request):
-        logger.debug(
-            f"GET request received from {request.getClientIP()}: {request} with headers: {request.getAllHeaders()}"
+    def getChild(self, path: bytes, request: Request) -> resource.Resource:
+        if path == b"":  # trailing slash, e.g. /info/stats/?since=1
+            return self
+        return super().getChild(path, request)
+
+    def snapshot_size(self, snapshot: Any) -> int:
+        try:
+            return len(snapshot)
+        except TypeError:
+            return 0
+
+    def render_GET(self, request: Request) -> bytes | int:
+        flight = self.flight_key(request)
+        if flight is not None:
+            recent = self.recent.get(flight)
+            if recent is not None and recent[0] > monotonic():
+                return self.render_serialised(request, recent[1])
+            waiting = self.in_flight.get(flight)
+            if waiting is not None:
+                d = Deferred()
+                waiting.append(d)
+                d.addCallback(lambda result: self.render_serialised(request, result))
+                return finish_with(request, d)
+        try:
+            snapshot = self.snapshot(request)
+        except BadRequest as e:
+            return error_as_bytes(request, 400, str(e))
+        return self.render_json(request, snapshot, flight)
+
+    def flight_key(self, request: Request) -> Hashable | None:
+        """Key of requests that get the same body, ``None`` if they can't share it"""
+        if not self.coalesce:
+            return None
+        return (
+            request.getHeader(b"accept-encoding"),
+            tuple(sorted((key, tuple(values)) for key, values in request.args.items())),
         )
-        res = f(self, request)
-        logger.debug(f"Response: {res}")
-        return res
 
-    return wrapper
+    def land(self, flight: Hashable, serialised: tuple) -> None:
+        """Hand serialised body to requests waiting for it and keep it for ``cache_ttl``"""
+        if self.cache_ttl > 0:
+            now = monotonic()
+            if len(self.recent) >= self.max_cached_bodies:
+                self.recent = {
+                    key: value for key, value in self.recent.items() if value[0] > now
+                }
+                if len(self.recent) >= self.max_cached_bodies:
+                    self.recent.clear()
+            self.recent[flight] = (now + self.cache_ttl, serialised)
+        for d in self.in_flight.pop(flight, ()):
+            d.callback(serialised)
+
+    def crash(self, flight: Hashable, failure: Failure) -> Failure:
+        for d in self.in_flight.pop(flight, ()):
+            d.errback(failure)
+        return failure
+
+    def cache_key(self, snapshot: Any) -> Hashable | None:
+        """Return key to cache rendered body under, or ``None`` if the body
+        shouldn't be cached. Only for data that never changes."""
+        return None
+
+    def invalidate(self) -> None:
+        self.body_cache = {}
+        self.compressed_cache = {}
+
+    def render_json(
+        self, request: Request, snapshot: Any, flight: Hashable | None = None
+    ) -> bytes | int:
+        encoding = self.negotiate(request)
+        key = self.cache_key(snapshot)
+        if key is not None and key in self.body_cache:
+            return self.render_cached(request, key, encoding)
+
+        def serialise() -> tuple[bytes, bytes | None, float]:
+            start = perf_counter()
+            body = dumps_as_bytes(self.convert(snapshot), default=bytes_to_str)
+            return body, self.compress(body, encoding), perf_counter() - start
+
+        def render(
+            body: bytes, compressed: bytes | None, elapsed: float, offloaded: bool
+        ) -> bytes:
+            if self.resource_stats is not None:
+                self.resource_stats.record_serialise(elapsed, offloaded)
+            if flight is not None:
+                self.land(flight, (key, encoding, body, compressed))
+            return self.render_body(request, key, encoding, body, compressed)
+
+        pool = self.serialization_pool
+        if pool is None or not pool.should_offload(self.snapshot_size(snapshot)):
+            return render(*serialise(), False)
+        d = pool.run(serialise)
+        if flight is not None:
+            self.in_flight[flight] = []
+            d.addErrback(lambda failure: self.crash(flight, failure))
+        d.addCallback(lambda result: render(*result, True))
+        return finish_with(request, d)
+
+    def negotiate(self, request: Request) -> bytes | None:
+        request.setHeader(b"Content-Type", b"application/json")
+        if self.compressor is None:
+            return None
+        request.setHeader(b"Vary", b"Accept-Encoding")
+        return self.compressor.negotiate(request)
+
+    def render_serialised(self, request: Request, serialised: tuple) -> bytes:
+        """Render body serialised for another request with the same flight key"""
+        key, encoding, body, compressed = serialised
+        self.negotiate(request)
+        return self.render_body(request, key, encoding, body, compressed)
+
+    def compress(self, body: bytes, encoding: bytes | None) -> bytes | None:
+        if self.compressor is None:
+            return None
+        return self.compressor.compress(body, encoding)
+
+    def render_body(
+        self,
+        request: Request,
+        key: Hashable | None,
+        encoding: bytes | None,
+        body: bytes,
+        compressed: bytes | None,
+    ) -> bytes:
+        if key is None:
+            return self.render_encoded(request, encoding, body, compressed)
+        self.body_cache.setdefault(key, (make_etag(body), body))
+        if compressed is not None:
+            self.compressed_cache.setdefault((key, encoding), compressed)
+        return self.render_cached(request, key, encoding)
+
+    def render_cached(
+        self, request: Request, key: Hashable, encoding: bytes | None = None
+    ) -> bytes:
+        etag, body = self.body_cache[key]
+        compressed = self.compressed_cache.get((key, encoding))
+        if compressed is None:
+            compressed = self.compress(body, encoding)
+            if compressed is not None:
+                self.compressed_cache[(key, encoding)] = compressed
+        if compressed is not None:
+            # every representation needs its own strong ETag
+            etag = etag[:-1] + b"-" + encoding + b'"'
+        if request.setETag(etag) == http.CACHED:
+            return b""
+        return self.render_encoded(request, encoding, body, compressed)
+
+    @staticmethod
+    def render_encoded(
+        request: Request, encoding: bytes | None, body: bytes, compressed: bytes | None
+    ) -> bytes:
+        if compressed is None:
+            return body
+        request.setHeader(b"Content-Encoding", encoding)
+        return compressed
+
+
+@implementer(IPushProducer)
+class _TaskProducer:
+    """Producer registered on streamed request, pauses cooperative ``task``
+    writing the body while client doesn't read fast enough"""
+
+    def __init__(self, task: CooperativeTask):
+        self.task = task
 
-class SlotResource(Resource):
+    def pauseProducing(self) -> None:
+        try:
+            self.task.pause()
+        except TaskFinished:
+            pass
+
+    def resumeProducing(self) -> None:
+        try:
+            self.task.resume()
+        except NotPaused:
+            pass
+
+    def stopProducing(self) -> None:
+        try:
+            self.task.stop()
+        except TaskFinished:
+            pass
+
+
+class SlotResource(JsonResource):
     """Slot resource, returns engine's slot.inprogress request.to_dict()"""
 
     isLeaf = True
 
-    def __init__(self, slot: Slot):
+    def __init__(self, slot: Slot, stream_batch_size: int = 100):
         super().__init__()
         self.slot = slot
+        self.stream_batch_size = stream_batch_size
 
-    @add_debug_logging_to_render
-    def render_GET(self, request: Request) -> bytes:
-        request.setHeader(b"Content-Type", b"application/json")
-        response_data = {
+    def render_GET(self, request: Request) -> bytes | int:
+        if get_arg(request, b"format") == "ndjson":
+            try:
+                fields = get_request_fields_arg(request)
+                in_progress = self.paginate(request, list(self.slot.inprogress))[0]
+            except BadRequest as e:
+                return error_as_bytes(request, 400, str(e))
+            return self.stream(request, in_progress, fields)
+        return super().render_GET(request)
+
+    @staticmethod
+    def paginate(request: Request, in_progress: list) -> tuple[list, dict[str, Any]]:
+        offset = get_int_arg(request, b"offset", 0)
+        limit = get_int_arg(request, b"limit")
+        if not offset and limit is None:
+            return in_progress, {}
+        end = None if limit is None else offset + limit
+        page = {"total": len(in_progress), "offset": offset, "limit": limit}
+        return in_progress[offset:end], page
+
+    def snapshot(self, request: Request) -> dict[str, Any]:
+        fields = get_request_fields_arg(request)
+        in_progress, page = self.paginate(request, list(self.slot.inprogress))
+        # meta and headers are changed by the crawl while requests are in
+        # progress, they are copied only if they are read from the pool
+        pool = self.serialization_pool
+        copied = set()
+        if pool is not None and pool.should_offload(len(in_progress)):
+            copied = {"meta", "headers"}
+            if fields is not None:
+                copied &= {field.split(".")[0] for field in fields}
+        in_progress = [
+            (
+                slot_request,
+                {attr: getattr(slot_request, attr).copy() for attr in copied},
+            )
+            for slot_request in in_progress
+        ]
+        return {"fields": fields, "in_progress": in_progress, "page": page}
+
+    def snapshot_size(self, snapshot: dict[str, Any]) -> int:
+        return len(snapshot["in_progress"])
+
+    def convert(self, snapshot: dict[str, Any]) -> dict[str, Any]:
+        return {
             "in_progress_requests": [
-                convert_bytes_to_str_in_dict(request.to_dict())
-                for request in self.slot.inprogress
-            ]
+                self.request_to_dict(slot_request, snapshot["fields"], overrides)
+                for slot_request, overrides in snapshot["in_progress"]
+            ],
+            **snapshot["page"],
         }
-        return dumps_as_bytes(
-            response_data, default=lambda x: x.decode() if isinstance(x, bytes) else x
+
+    @staticmethod
+    def request_to_dict(
+        slot_request, fields: list[str] | None, overrides: dict[str, Any] | None = None
+    ) -> dict[str, Any]:
+        if fields is None:
+            request_dict = slot_request.to_dict()
+            request_dict.update(overrides or {})
+            return convert_bytes_to_str_in_dict(request_dict)
+        return project_request(slot_request, fields, overrides)
+
+    def stream(
+        self, request: Request, in_progress: list, fields: list[str] | None
+    ) -> int:
+        """Write one JSON document per line, ``stream_batch_size`` lines per reactor turn"""
+        request.setHeader(b"Content-Type", b"application/x-ndjson")
+
+        def batches():
+            batch = []
+            for slot_request in in_progress:
+                batch.append(
+                    dumps_as_bytes(
+                        self.request_to_dict(slot_request, fields),
+                        default=bytes_to_str,
+                    )
+                )
+                if len(batch) >= self.stream_batch_size:
+                    request.write(b"\n".join(batch) + b"\n")
+                    batch = []
+                    yield
+            if batch:
+                request.write(b"\n".join(batch) + b"\n")
+
+        producer = _TaskProducer(cooperate(batches()))
+        request.registerProducer(producer, True)
+
+        def client_gone(failure):
+            self.logger.debug(f"Slot stream to {request.getClientAddress()} cancelled")
+            producer.stopProducing()
+
+        def done(_):
+            request.unregisterProducer()
+            request.finish()
+
+        def failed(failure):
+            if not failure.check(TaskStopped):
+                self.logger.error(f"Slot stream failed: {failure.getErrorMessage()}")
+                request.loseConnection()
+
+        request.notifyFinish().addErrback(client_gone)
+        producer.task.whenDone().addCallbacks(done, failed)
+        return NOT_DONE_YET
+
+
+class SlotSummaryResource(JsonResource):
+    """Slot summary resource, returns engine's slot.inprogress requests counted
+    by download slot, method and depth, with their ages and download latencies.
+
+    Requests are visited once and never converted to dicts, the response size
+    depends on number of download slots (at most ``top`` of them), not requests.
+    """
+
+    isLeaf = True
+
+    def __init__(self, slot: Slot, request_ages: RequestAgeTracker | None = None):
+        super().__init__()
+        self.slot = slot
+        self.request_ages = request_ages
+
+    def snapshot(self, request: Request) -> dict[str, Any]:
+        top = get_int_arg(request, b"top", 20, minimum=1)
+        try:
+            ps = [float(p) for p in get_list_arg(request, b"percentiles") or ()]
+        except ValueError:
+            raise BadRequest("percentiles must be numbers, e.g. percentiles=50,99")
+        if any(not 0 < p <= 100 for p in ps):
+            raise BadRequest("percentiles must be in (0, 100]")
+        started = self.request_ages.started if self.request_ages is not None else {}
+        now = time()
+        rows = []
+        for slot_request in list(self.slot.inprogress):
+            meta = slot_request.meta
+            start = started.get(slot_request)
+            rows.append(
+                (
+                    meta.get("download_slot") or urlparse_cached(slot_request).hostname,
+                    slot_request.method,
+                    meta.get("depth", 0),
+                    meta.get("download_latency"),
+                    None if start is None else now - start,
+                )
+            )
+        return {"top": top, "percentiles": ps or [50, 90, 99], "rows": rows}
+
+    def snapshot_size(self, snapshot: dict[str, Any]) -> int:
+        return len(snapshot["rows"])
+
+    def convert(self, snapshot: dict[str, Any]) -> dict[str, Any]:
+        ps = snapshot["percentiles"]
+        # slot -> [count, oldest age, latencies]
+        slots: dict[str, list] = {}
+        methods: dict[str, int] = {}
+        depths: dict[int, int] = {}
+        latencies = []
+        ages = []
+        for slot, method, depth, latency, age in snapshot["rows"]:
+            entry = slots.get(slot)
+            if entry is None:
+                entry = slots[slot] = [0, None, []]
+            entry[0] += 1
+            methods[method] = methods.get(method, 0) + 1
+            depths[depth] = depths.get(depth, 0) + 1
+            if age is not None:
+                ages.append(age)
+                if entry[1] is None or age > entry[1]:
+                    entry[1] = age
+            if latency is not None:
+                latencies.append(latency)
+                entry[2].append(latency)
+
+        def latency_summary(values: list[float]) -> dict[str, Any]:
+            if not values:
+                return {"count": 0}
+            values.sort()
+            return {"count": len(values), **percentiles(values, ps), "max": values[-1]}
+
+        top_slots = heapq.nlargest(
+            snapshot["top"], slots.items(), key=lambda item: item[1][0]
         )
+        return {
+            "total": len(snapshot["rows"]),
+            "oldest_age": max(ages, default=None),
+            "latency": latency_summary(latencies),
+            "by_method": dict(sorted(methods.items())),
+            "by_depth": {str(depth): n for depth, n in sorted(depths.items())},
+            "slots": len(slots),
+            "by_slot": {
+                str(slot): {
+                    "count": count,
+                    "oldest_age": oldest,
+                    "latency": latency_summary(slot_latencies),
+                }
+                for slot, (count, oldest, slot_latencies) in top_slots
+            },
+        }
+
+
+class DownloaderResource(JsonResource):
+    """Downloader resource, returns engine's downloader slots with their concurrency, delay and load"""
+
+    isLeaf = True
+    # name -> index in snapshot rows
+    slot_fields = {
+        "key": 0,
+        "concurrency": 1,
+        "delay": 2,
+        "randomize_delay": 3,
+        "active": 4,
+        "queue": 5,
+        "transferring": 6,
+        "lastseen": 7,
+        "free_transfer_slots": 8,
+    }
+
+    def __init__(self, downloader: Downloader):
+        super().__init__()
+        self.downloader = downloader
+
+    def snapshot(self, request: Request) -> dict[str, Any]:
+        sort = get_arg(request, b"sort", "-active")
+        field = sort.lstrip("-")
+        if field not in self.slot_fields:
+            raise BadRequest(
+                f"Unknown sort field {field!r}, one of: {', '.join(self.slot_fields)}"
+            )
+        top = get_int_arg(request, b"top", 100, minimum=1)
+        downloader = self.downloader
+        rows = [
+            (
+                key,
+                slot.concurrency,
+                slot.delay,
+                slot.randomize_delay,
+                len(slot.active),
+                len(slot.queue),
+                len(slot.transferring),
+                slot.lastseen,
+                slot.concurrency - len(slot.transferring),
+            )
+            for key, slot in list(downloader.slots.items())
+        ]
+        return {
+            "sort": sort,
+            "top": top,
+            "rows": rows,
+            "active": len(downloader.active),
+            "total_concurrency": downloader.total_concurrency,
+            "domain_concurrency": downloader.domain_concurrency,
+            "ip_concurrency": downloader.ip_concurrency,
+        }
+
+    def snapshot_size(self, snapshot: dict[str, Any]) -> int:
+        return len(snapshot["rows"])
+
+    def convert(self, snapshot: dict[str, Any]) -> dict[str, Any]:
+        sort, rows = snapshot["sort"], snapshot["rows"]
+        index = self.slot_fields[sort.lstrip("-")]
+        select = heapq.nlargest if sort.startswith("-") else heapq.nsmallest
+        names = list(self.slot_fields)
+        return {
+            "active": snapshot["active"],
+            "total_concurrency": snapshot["total_concurrency"],
+            "domain_concurrency": snapshot["domain_concurrency"],
+            "ip_concurrency": snapshot["ip_concurrency"],
+            "queued": sum(row[5] for row in rows),
+            "transferring": sum(row[6] for row in rows),
+            "total_slots": len(rows),
+            "slots": [
+                dict(zip(names, row))
+                for row in select(snapshot["top"], rows, key=lambda row: row[index])
+            ],
+        }
 
 
-class SettingsResource(Resource):
+class SchedulerResource(JsonResource):
+    """Scheduler resource, returns scheduler's queued requests by queue and priority, with a sample of them"""
+
+    isLeaf = True
+
+    def __init__(
+        self,
+        engine: ExecutionEngine,
+        counters: SchedulerCounters | None = None,
+        max_sample_size: int = 1000,
+    ):
+        super().__init__()
+        self.engine = engine
+        self.counters = counters
+        self.max_sample_size = max_sample_size
+
+    @staticmethod
+    def priority_queues(pqueue: Any) -> Iterable[tuple[int, Any]]:
+        """``(request priority, internal queue)`` of scrapy's priority queues"""
+        if hasattr(pqueue, "pqueues"):  # DownloaderAwarePriorityQueue
+            for slot_pqueue in list(pqueue.pqueues.values()):
+                yield from SchedulerResource.priority_queues(slot_pqueue)
+        for key, queue in list(getattr(pqueue, "queues", {}).items()):
+            # ScrapyPriorityQueue keys are negated request priorities
+            yield -key, queue
+
+    def snapshot(self, request: Request) -> dict[str, Any]:
+        sample_size = get_int_arg(request, b"sample", self.max_sample_size)
+        sample_size = min(sample_size, self.max_sample_size)
+        top = get_int_arg(request, b"top", 20, minimum=1)
+        scheduler = self.engine.slot.scheduler
+        try:
+            total = len(scheduler)
+        except TypeError:  # custom scheduler without __len__
+            total = None
+
+        queues = {}
+        sample = []
+        for name, attr in (("memory", "mqs"), ("disk", "dqs")):
+            pqueue = getattr(scheduler, attr, None)
+            if pqueue is None:
+                continue
+            priorities: dict[int, int] = {}
+            memory_queues = []
+            for priority, queue in self.priority_queues(pqueue):
+                size = len(queue)
+                priorities[priority] = priorities.get(priority, 0) + size
+                # queuelib memory queues keep requests in a deque or list,
+                # disk queues can't be read without popping
+                if size and isinstance(getattr(queue, "q", None), (deque, list)):
+                    memory_queues.append((size, queue.q))
+            queues[name] = {"total": len(pqueue), "priorities": priorities}
+            queued = sum(size for size, _ in memory_queues)
+            remaining = max(sample_size - len(sample), 0)
+            for size, items in memory_queues:
+                # every queue is sampled in proportion to its size
+                n = min(size, -(-remaining * size // queued), sample_size - len(sample))
+                sample.extend(
+                    (
+                        urlparse_cached(queued_request).hostname or "",
+                        queued_request.meta.get("depth", 0),
+                    )
+                    for queued_request in islice(items, n)
+                )
+
+        counters = None
+        if self.counters is not None:
+            counters = {
+                "scheduled": self.counters.scheduled,
+                "dropped": self.counters.dropped,
+                "domains": dict(self.counters.domains),
+                "depths": dict(self.counters.depths),
+            }
+        return {
+            "top": top,
+            "total": total,
+            "queues": queues,
+            "sample": sample,
+            "counters": counters,
+        }
+
+    def snapshot_size(self, snapshot: dict[str, Any]) -> int:
+        return len(snapshot["sample"])
+
+    def convert(self, snapshot: dict[str, Any]) -> dict[str, Any]:
+        top = snapshot["top"]
+
+        def top_domains(domains: dict[str, int]) -> dict[str, int]:
+            return dict(heapq.nlargest(top, domains.items(), key=lambda item: item[1]))
+
+        def by_depth(depths: dict[int, int]) -> dict[str, int]:
+            return {str(depth): n for depth, n in sorted(depths.items())}
+
+        domains: dict[str, int] = {}
+        depths: dict[int, int] = {}
+        for domain, depth in snapshot["sample"]:
+            domains[domain] = domains.get(domain, 0) + 1
+            depths[depth] = depths.get(depth, 0) + 1
+        result = {
+            "total": snapshot["total"],
+            "queues": {
+                name: {
+                    "total": queue["total"],
+                    "priorities": {
+                        str(priority): n
+                        for priority, n in sorted(
+                            queue["priorities"].items(), reverse=True
+                        )
+                    },
+                }
+                for name, queue in snapshot["queues"].items()
+            },
+            "sample": {
+                "size": len(snapshot["sample"]),
+                "domains": top_domains(domains),
+                "depths": by_depth(depths),
+            },
+        }
+        counters = snapshot["counters"]
+        if counters is not None:
+            result["counters"] = {
+                "scheduled": counters["scheduled"],
+                "dropped": counters["dropped"],
+                "domains": top_domains(counters["domains"]),
+                "depths": by_depth(counters["depths"]),
+            }
+        return result
+
+
+class LatencyResource(JsonResource):
+    """Latency resource, returns percentiles of download latency and response size by domain"""
+
+    isLeaf = True
+
+    def __init__(self, collector: LatencyCollector):
+        super().__init__()
+        self.collector = collector
+
+    def snapshot(self, request: Request) -> dict[str, Any]:
+        top = get_int_arg(request, b"top", 20, minimum=1)
+        try:
+            ps = [float(p) for p in get_list_arg(request, b"percentiles") or ()]
+        except ValueError:
+            raise BadRequest("percentiles must be numbers, e.g. percentiles=50,99")
+        if any(not 0 < p <= 100 for p in ps):
+            raise BadRequest("percentiles must be in (0, 100]")
+        collector = self.collector
+        names = get_list_arg(request, b"domain")
+        if names is not None:
+            domains = [
+                (name, collector.domains[name])
+                for name in names
+                if name in collector.domains
+            ]
+        else:
+            domains = heapq.nlargest(
+                top, collector.domains.items(), key=lambda item: item[1].responses
+            )
+        # histograms keep changing on the reactor thread, copy the few needed
+        return {
+            "percentiles": ps or [50, 90, 99, 99.9],
+            "tracked": len(collector.domains),
+            "evicted": collector.evicted,
+            "total": collector.total.copy(),
+            "domains": [(name, domain.copy()) for name, domain in domains],
+        }
+
+    def snapshot_size(self, snapshot: dict[str, Any]) -> int:
+        return len(snapshot["domains"])
+
+    def convert(self, snapshot: dict[str, Any]) -> dict[str, Any]:
+        ps = snapshot["percentiles"]
+        return {
+            "tracked": snapshot["tracked"],
+            "evicted": snapshot["evicted"],
+            "total": snapshot["total"].summary(ps),
+            "domains": {
+                name: domain.summary(ps) for name, domain in snapshot["domains"]
+            },
+        }
+
+
+class MemoryResource(JsonResource):
+    """Memory resource, returns RSS, gc counts, live objects tracked by scrapy
+    and, on demand, top allocations of tracemalloc snapshots and their diffs"""
+
+    isLeaf = True
+    # requests with tracemalloc args take and keep snapshots
+    coalesce = False
+
+    def __init__(self, max_snapshots: int = 3):
+        super().__init__()
+        self.snapshots = TracemallocSnapshots(max_snapshots)
+        # snapshots are taken one at a time
+        self.busy = False
+
+    def snapshot(self, request: Request) -> dict[str, Any]:
+        return {
+            "rss": rss(),
+            "max_rss": max_rss(),
+            "gc": gc_info(),
+            "live_refs": live_refs(),
+            "tracemalloc": {
+                **tracemalloc_info(),
+                "snapshots": self.snapshots.to_list(),
+            },
+        }
+
+    def render_GET(self, request: Request) -> bytes | int:
+        action = get_arg(request, b"tracemalloc")
+        if action is None and not (b"top" in request.args or b"diff" in request.args):
+            return super().render_GET(request)
+        try:
+            group_by = get_arg(request, b"group_by", "lineno")
+            if group_by not in GROUP_BY:
+                raise BadRequest(f"group_by must be one of {', '.join(GROUP_BY)}")
+            limit = get_int_arg(request, b"top", 20, minimum=1)
+            frames = get_int_arg(request, b"frames", 1, minimum=1)
+            base_id = get_int_arg(request, b"diff", minimum=1)
+            if action not in (None, "start", "stop", "snapshot"):
+                raise BadRequest("tracemalloc must be start, stop or snapshot")
+        except BadRequest as e:
+            return error_as_bytes(request, 400, str(e))
+        if self.busy:
+            request.setHeader(b"Retry-After", b"1")
+            return error_as_bytes(request, 503, "Snapshot is being taken")
+        if action == "start":
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+            return self.render_json(request, self.snapshot(request))
+        if action == "stop":
+            tracemalloc.stop()
+            self.snapshots.clear()
+            return self.render_json(request, self.snapshot(request))
+        if not tracemalloc.is_tracing():
+            return error_as_bytes(
+                request,
+                409,
+                "tracemalloc isn't tracing, start it with tracemalloc=start",
+            )
+        base = None
+        if base_id is not None:
+            base = self.snapshots.get(base_id)
+            if base is None:
+                return error_as_bytes(request, 404, f"No snapshot {base_id}")
+
+        from twisted.internet.threads import deferToThread
+
+        def analysed(result: tuple) -> bytes:
+            snapshot, statistics = result
+            data = self.snapshot(request)
+            if action == "snapshot":
+                data["snapshot"] = self.snapshots.keep(snapshot)
+                data["tracemalloc"]["snapshots"] = self.snapshots.to_list()
+            if base is None:
+                data["top"] = statistics
+            else:
+                data["diff"] = {"base": base_id, "top": statistics}
+            encoding = self.negotiate(request)
+            body = dumps_as_bytes(data)
+            return self.render_encoded(
+                request, encoding, body, self.compress(body, encoding)
+            )
+
+        def done(result: Any) -> Any:
+            self.busy = False
+            return result
+
+        self.busy = True
+        d = deferToThread(self.snapshots.analyse, base, group_by, limit)
+        d.addBoth(done)
+        d.addCallback(analysed)
+        return finish_with(request, d)
+
+
+class SettingsResource(JsonResource):
     """Settings resource, returns crawler.settings"""
 
     isLeaf = True
@@ -75,39 +911,56 @@ class SettingsResource(Resource):
     def __init__(self, settings: BaseSettings, sensetive_keys: list[str]):
         super().__init__()
         self.settings = settings
-        self.sensetive_keys = build_single_regexp_for_keys(sensetive_keys)
+        self.redactor = SensitiveDataRedactor(sensetive_keys)
+        self.sensetive_keys = self.redactor.regexp
 
-    @add_debug_logging_to_render
-    def render_GET(self, request: Request) -> bytes:
-        request.setHeader(b"Content-Type", b"application/json")
-        if request.args.get(b"all", [b"false"])[0] == b"true":
-            response_data = prepare_for_serialisation(self.settings)
+    def snapshot(self, request: Request) -> tuple[bool, BaseSettings]:
+        # settings are frozen once crawler is started, no need to copy them
+        return get_arg(request, b"all", "false") == "true", self.settings
+
+    def snapshot_size(self, snapshot: tuple[bool, BaseSettings]) -> int:
+        return len(snapshot[1])
+
+    def cache_key(self, snapshot: tuple[bool, BaseSettings]) -> bool | None:
+        all_settings, settings = snapshot
+        return all_settings if settings.frozen else None
+
+    def convert(self, snapshot: tuple[bool, BaseSettings]) -> dict[str, Any]:
+        all_settings, settings = snapshot
+        if all_settings:
+            response_data = prepare_for_serialisation(settings)
         else:
             response_data = prepare_for_serialisation(
-                dict(not_default_settings(self.settings))
+                dict(not_default_settings(settings))
             )
-        hide_sensitive_data(response_data, self.sensetive_keys)
-        return dumps_as_bytes(response_data)
+        return self.redactor.redact(response_data)
 
 
-class EngineStatusResource(Resource):
-    """Engine status resource, returns get_engine_status(curr_engine) imported from scrapy.utils.engine"""
+class EngineStatusResource(JsonResource):
+    """Engine status resource, returns the same status as
+    scrapy.utils.engine.get_engine_status(curr_engine) and extra expressions"""
 
     isLeaf = True
 
-    def __init__(self, engine: ExecutionEngine):
+    def __init__(
+        self,
+        engine: ExecutionEngine,
+        extra_expressions: list[str] | dict[str, str] | None = None,
+    ):
         super().__init__()
         self.engine = engine
+        self.collector = EngineStatusCollector(engine, extra_expressions)
 
-    @add_debug_logging_to_render
-    def render_GET(self, request: Request) -> bytes:
-        request.setHeader(b"Content-Type", b"application/json")
-        engine_status_report = get_engine_status(self.engine)
-        response_data = {key: value for key, value in engine_status_report}
-        return dumps_as_bytes(response_data)
+    def snapshot(self, request: Request) -> dict[str, Any]:
+        fields = get_list_arg(request, b"fields")
+        if fields is not None:
+            unknown = set(fields).difference(self.collector.getters)
+            if unknown:
+                raise BadRequest(f"Unknown fields: {', '.join(sorted(unknown))}")
+        return self.collector.collect(fields)
 
 
-class StatsResource(Resource):
+class StatsResource(JsonResource):
     """Stats resource, returns crawler.stats.get_stats()"""
 
     isLeaf = True
@@ -115,39 +968,413 @@ class StatsResource(Resource):
     def __init__(self, stats: StatsCollector):
         super().__init__()
         self.stats = stats
-    
-    @add_debug_logging_to_render
+
+    def snapshot(self, request: Request) -> dict[str, Any]:
+        since = get_int_arg(request, b"since")
+        if since is None:
+            return dict(self.stats.get_stats())
+        if not hasattr(self.stats, "get_stats_since"):
+            raise BadRequest(
+                "since is supported only with "
+                "spider_info_webservice.statscollectors.VersionedStatsCollector"
+            )
+        version, stats, full = self.stats.get_stats_since(since)
+        return {"version": version, "full": full, "stats": stats}
+
+
+class StatsHistoryResource(JsonResource):
+    """Stats history resource, returns sampled numeric stats with their rates per second and moving averages"""
+
+    isLeaf = True
+
+    def __init__(self, history: StatsHistory):
+        super().__init__()
+        self.history = history
+
+    def snapshot(self, request: Request) -> dict[str, Any]:
+        keys = get_list_arg(request, b"keys")
+        last = get_int_arg(request, b"last")
+        window = get_int_arg(request, b"window", 5, minimum=1)
+        timestamps, series = self.history.series(keys, last)
+        return {"timestamps": timestamps, "series": series, "window": window}
+
+    def snapshot_size(self, snapshot: dict[str, Any]) -> int:
+        return len(snapshot["series"])
+
+    def convert(self, snapshot: dict[str, Any]) -> dict[str, Any]:
+        timestamps, series = snapshot["timestamps"], snapshot["series"]
+        key_rates = {key: rates(timestamps, values) for key, values in series.items()}
+        return {
+            "interval": self.history.interval,
+            "window": snapshot["window"],
+            "timestamps": list(timestamps),
+            "series": {key: nan_to_none(values) for key, values in series.items()},
+            "rates": {key: nan_to_none(values) for key, values in key_rates.items()},
+            "moving_average": {
+                key: nan_to_none(moving_average(values, snapshot["window"]))
+                for key, values in key_rates.items()
+            },
+        }
+
+
+class MetricsResource(Resource):
+    """Metrics resource, returns crawler.stats and engine status in OpenMetrics text format"""
+
+    isLeaf = True
+
+    def __init__(
+        self, stats: StatsCollector, engine: ExecutionEngine, prefix: str = "scrapy"
+    ):
+        super().__init__()
+        self.stats = stats
+        self.engine = engine
+        # only expressions exposed as metrics are evaluated
+        self.engine_status = EngineStatusCollector(engine).subset(
+            openmetrics.ENGINE_METRICS
+        )
+        self.renderer = MetricsRenderer(prefix)
+
     def render_GET(self, request: Request) -> bytes:
-        request.setHeader(b"Content-Type", b"application/json")
-        response_data = self.stats.get_stats()
-        return dumps_as_bytes(response_data)
+        request.setHeader(b"Content-Type", openmetrics.CONTENT_TYPE)
+        return self.renderer.render(
+            self.renderer.stats_samples(self.stats.get_stats()),
+            self.renderer.engine_samples(self.engine_status()),
+        )
 
 
-class GeneralDataResource(Resource):
+class GeneralDataResource(JsonResource):
     """General data resource, returns the general data of the crawler. (You are currently here)"""
 
     isLeaf = True
-    general_data = {}
 
-    
-    @add_debug_logging_to_render
-    def render_GET(self, request: Request) -> bytes:
-        request.setHeader(b"Content-Type", b"application/json")
-        response_data = self.general_data
-        return dumps_as_bytes(response_data)
+    def __init__(self, general_data: dict[str, Any] | None = None):
+        super().__init__()
+        self.general_data = general_data or {}
+
+    @property
+    def general_data(self) -> dict[str, Any]:
+        return self._general_data
+
+    @general_data.setter
+    def general_data(self, general_data: dict[str, Any]) -> None:
+        self._general_data = general_data
+        self.invalidate()
+
+    def snapshot(self, request: Request) -> dict[str, Any]:
+        return self.general_data
+
+    def cache_key(self, snapshot: dict[str, Any]) -> str:
+        return "general"
+
+
+@implementer(IPushProducer)
+class _StreamSubscriber:
+    """Producer registered on subscriber's request, transport pauses it when
+    client doesn't read fast enough"""
+
+    def __init__(self, request: Request):
+        self.request = request
+        self.paused = False
+
+    def pauseProducing(self) -> None:
+        self.paused = True
+
+    def resumeProducing(self) -> None:
+        self.paused = False
+
+    def stopProducing(self) -> None:
+        self.paused = True
+
+
+class StreamResource(Resource):
+    """Stream resource, pushes stats changes and engine status as Server-Sent Events"""
+
+    isLeaf = True
+    batchable = False
+
+    def __init__(
+        self,
+        stats: StatsCollector,
+        engine: ExecutionEngine,
+        interval: float = 1.0,
+        extra_expressions: list[str] | dict[str, str] | None = None,
+    ):
+        super().__init__()
+        self.stats = stats
+        self.engine = engine
+        self.collector = EngineStatusCollector(engine, extra_expressions)
+        self.interval = interval
+        self.subscribers: list[_StreamSubscriber] = []
+        self.event_id = 0
+        self._loop = LoopingCall(self.tick)
+        self._last_stats: dict[str, Any] = {}
+        self._last_version: int | None = None
+
+    def render_GET(self, request: Request) -> int:
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(
+                f"Stream subscriber connected from {request.getClientAddress()}"
+            )
+        request.setHeader(b"Content-Type", b"text/event-stream")
+        request.setHeader(b"Cache-Control", b"no-cache")
+        subscriber = _StreamSubscriber(request)
+        request.registerProducer(subscriber, True)
+        # new subscriber gets full stats first, then shared deltas
+        request.write(
+            self.format_event(
+                "snapshot",
+                {"stats": dict(self.stats.get_stats()), "engine": self.engine_status()},
+            )
+        )
+        self.subscribers.append(subscriber)
+        request.notifyFinish().addBoth(lambda _: self.unsubscribe(subscriber))
+        if not self._loop.running:
+            self._last_stats = dict(self.stats.get_stats())
+            self._last_version = getattr(self.stats, "version", None)
+            self._loop.start(self.interval, now=False)
+        return NOT_DONE_YET
+
+    def unsubscribe(self, subscriber: _StreamSubscriber) -> None:
+        if subscriber not in self.subscribers:
+            return
+        self.subscribers.remove(subscriber)
+        if subscriber.request.channel is not None:  # still connected
+            subscriber.request.unregisterProducer()
+        if not self.subscribers and self._loop.running:
+            self._loop.stop()
+
+    def close(self) -> None:
+        """Finish streams of all subscribers, e.g. when the service stops"""
+        for subscriber in list(self.subscribers):
+            self.unsubscribe(subscriber)
+            subscriber.request.finish()
+        if self._loop.running:
+            self._loop.stop()
+
+    def drop(self, subscriber: _StreamSubscriber) -> None:
+        """Disconnect subscriber without writing (and buffering) anything else"""
+        self.logger.warning(
+            f"Dropping slow stream subscriber {subscriber.request.getClientAddress()}"
+        )
+        self.unsubscribe(subscriber)
+        transport = subscriber.request.transport
+        if hasattr(transport, "abortConnection"):
+            transport.abortConnection()
+        else:
+            subscriber.request.loseConnection()
+
+    def engine_status(self) -> dict[str, Any]:
+        return self.collector.collect()
+
+    def stats_delta(self) -> dict[str, Any]:
+        if hasattr(self.stats, "get_stats_since") and self._last_version is not None:
+            self._last_version, changed, _ = self.stats.get_stats_since(
+                self._last_version
+            )
+            return changed
+        stats = self.stats.get_stats()
+        last = self._last_stats
+        changed = {
+            key: value
+            for key, value in stats.items()
+            if key not in last or last[key] != value
+        }
+        self._last_stats = dict(stats)
+        return changed
+
+    def format_event(self, event: str, data: Any) -> bytes:
+        self.event_id += 1
+        return b"id: %d\nevent: %s\ndata: %s\n\n" % (
+            self.event_id,
+            event.encode(),
+            dumps_as_bytes(data, default=bytes_to_str),
+        )
+
+    def tick(self) -> None:
+        """Build one event and write it to every subscriber"""
+        event = self.format_event(
+            "update", {"stats": self.stats_delta(), "engine": self.engine_status()}
+        )
+        for subscriber in list(self.subscribers):
+            if subscriber.paused:
+                self.drop(subscriber)
+            else:
+                subscriber.request.write(event)
+
+
+class _BatchRequest:
+    """Request of one resource in a batch: its own query args and response
+    code and headers, the rest comes from the batch request"""
+
+    def __init__(self, request: Request, args: dict[bytes, list[bytes]]):
+        self._request = request
+        self.args = args
+        self.method = b"GET"
+        self.code = http.OK
+        self.responseHeaders = Headers()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._request, name)
+
+    def getHeader(self, key: bytes) -> bytes | None:
+        # batch response is compressed and validated as a whole
+        if key.lower() in (b"accept-encoding", b"if-none-match"):
+            return None
+        return self._request.getHeader(key)
+
+    def setResponseCode(self, code: int, message: bytes | None = None) -> None:
+        self.code = code
+
+    def setHeader(self, name: bytes, value: bytes) -> None:
+        self.responseHeaders.setRawHeaders(name, [value])
+
+    def setETag(self, etag: bytes) -> None:
+        return None
+
+
+class BatchResource(JsonResource):
+    """Batch resource, returns several resources snapshotted at once, e.g. /info/batch?r=stats,engine,slot&slot.limit=10"""
+
+    isLeaf = True
+    batchable = False
+    # set by RootResource, children of it are batched
+    root: resource.Resource | None = None
+
+    def snapshot(self, request: Request) -> dict[str, tuple[Any, Any]]:
+        names = get_list_arg(request, b"r")
+        if not names:
+            raise BadRequest("r is required, e.g. r=stats,engine")
+        requested = {}
+        for name in names:
+            prefix = name.encode() + b"."
+            requested[name] = {
+                key[len(prefix) :]: values
+                for key, values in request.args.items()
+                if key.startswith(prefix)
+            }
+        return self.snapshot_resources(request, requested)
+
+    def render_POST(self, request: Request) -> bytes | int:
+        """Body is JSON object of resource names and their query args,
+        e.g. ``{"stats": {}, "slot": {"limit": 10, "fields": ["url"]}}``"""
+        try:
+            body = json.loads(request.content.read() or b"{}")
+            if not isinstance(body, dict) or not body:
+                raise BadRequest(
+                    "Body must be JSON object of resource names and their query args"
+                )
+            snapshot = self.snapshot_resources(
+                request, {name: self.encode_args(args) for name, args in body.items()}
+            )
+        except ValueError as e:  # BadRequest is ValueError too
+            return error_as_bytes(request, 400, str(e))
+        return self.render_json(request, snapshot)
+
+    @staticmethod
+    def encode_args(args: dict[str, Any] | None) -> dict[bytes, list[bytes]]:
+        if args is None:
+            return {}
+        if not isinstance(args, dict):
+            raise BadRequest("Query args of resource must be JSON object")
+        encoded = {}
+        for key, value in args.items():
+            values = value if isinstance(value, list) else [value]
+            encoded[key.encode()] = [
+                (v if isinstance(v, str) else json.dumps(v)).encode() for v in values
+            ]
+        return encoded
+
+    def resolve(self, name: str) -> resource.Resource | None:
+        child = self.root
+        for part in name.encode().split(b"/"):
+            child = getattr(child, "children", {}).get(part)
+            if child is None:
+                return None
+        return child
+
+    def snapshot_resources(
+        self, request: Request, requested: dict[str, dict[bytes, list[bytes]]]
+    ) -> dict[str, tuple[Any, Any]]:
+        """Snapshot requested resources one after another, without giving
+        control back to the reactor, so they are consistent with each other.
+        Resources not based on ``JsonResource`` are rendered right away."""
+        snapshots: dict[str, tuple[Any, Any]] = {}
+        for name, args in requested.items():
+            child = self.resolve(name)
+            if child is None or not getattr(child, "batchable", True):
+                snapshots[name] = (None, {"error": f"No batchable resource {name!r}"})
+                continue
+            child_request = _BatchRequest(request, args)
+            try:
+                if isinstance(child, JsonResource):
+                    snapshots[name] = (child, child.snapshot(child_request))
+                else:
+                    snapshots[name] = (None, self.render_child(child, child_request))
+            except BadRequest as e:
+                snapshots[name] = (None, {"error": str(e)})
+        return snapshots
+
+    @staticmethod
+    def render_child(child: resource.Resource, request: _BatchRequest) -> Any:
+        try:
+            body = child.render(request)
+        except resource.UnsupportedMethod:
+            return {"error": "Resource doesn't support GET"}
+        if body is NOT_DONE_YET:
+            return {"error": "Resource doesn't render synchronously"}
+        content_type = request.responseHeaders.getRawHeaders(b"content-type", [b""])[0]
+        if content_type.startswith(b"application/json"):
+            return json.loads(body)
+        return body.decode(errors="replace")
+
+    def snapshot_size(self, snapshot: dict[str, tuple[Any, Any]]) -> int:
+        return sum(
+            child.snapshot_size(child_snapshot)
+            for child, child_snapshot in snapshot.values()
+            if child is not None
+        )
+
+    def convert(self, snapshot: dict[str, tuple[Any, Any]]) -> dict[str, Any]:
+        return {
+            name: child.convert(child_snapshot) if child is not None else child_snapshot
+            for name, (child, child_snapshot) in snapshot.items()
+        }
+
+
+class ServiceResource(JsonResource):
+    """Service resource, returns requests, bytes out and render and serialisation times of every resource"""
+
+    isLeaf = True
+    # set by RootResource
+    instrumentation: Instrumentation | None = None
+
+    def snapshot(self, request: Request) -> dict[str, Any]:
+        if self.instrumentation is None:
+            return {}
+        # histograms are updated on the reactor thread, copy them here
+        return self.instrumentation.to_dict()
 
 
 class RootResource(Resource):
     """Root resource, only used for the /info/ endpoint, no other uses"""
 
     def __init__(
-        self, crawler: Crawler, childs: list = [dict], child_prefix: str = "child_"
+        self,
+        crawler: Crawler,
+        childs: list = [dict],
+        child_prefix: str = "child_",
+        serialization_pool: SerializationPool | None = None,
+        compressor: ResponseCompressor | None = None,
+        cache_ttl: float | dict[str, float] = 0.0,
+        rate_limiter: RateLimiter | None = None,
     ):
         super().__init__()
 
         self.logger.debug(
             f"Creating RootResource for crawler {crawler} with childs: {childs}"
         )
+        self.instrumentation = Instrumentation()
+        self.rate_limiter = rate_limiter
         NOTSET = object()
         for child in childs:
             _class = load_object(child["class"])
@@ -165,5 +1392,47 @@ class RootResource(Resource):
                 self.logger.error("???")
                 continue
 
-            self.putChild(child["name"], inst)
-            setattr(self, child_prefix + child["name"].decode(), inst)
+            if isinstance(inst, JsonResource):
+                inst.serialization_pool = serialization_pool
+                inst.compressor = compressor
+                ttl = child.get("cache_ttl")
+                if ttl is None and isinstance(cache_ttl, dict):
+                    ttl = cache_ttl.get(child["name"].decode(), 0.0)
+                inst.cache_ttl = float(cache_ttl if ttl is None else ttl)
+            if isinstance(inst, BatchResource):
+                inst.root = self
+            if isinstance(inst, ServiceResource):
+                inst.instrumentation = self.instrumentation
+            if isinstance(inst, Resource):
+                inst.resource_stats = self.instrumentation.resource(
+                    child["name"].decode()
+                )
+            # nested names like b"stats/history" are put into parent resource
+            *parents, name = child["name"].split(b"/")
+            parent = self
+            for parent_name in parents:
+                parent = parent.children[parent_name]
+            parent.putChild(name, inst)
+            setattr(self, child_prefix + child["name"].decode().replace("/", "_"), inst)
+
+    def getChildWithDefault(self, path: bytes, request: Request) -> resource.Resource:
+        if self.rate_limiter is not None:
+            retry_after = self.rate_limiter.acquire(client_key(request))
+            if retry_after:
+                self.instrumentation.rate_limited += 1
+                return RateLimitedResource(retry_after)
+        return super().getChildWithDefault(path, request)
+
+
+class RateLimitedResource(resource.Resource):
+    """Rejects requests of client which is out of tokens with 429"""
+
+    isLeaf = True
+
+    def __init__(self, retry_after: float):
+        super().__init__()
+        self.retry_after = retry_after
+
+    def render(self, request: Request) -> bytes:
+        request.setHeader(b"Retry-After", str(math.ceil(self.retry_after)).encode())
+        return error_as_bytes(request, 429, "Too many requests")
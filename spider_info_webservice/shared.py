@@ -0,0 +1,135 @@
+"""One info service for all crawlers of a process.
+
+With ``INFO_SERVICE_SHARED = True`` the first crawler of e.g. ``CrawlerProcess``
+starts listening, every crawler's resources are served under
+``/info/<crawler id>/``, ``/info/crawlers`` lists them and ``/info/rollup``
+sums their stats. Listener stops when the last crawler stops.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from twisted.web import resource, server
+
+from .aggregator import sum_stats
+from .auth import AuthResource
+from .resources import JsonResource
+from .utils import get_process_data, listen
+
+if TYPE_CHECKING:
+    from typing import Any
+
+    from twisted.internet.defer import Deferred
+    from twisted.internet.tcp import Port
+    from twisted.web.http import Request
+
+    from . import InfoService
+    from .auth import CredentialsChecker
+
+_service: SharedService | None = None
+
+
+def get_shared_service(
+    credentials_checker: CredentialsChecker,
+    host,
+    portrange,
+    unix_socket: str | None = None,
+) -> SharedService:
+    """Return service of the process, start it with arguments of the first
+    crawler asking for it"""
+    global _service
+    if _service is None:
+        _service = SharedService(credentials_checker, host, portrange, unix_socket)
+    return _service
+
+
+class SharedService:
+    def __init__(
+        self,
+        credentials_checker: CredentialsChecker,
+        host,
+        portrange,
+        unix_socket: str | None = None,
+    ):
+        self.crawlers: dict[str, InfoService] = {}
+        self.root = resource.Resource()
+        self.root.putChild(b"crawlers", CrawlersResource(self))
+        self.root.putChild(b"rollup", RollupResource(self))
+        r = resource.Resource()
+        r.putChild(b"info", self.root)
+        self.port: Port = listen(
+            server.Site(AuthResource(r, credentials_checker)),
+            host,
+            portrange,
+            unix_socket,
+        )
+
+    def crawler_id(self, preferred: str) -> str:
+        """``preferred`` id or, if it's taken, ``preferred`` with a number"""
+        crawler_id, n = preferred, 1
+        while crawler_id.encode() in self.root.children:
+            n += 1
+            crawler_id = f"{preferred}-{n}"
+        return crawler_id
+
+    def register(
+        self, crawler_id: str, info_service: InfoService, root: resource.Resource
+    ) -> None:
+        self.crawlers[crawler_id] = info_service
+        self.root.putChild(crawler_id.encode(), root)
+
+    def unregister(self, crawler_id: str) -> Deferred | None:
+        """Stop listening if it was the last crawler"""
+        global _service
+        if self.crawlers.pop(crawler_id, None) is None:
+            return None
+        del self.root.children[crawler_id.encode()]
+        if self.crawlers:
+            return None
+        if _service is self:
+            _service = None
+        return self.port.stopListening()
+
+
+class CrawlersResource(JsonResource):
+    """Crawlers resource, returns crawlers served by the process and their paths"""
+
+    isLeaf = True
+
+    def __init__(self, service: SharedService):
+        super().__init__()
+        self.service = service
+
+    def snapshot(self, request: Request) -> dict[str, Any]:
+        return {
+            **get_process_data(),
+            "crawlers": [
+                {
+                    "crawler_id": crawler_id,
+                    "spider_name": info_service.general_data.get("spider_name"),
+                    "path": f"/info/{crawler_id}/",
+                    "running": info_service.crawler.engine.running,
+                }
+                for crawler_id, info_service in self.service.crawlers.items()
+            ],
+        }
+
+
+class RollupResource(JsonResource):
+    """Rollup resource, returns sums of numeric stats of all crawlers"""
+
+    isLeaf = True
+
+    def __init__(self, service: SharedService):
+        super().__init__()
+        self.service = service
+
+    def snapshot(self, request: Request) -> list[dict[str, Any]]:
+        return [
+            dict(info_service.crawler.stats.get_stats())
+            for info_service in self.service.crawlers.values()
+        ]
+
+    def convert(self, snapshot: list[dict[str, Any]]) -> dict[str, Any]:
+        return {"crawlers": len(snapshot), "stats": sum_stats(snapshot)}
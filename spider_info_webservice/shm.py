@@ -0,0 +1,415 @@
+"""Stats snapshots in memory-mapped files, readable without requests to spiders.
+
+With ``INFO_SERVICE_SHM_DIR`` every spider writes ``<dir>/<spider id>.snapshot``
+every ``INFO_SERVICE_SHM_INTERVAL`` seconds, sum them up with::
+
+    python -m spider_info_webservice.shm /run/scrapy-info [--per-spider] [--all]
+
+File layout: 64 bytes header, ``capacity`` float64 values (numeric stats and
+engine status) and JSON with names of values and general data. JSON is
+rewritten only when new names appear, ``keys_version`` in the header tells
+readers when to decode it again. Header's ``seq`` is odd while writer updates
+the file, readers retry when it is odd or changed while they read.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from time import time
+from typing import TYPE_CHECKING
+
+from twisted.internet import task
+
+from .openmetrics import metric_value
+
+if TYPE_CHECKING:
+    from typing import Any, Callable, Iterable, Iterator
+
+    from scrapy.statscollectors import StatsCollector
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SIWS"
+FORMAT_VERSION = 1
+# magic, format version, flags, seq, timestamp, count, capacity,
+# json offset, json length, keys version
+HEADER = struct.Struct("<4sHHQdIIIIQ")
+HEADER_SIZE = 64
+SEQ = struct.Struct("<Q")
+SEQ_OFFSET = 8
+FINISHED = 1
+SUFFIX = ".snapshot"
+
+STATS = 0
+ENGINE = 1
+
+NAN = float("nan")
+
+
+class SnapshotPublisher:
+    """Writes numeric ``stats``, ``engine_status()`` and ``general_data`` to ``path``.
+
+    At most ``max_keys`` different names are written, names appearing later
+    are skipped. Only the reactor thread writes, readers in other processes
+    never block it.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        stats: StatsCollector,
+        engine_status: Callable[[], Iterable[tuple[str, Any]]] | None = None,
+        general_data: dict[str, Any] | None = None,
+        max_keys: int = 1024,
+    ):
+        self.path = path
+        self.stats = stats
+        self.engine_status = engine_status
+        self.general_data = general_data if general_data is not None else {}
+        self.capacity = max_keys
+        self.json_offset = HEADER_SIZE + 8 * max_keys
+        self.size = self.json_offset + 64 * 1024 + 128 * max_keys
+        self.keys: list[tuple[int, str]] = []
+        self.index: dict[tuple[int, str], int] = {}
+        self.keys_version = 0
+        self.seq = 0
+        self.json_length = 0
+        self._json_dirty = True
+        # general data as last written, it's changed in place, e.g. on lazy start
+        self._general_json: str | None = None
+        self.flags = 0
+        self.mm: mmap.mmap | None = None
+        self.values: memoryview | None = None
+        self._loop: task.LoopingCall | None = None
+
+    def open(self) -> None:
+        """Create the file next to ``path`` and move it into place, readers of
+        a previous file at ``path`` keep its (old) inode instead of having it
+        truncated under their mappings"""
+        directory, name = os.path.split(self.path)
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", dir=directory or None)
+        try:
+            os.fchmod(fd, 0o640)
+            os.ftruncate(fd, self.size)
+            self.mm = mmap.mmap(fd, self.size, access=mmap.ACCESS_WRITE)
+            self._write_header(0, 0.0)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if self.mm is not None:
+                self.mm.close()
+                self.mm = None
+            os.unlink(tmp_path)
+            raise
+        finally:
+            os.close(fd)
+        self.values = memoryview(self.mm)[
+            HEADER_SIZE : HEADER_SIZE + 8 * self.capacity
+        ].cast("d")
+
+    def _write_header(self, count: int, timestamp: float) -> None:
+        HEADER.pack_into(
+            self.mm,
+            0,
+            MAGIC,
+            FORMAT_VERSION,
+            self.flags,
+            self.seq,
+            timestamp,
+            count,
+            self.capacity,
+            self.json_offset,
+            self.json_length,
+            self.keys_version,
+        )
+
+    def _index(self, kind: int, name: str) -> int | None:
+        key = (kind, name)
+        i = self.index.get(key)
+        if i is None:
+            if len(self.keys) >= self.capacity:
+                return None
+            i = self.index[key] = len(self.keys)
+            self.keys.append(key)
+            self._json_dirty = True
+        return i
+
+    def _collect(self) -> array:
+        items: list[tuple[int, str, Any]] = [
+            (STATS, key, value) for key, value in self.stats.get_stats().items()
+        ]
+        if self.engine_status is not None:
+            items.extend((ENGINE, key, value) for key, value in self.engine_status())
+        updates = []
+        for kind, name, value in items:
+            value = metric_value(value)
+            if value is None:
+                continue
+            i = self._index(kind, name)
+            if i is not None:
+                updates.append((i, value))
+        values = array("d", [NAN]) * len(self.keys)
+        for i, value in updates:
+            values[i] = value
+        return values
+
+    def _encode_json(self) -> bytes:
+        room = self.size - self.json_offset
+        data = json.dumps(
+            {"keys": self.keys, "general": self.general_data}, default=str
+        ).encode()
+        if len(data) > room and self.general_data:
+            logger.warning(f"General data doesn't fit into {self.path}, skipped")
+            data = json.dumps({"keys": self.keys, "general": {}}).encode()
+        if len(data) > room:
+            # long names, the latest ones are skipped from now on
+            keep = len(self.keys)
+            while len(data) > room:
+                keep = min(keep - 1, keep * 9 // 10)
+                data = json.dumps({"keys": self.keys[:keep], "general": {}}).encode()
+            logger.warning(
+                f"Names of {len(self.keys) - keep} stats don't fit into {self.path}, "
+                f"skipped"
+            )
+            for key in self.keys[keep:]:
+                del self.index[key]
+            del self.keys[keep:]
+            self.capacity = keep
+        return data
+
+    def publish(self) -> None:
+        if self.mm is None:
+            self.open()
+        values = self._collect()
+        general_json = json.dumps(self.general_data, default=str)
+        if general_json != self._general_json:
+            self._general_json = general_json
+            self._json_dirty = True
+        data = None
+        if self._json_dirty:
+            data = self._encode_json()
+            values = values[: len(self.keys)]
+            self.keys_version += 1
+            self._json_dirty = False
+
+        self.seq += 1  # odd, readers wait
+        SEQ.pack_into(self.mm, SEQ_OFFSET, self.seq)
+        try:
+            self.values[: len(values)] = memoryview(values)
+            if data is not None:
+                self.mm[self.json_offset : self.json_offset + len(data)] = data
+                self.json_length = len(data)
+            self._write_header(len(values), time())
+        finally:
+            self.seq += 1  # even again, after everything else is written
+            SEQ.pack_into(self.mm, SEQ_OFFSET, self.seq)
+
+    def start(self, interval: float) -> None:
+        self.publish()
+        self._loop = task.LoopingCall(self.publish)
+        self._loop.start(interval, now=False)
+
+    def stop(self) -> None:
+        """Publish final snapshot marked as finished and close the file"""
+        if self._loop is not None and self._loop.running:
+            self._loop.stop()
+        if self.mm is None:
+            return
+        self.flags |= FINISHED
+        self.publish()
+        self.values.release()
+        self.mm.close()
+        self.mm = None
+
+
+class Snapshot:
+    __slots__ = ("timestamp", "finished", "general", "keys", "values")
+
+    def __init__(
+        self,
+        timestamp: float,
+        finished: bool,
+        general: dict[str, Any],
+        keys: list[tuple[int, str]],
+        values: array,
+    ):
+        self.timestamp = timestamp
+        self.finished = finished
+        self.general = general
+        self.keys = keys
+        self.values = values
+
+    def _items(self, kind: int) -> dict[str, float]:
+        return {
+            name: value
+            for (key_kind, name), value in zip(self.keys, self.values)
+            if key_kind == kind and not math.isnan(value)
+        }
+
+    @property
+    def stats(self) -> dict[str, float]:
+        return self._items(STATS)
+
+    @property
+    def engine(self) -> dict[str, float]:
+        return self._items(ENGINE)
+
+
+class SnapshotReader:
+    """Reads consistent snapshots of a file written by ``SnapshotPublisher``.
+    Decoded names are reused until writer changes them."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._keys_version = -1
+        self.keys: list[tuple[int, str]] = []
+        self.general: dict[str, Any] = {}
+
+    def read(self, attempts: int = 1000) -> Snapshot | None:
+        """Return ``None`` if file is not written yet or is being written
+        all the ``attempts``"""
+        mm = self.mm
+        for _ in range(attempts):
+            (
+                magic,
+                _,
+                flags,
+                seq,
+                timestamp,
+                count,
+                _,
+                json_offset,
+                json_length,
+                keys_version,
+            ) = HEADER.unpack_from(mm, 0)
+            if magic != MAGIC or keys_version == 0:
+                return None
+            if seq & 1:
+                continue
+            values = array("d")
+            values.frombytes(mm[HEADER_SIZE : HEADER_SIZE + 8 * count])
+            data = None
+            if keys_version != self._keys_version:
+                data = mm[json_offset : json_offset + json_length]
+            if SEQ.unpack_from(mm, SEQ_OFFSET)[0] != seq:
+                continue
+            if data is not None:
+                decoded = json.loads(data)
+                self.keys = [(kind, name) for kind, name in decoded["keys"]]
+                self.general = decoded["general"]
+                self._keys_version = keys_version
+            return Snapshot(
+                timestamp, bool(flags & FINISHED), self.general, self.keys, values
+            )
+        return None
+
+    def close(self) -> None:
+        self.mm.close()
+
+
+class SnapshotDirectory:
+    """Readers of all snapshot files in ``path``, kept open between ``refresh``es"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.readers: dict[str, SnapshotReader] = {}
+
+    def refresh(self) -> None:
+        seen = set()
+        for entry in os.scandir(self.path):
+            if not entry.name.endswith(SUFFIX):
+                continue
+            spider_id = entry.name[: -len(SUFFIX)]
+            seen.add(spider_id)
+            reader = self.readers.get(spider_id)
+            inode = entry.inode()
+            if reader is not None and reader.inode == inode:
+                continue
+            if reader is not None:
+                reader.close()
+            try:
+                self.readers[spider_id] = SnapshotReader(entry.path)
+            except (OSError, ValueError):
+                # removed or still empty
+                self.readers.pop(spider_id, None)
+        for spider_id in set(self.readers) - seen:
+            self.readers.pop(spider_id).close()
+
+    def snapshots(self) -> Iterator[tuple[str, Snapshot]]:
+        self.refresh()
+        for spider_id, reader in self.readers.items():
+            snapshot = reader.read()
+            if snapshot is not None:
+                yield spider_id, snapshot
+
+    def aggregate(
+        self, include_finished: bool = False, per_spider: bool = False
+    ) -> dict[str, Any]:
+        totals: dict[str, float] = {}
+        spiders: dict[str, Any] = {}
+        count = finished = 0
+        for spider_id, snapshot in self.snapshots():
+            if snapshot.finished:
+                finished += 1
+                if not include_finished:
+                    continue
+            count += 1
+            for (kind, name), value in zip(snapshot.keys, snapshot.values):
+                if kind == STATS and not math.isnan(value):
+                    totals[name] = totals.get(name, 0) + value
+            if per_spider:
+                spiders[spider_id] = {
+                    "spider_name": snapshot.general.get("spider_name"),
+                    "timestamp": snapshot.timestamp,
+                    "finished": snapshot.finished,
+                    "stats": snapshot.stats,
+                    "engine": snapshot.engine,
+                }
+        result: dict[str, Any] = {
+            "spiders": count,
+            "finished": finished,
+            "stats": dict(sorted(totals.items())),
+        }
+        if per_spider:
+            result["per_spider"] = spiders
+        return result
+
+    def close(self) -> None:
+        for reader in self.readers.values():
+            reader.close()
+        self.readers.clear()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m spider_info_webservice.shm", description=__doc__
+    )
+    parser.add_argument("directory", help="INFO_SERVICE_SHM_DIR of spiders")
+    parser.add_argument("--all", action="store_true", help="include finished spiders")
+    parser.add_argument(
+        "--per-spider", action="store_true", help="include every spider's snapshot"
+    )
+    args = parser.parse_args(argv)
+
+    directory = SnapshotDirectory(args.directory)
+    try:
+        result = directory.aggregate(args.all, args.per_spider)
+    finally:
+        directory.close()
+    json.dump(result, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+from scrapy.statscollectors import MemoryStatsCollector
+
+if TYPE_CHECKING:
+    from typing import Any
+
+    from scrapy import Spider
+    from scrapy.crawler import Crawler
+
+
+class VersionedStatsMixin:
+    """Keeps a monotonic version of stats and the version each key was last changed at,
+    so changes since some version could be found without looking at unchanged keys.
+
+    Mix it into stats collector class, e.g.
+    ``class MyStatsCollector(VersionedStatsMixin, MyBaseStatsCollector)``.
+    Changes made directly to ``get_stats()`` dict are not tracked.
+    """
+
+    def __init__(self, crawler: Crawler):
+        super().__init__(crawler)
+        self.version = 0
+        self._reset_version = 0
+        # key -> version it was changed at, ordered by change
+        self._changes: OrderedDict[str, int] = OrderedDict()
+
+    def _changed(self, key: str) -> None:
+        self.version += 1
+        self._changes[key] = self.version
+        self._changes.move_to_end(key)
+
+    def _reset(self) -> None:
+        self.version += 1
+        self._reset_version = self.version
+        self._changes.clear()
+
+    def set_value(self, key: str, value: Any, spider: Spider | None = None) -> None:
+        super().set_value(key, value, spider)
+        self._changed(key)
+
+    def inc_value(
+        self, key: str, count: int = 1, start: int = 0, spider: Spider | None = None
+    ) -> None:
+        super().inc_value(key, count, start, spider)
+        self._changed(key)
+
+    def max_value(self, key: str, value: Any, spider: Spider | None = None) -> None:
+        old = self.get_value(key, spider=spider)
+        super().max_value(key, value, spider)
+        if old is None or self.get_value(key, spider=spider) != old:
+            self._changed(key)
+
+    def min_value(self, key: str, value: Any, spider: Spider | None = None) -> None:
+        old = self.get_value(key, spider=spider)
+        super().min_value(key, value, spider)
+        if old is None or self.get_value(key, spider=spider) != old:
+            self._changed(key)
+
+    def set_stats(self, stats: dict[str, Any], spider: Spider | None = None) -> None:
+        super().set_stats(stats, spider)
+        self._reset()
+
+    def clear_stats(self, spider: Spider | None = None) -> None:
+        super().clear_stats(spider)
+        self._reset()
+
+    def get_stats_since(
+        self, since: int, spider: Spider | None = None
+    ) -> tuple[int, dict[str, Any], bool]:
+        """Return ``(version, stats, full)``.
+
+        ``stats`` contains only keys changed after ``since`` version, unless
+        stats were replaced or cleared after it (or ``since`` is unknown),
+        then ``full`` is ``True`` and ``stats`` contains all the keys.
+        """
+        stats = self.get_stats(spider)
+        if since <= self._reset_version or since > self.version:
+            return self.version, dict(stats), True
+
+        changed = {}
+        for key in reversed(self._changes):
+            if self._changes[key] <= since:
+                break
+            if key in stats:
+                changed[key] = stats[key]
+        return self.version, changed, False
+
+
+class VersionedStatsCollector(VersionedStatsMixin, MemoryStatsCollector):
+    """``MemoryStatsCollector`` with versions, allows ``/info/stats?since=<version>``"""
@@ -1,23 +1,27 @@
 from __future__ import annotations
 
+import hashlib
 import inspect
 import re
-from typing import TYPE_CHECKING, Iterable, Sequence
+from functools import lru_cache
+from time import monotonic
+from typing import TYPE_CHECKING, Callable, Iterable, Sequence
 
 from scrapy.settings import BaseSettings, iter_default_settings
 from scrapy.utils.conf import get_config
 from scrapy.utils.reactor import listen_tcp
-from twisted.cred.checkers import InMemoryUsernamePasswordDatabaseDontUse
-from twisted.cred.portal import IRealm, Portal
-from twisted.web import guard, resource, server
-from zope.interface import implementer
+from twisted.web import resource, server
 
 if TYPE_CHECKING:
-    from typing import Any
+    from typing import Any, Hashable
 
+    from scrapy import Request as ScrapyRequest
+    from twisted.internet.defer import Deferred
     from twisted.internet.tcp import Port
     from twisted.web import resource
+    from twisted.web.http import Request
 
+    from .auth import CredentialsChecker
     from .resources import RootResource
 
 try:
@@ -41,6 +45,98 @@ else:
         return orjson.dumps(obj, **kwargs, default=default)
 
 
+def _gzip_compress(body: bytes, level: int) -> bytes:
+    import gzip
+
+    return gzip.compress(body, compresslevel=max(1, min(level, 9)))
+
+
+COMPRESSORS: dict[bytes, Callable[[bytes, int], bytes]] = {b"gzip": _gzip_compress}
+
+try:
+    try:
+        from compression import zstd  # type: ignore
+    except ImportError:
+        from backports import zstd  # type: ignore
+except ImportError:
+    try:
+        import zstandard  # type: ignore
+    except ImportError:
+        pass
+    else:
+        COMPRESSORS[b"zstd"] = lambda body, level: zstandard.ZstdCompressor(
+            level=max(1, min(level, 22))
+        ).compress(body)
+else:
+    COMPRESSORS[b"zstd"] = lambda body, level: zstd.compress(
+        body, level=max(1, min(level, 22))
+    )
+
+try:
+    try:
+        import brotli  # type: ignore
+    except ImportError:
+        import brotlicffi as brotli  # type: ignore
+except ImportError:
+    pass
+else:
+    COMPRESSORS[b"br"] = lambda body, level: brotli.compress(
+        body, quality=max(0, min(level, 11))
+    )
+
+
+class ResponseCompressor:
+    """Compresses response bodies with encoding negotiated from ``Accept-Encoding``.
+
+    gzip is always available, zstd and br when ``zstandard`` (or ``compression.zstd``)
+    and ``brotli`` (or ``brotlicffi``) are importable. Bodies shorter than
+    ``min_size`` are not compressed.
+    """
+
+    preference = (b"zstd", b"br", b"gzip")
+
+    def __init__(self, min_size: int = 1024, level: int = 6):
+        self.min_size = min_size
+        self.level = level
+        self.encodings = [name for name in self.preference if name in COMPRESSORS]
+
+    def negotiate(self, request: Request) -> bytes | None:
+        accept_encoding = request.getHeader(b"accept-encoding")
+        if not accept_encoding:
+            return None
+        qualities = {}
+        for item in accept_encoding.lower().split(b","):
+            name, _, params = item.partition(b";")
+            quality = 1.0
+            params = params.strip()
+            if params.startswith(b"q="):
+                try:
+                    quality = float(params[2:])
+                except ValueError:
+                    quality = 0.0
+            qualities[name.strip()] = quality
+        default = qualities.get(b"*", 0.0)
+        best, best_quality = None, 0.0
+        for name in self.encodings:
+            quality = qualities.get(name, default)
+            if quality > best_quality:
+                best, best_quality = name, quality
+        return best
+
+    def compress(self, body: bytes, encoding: bytes | None) -> bytes | None:
+        """Return compressed body, or ``None`` if it shouldn't be compressed"""
+        if encoding is None or len(body) < self.min_size:
+            return None
+        return COMPRESSORS[encoding](body, self.level)
+
+
+def bytes_to_str(obj):
+    """``default`` for ``dumps_as_bytes``, decodes bytes and stringifies everything else"""
+    if isinstance(obj, bytes):
+        return obj.decode()
+    return str(obj)
+
+
 def build_single_regexp_for_keys(keys: list[str]) -> re.Pattern:
     return re.compile("|".join(f"({key})" for key in keys))
 
@@ -54,6 +150,211 @@ def hide_sensitive_data(data: dict[str, Any], regerxp: re.Pattern) -> None:
             hide_sensitive_data(value, regerxp)
 
 
+class BadRequest(ValueError):
+    """Raised when query arguments of a request can't be used"""
+
+
+def get_arg(request: Request, name: bytes, default: Any = None) -> Any:
+    """Return first value of query argument ``name`` decoded to str or ``default``"""
+    values = request.args.get(name)
+    if not values:
+        return default
+    return values[0].decode()
+
+
+def get_int_arg(
+    request: Request, name: bytes, default: int | None = None, minimum: int = 0
+) -> int | None:
+    value = get_arg(request, name)
+    if value is None or value == "":
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise BadRequest(f"{name.decode()} must be an integer, got {value!r}")
+    if value < minimum:
+        raise BadRequest(f"{name.decode()} must be >= {minimum}, got {value}")
+    return value
+
+
+def get_list_arg(request: Request, name: bytes) -> list[str] | None:
+    """Return comma separated (or repeated) query argument as list of str"""
+    values = request.args.get(name)
+    if not values:
+        return None
+    return [
+        item.strip()
+        for value in values
+        for item in value.decode().split(",")
+        if item.strip()
+    ]
+
+
+class SerializationPool:
+    """Bounded thread pool for serialising responses off the reactor thread.
+
+    Only snapshots with at least ``threshold`` top level entries are offloaded,
+    small ones are cheaper to serialise in place.
+    """
+
+    def __init__(self, size: int = 2, threshold: int = 1000):
+        from twisted.python.threadpool import ThreadPool
+
+        self.threshold = threshold
+        self.threadpool = ThreadPool(minthreads=0, maxthreads=size, name="info-service")
+
+    def should_offload(self, size: int) -> bool:
+        return size >= self.threshold
+
+    def start(self) -> None:
+        self.threadpool.start()
+
+    def stop(self) -> None:
+        self.threadpool.stop()
+
+    def run(self, f, *args, **kwargs) -> Deferred:
+        from twisted.internet import reactor
+        from twisted.internet.threads import deferToThreadPool
+
+        return deferToThreadPool(reactor, self.threadpool, f, *args, **kwargs)
+
+
+class RateLimiter:
+    """Token bucket per client: ``rate`` requests per second on average,
+    up to ``burst`` at once.
+
+    At most ``max_clients`` buckets are kept, when there are more, buckets
+    of clients that are idle long enough to have them full are dropped.
+    """
+
+    def __init__(self, rate: float, burst: int = 10, max_clients: int = 10_000):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_clients = max_clients
+        # client -> [tokens, time of last update]
+        self.buckets: dict[Hashable, list[float]] = {}
+
+    def acquire(self, client: Hashable, now: float | None = None) -> float:
+        """Take a token of ``client``, return 0 if it had one or seconds
+        until it will have one"""
+        if now is None:
+            now = monotonic()
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            if len(self.buckets) >= self.max_clients:
+                self.prune(now)
+            bucket = self.buckets[client] = [float(self.burst), now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / self.rate
+
+    def prune(self, now: float) -> None:
+        full = self.burst / self.rate
+        self.buckets = {
+            client: bucket
+            for client, bucket in self.buckets.items()
+            if now - bucket[1] < full
+        }
+        if len(self.buckets) >= self.max_clients:
+            self.buckets.clear()
+
+
+def client_key(request: Request) -> Hashable:
+    """Client of ``request`` for per-client limits: its IP address or, for
+    connections over Unix socket, address the front forwarded the request
+    from (only local processes could connect to the socket, so the header is
+    trusted), or the connection itself"""
+    host = getattr(request.getClientAddress(), "host", None)
+    if host is not None:
+        return host
+    forwarded = request.getHeader(b"x-forwarded-for")
+    if forwarded:
+        return forwarded.split(b",")[-1].strip().decode(errors="replace")
+    return ("connection", id(request.channel))
+
+
+def finish_with(request: Request, d: Deferred) -> int:
+    """Write body produced by ``d`` to ``request`` and finish it.
+    Returns ``NOT_DONE_YET``, so it could be returned from ``render``."""
+    from . import logger
+
+    disconnected = []
+    request.notifyFinish().addErrback(disconnected.append)
+
+    def write(body: bytes) -> None:
+        if disconnected:
+            return
+        request.write(body)
+        request.finish()
+
+    def fail(failure) -> None:
+        logger.error(f"Failed to render {request.uri!r}: {failure.getErrorMessage()}")
+        if disconnected:
+            return
+        request.setResponseCode(500)
+        request.write(dumps_as_bytes({"error": "Internal server error"}))
+        request.finish()
+
+    d.addCallbacks(write, fail)
+    return server.NOT_DONE_YET
+
+
+def make_etag(body: bytes) -> bytes:
+    """Strong ETag for the body"""
+    return b'"' + hashlib.sha1(body).hexdigest().encode() + b'"'
+
+
+def error_as_bytes(request: Request, code: int, message: str) -> bytes:
+    request.setResponseCode(code)
+    request.setHeader(b"Content-Type", b"application/json")
+    return dumps_as_bytes({"error": message})
+
+
+class SensitiveDataRedactor:
+    """Return copies of data with values of sensitive keys replaced with asterisks.
+
+    Key is sensitive if it matches any of ``keys`` regexps. Every key path is
+    matched only once, results are kept in ``plan``, so next calls only match
+    keys that weren't seen before. Dicts inside lists and tuples are redacted too.
+    """
+
+    placeholder = "******"
+
+    def __init__(self, keys: list[str]):
+        self.regexp = build_single_regexp_for_keys(keys) if keys else None
+        self.plan: dict[tuple, bool] = {}
+
+    def is_sensitive(self, path: tuple) -> bool:
+        try:
+            return self.plan[path]
+        except KeyError:
+            sensitive = self.regexp is not None and bool(
+                self.regexp.match(str(path[-1]))
+            )
+            self.plan[path] = sensitive
+            return sensitive
+
+    def redact(self, data: Any, path: tuple = ()) -> Any:
+        if isinstance(data, dict):
+            redacted = {}
+            for key, value in data.items():
+                key_path = path + (key,)
+                if self.is_sensitive(key_path):
+                    redacted[key] = self.placeholder
+                else:
+                    redacted[key] = self.redact(value, key_path)
+            return redacted
+        if isinstance(data, list):
+            return [self.redact(value, path) for value in data]
+        if isinstance(data, tuple):
+            return tuple(self.redact(value, path) for value in data)
+        return data
+
+
 def get_project_name_from_config() -> str:
     config = dict(get_config())
 
@@ -66,27 +367,90 @@ def get_project_name_from_config() -> str:
     return "None. No project name found"
 
 
+@lru_cache(maxsize=None)
+def get_process_data() -> dict[str, Any]:
+    """General data that is the same for all crawlers of the process,
+    computed once"""
+    import scrapy
+    from scrapy.utils.versions import scrapy_components_versions
+
+    return {
+        "project_name": get_project_name_from_config(),
+        "base_versions": {
+            "Scrapy": scrapy.__version__,
+            **{name: version for name, version in scrapy_components_versions()},
+        },
+    }
+
+
 def create(
-    users: dict[str, bytes], host, portrange, crawler, resources, resources_child_prefix
+    users: dict[str, bytes],
+    host,
+    portrange,
+    crawler,
+    resources,
+    resources_child_prefix,
+    serialization_pool: SerializationPool | None = None,
+    compressor: ResponseCompressor | None = None,
+    credentials_checker: CredentialsChecker | None = None,
+    unix_socket: str | None = None,
+    cache_ttl: float | dict[str, float] = 0.0,
+    rate_limiter: RateLimiter | None = None,
 ) -> tuple[resource.Resource, RootResource, Port]:
+    """Listen on Unix socket ``unix_socket`` if given, otherwise on first
+    free port of ``portrange``"""
+    from .auth import AuthResource, CredentialsChecker
     from .resources import RootResource
 
-    checkers = [InMemoryUsernamePasswordDatabaseDontUse(**users)]
+    if credentials_checker is None:
+        credentials_checker = CredentialsChecker(users)
     r = resource.Resource()
-    root_resource = RootResource(crawler, resources, resources_child_prefix)
-    r.putChild(b"info", root_resource)
-    portal = Portal(SimpleRealm(r), checkers)
-    r2 = guard.HTTPAuthSessionWrapper(portal, [guard.BasicCredentialFactory("auth")])
-
-    return (
-        r,
-        root_resource,
-        listen_tcp(
-            portrange=portrange,
-            host=host,
-            factory=server.Site(r2),
-        ),
+    root_resource = RootResource(
+        crawler,
+        resources,
+        resources_child_prefix,
+        serialization_pool,
+        compressor,
+        cache_ttl=cache_ttl,
+        rate_limiter=rate_limiter,
     )
+    r.putChild(b"info", root_resource)
+    r2 = AuthResource(r, credentials_checker)
+    return r, root_resource, listen(server.Site(r2), host, portrange, unix_socket)
+
+
+def listen(
+    factory: server.Site, host, portrange, unix_socket: str | None = None
+) -> Port:
+    """Listen on Unix socket ``unix_socket`` if given, otherwise on first
+    free port of ``portrange``"""
+    if unix_socket is not None:
+        from twisted.internet import reactor
+
+        # lock file lets stale socket of dead process be replaced
+        return reactor.listenUNIX(unix_socket, factory, mode=0o660, wantPID=True)
+
+    return listen_tcp(portrange=portrange, host=host, factory=factory)
+
+
+class LazyResource(resource.Resource):
+    """Resource built by ``factory`` on the first request to it or its children"""
+
+    def __init__(self, factory: Callable[[], resource.Resource]):
+        super().__init__()
+        self.factory = factory
+        self.wrapped: resource.Resource | None = None
+
+    def load(self) -> resource.Resource:
+        if self.wrapped is None:
+            self.wrapped = self.factory()
+        return self.wrapped
+
+    def getChildWithDefault(self, path: bytes, request: Request) -> resource.Resource:
+        return self.load().getChildWithDefault(path, request)
+
+    def render(self, request: Request) -> bytes | int:
+        return self.load().render(request)
 
 
 def convert_value(value):
@@ -113,9 +477,15 @@ def prepare_for_serialisation(dict_: BaseSettings | dict) -> dict[str, Any]:
     return dictionary
 
 
+@lru_cache(maxsize=None)
+def get_default_settings() -> dict[str, Any]:
+    """Scrapy default settings, they are read from module only once. Do not mutate"""
+    return dict(iter_default_settings())
+
+
 def not_default_settings(settings: BaseSettings) -> Iterable[tuple[str, Any]]:
     """Return an iterable of the settings that have been overridden"""
-    defset = dict(iter_default_settings())
+    defset = get_default_settings()
     for name, value in settings.items():
         if name not in defset or defset[name] != value:
             yield name, value
@@ -130,6 +500,55 @@ def convert_bytes_to_str_in_dict(dict_: dict):
     }
 
 
+def get_request_fields_arg(
+    request: Request, name: bytes = b"fields"
+) -> list[str] | None:
+    """Return ``fields`` query argument, checked against ``scrapy.Request.attributes``"""
+    from scrapy import Request as ScrapyRequest
+
+    fields = get_list_arg(request, name)
+    for field in fields or ():
+        if field.split(".")[0] not in ScrapyRequest.attributes:
+            raise BadRequest(f"Unknown request field {field!r}")
+    return fields
+
+
+def project_request(
+    request: ScrapyRequest,
+    fields: Sequence[str],
+    overrides: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    """Return only given ``fields`` of request, without calling ``request.to_dict()``.
+
+    Fields are request attributes, nested values are addressed with dots,
+    e.g. ``["url", "method", "meta.download_slot"]``.
+    Result keeps nesting: ``{"url": ..., "method": ..., "meta": {"download_slot": ...}}``.
+    ``overrides`` replace request attributes, e.g. with copies taken earlier.
+    """
+    projection: dict[str, Any] = {}
+    for field in fields:
+        attr, *path = field.split(".")
+        if overrides and attr in overrides:
+            value = overrides[attr]
+        else:
+            value = getattr(request, attr)
+        if attr in ("callback", "errback") and callable(value):
+            value = getattr(value, "__name__", str(value))
+        for part in path:
+            value = value.get(part) if isinstance(value, dict) else None
+        if isinstance(value, dict):
+            value = dict(value)  # never hand out (and later mutate) request's own dicts
+
+        *parents, last = [attr, *path]
+        target = projection
+        for part in parents:
+            if not isinstance(target.get(part), dict):
+                target[part] = {}
+            target = target[part]
+        target[last] = value
+    return prepare_for_serialisation(projection)
+
+
 def get_child_resources(resource: resource.Resource, parent_name=""):
     children = []
     for child_name, r in resource.children.items():
@@ -137,16 +556,5 @@ def get_child_resources(resource: resource.Resource, parent_name=""):
         if not name.startswith("/"):
             name = "/" + name
         children.append({"name": name, "doc": r.__doc__, "methods": ["GET"]})
-        children.extend(get_child_resources(r, child_name.decode()))
+        children.extend(get_child_resources(r, name))
     return children
-
-
-@implementer(IRealm)
-class SimpleRealm:
-    def __init__(self, resource: resource.Resource):
-        self.resource = resource
-
-    def requestAvatar(self, avatarId, mind, *interfaces):
-        if resource.IResource in interfaces:
-            return resource.IResource, self.resource, lambda: None
-        raise NotImplementedError()
@@ -9,7 +9,9 @@ from scrapy.statscollectors import StatsCollector
 from scrapy.utils.engine import get_engine_status
 from scrapy.utils.test import TestSpider, get_crawler
 from twisted.trial.unittest import TestCase
+from twisted.internet.task import deferLater
 from twisted.web.client import Agent
+from twisted.web.http_headers import Headers
 
 from spider_info_webservice import InfoService
 from spider_info_webservice.utils import not_default_settings, prepare_for_serialisation
@@ -113,6 +115,20 @@ class TestInfoService(TestCase):
         await self.crawler.signals.send_catch_log_deferred(scrapy.signals.spider_opened)
 
     async def _req(self, to: str, user: bytes, passwd: bytes, params: Optional[dict] = None):
+        resp, content = await self._request(to, user, passwd, params)
+        try:
+            return json.loads(content.decode())
+        except json.JSONDecodeError:
+            return content
+
+    async def _request(
+        self,
+        to: str,
+        user: bytes,
+        passwd: bytes,
+        params: Optional[dict] = None,
+        headers: Optional[dict] = None,
+    ):
         from base64 import b64encode
 
         from twisted.internet import reactor
@@ -129,13 +145,10 @@ class TestInfoService(TestCase):
         resp = await agent.request(
             b"GET",
             url.encode(),
-            Headers({b"authorization": [b"Basic " + authorization]}),
+            Headers({b"authorization": [b"Basic " + authorization], **(headers or {})}),
         )
         content = await readBody(resp)
-        try:
-            return json.loads(content.decode())
-        except json.JSONDecodeError:
-            return content
+        return resp, content
 
     async def tearDown(self) -> None:
         from twisted.internet import reactor
@@ -157,9 +170,12 @@ class TestInfoService(TestCase):
         from twisted.web.resource import Resource
         from twisted.web.server import Site
 
+        received = []
+
         def render(req: Request):
             general = json.loads(req.content.read().decode())
-            self.assertEqual(general, self.ext.general_data)
+            if general.get("event") != "stop":  # sent on engine stop in tearDown
+                received.append(general)
             return b"OK"
 
         r = Resource()
@@ -173,16 +189,557 @@ class TestInfoService(TestCase):
         self.addCleanup(port.stopListening)
 
         self.ext.info_report_url = f"http://127.0.0.1:{port.getHost().port}/test"
-        import urllib.error
+        await self.ext.default_start_callback()
+        await self.ext._start_report
+        self.assertEqual(received, [self.ext.general_data])
 
-        try:
-            await self.ext.default_start_callback()
-        except (
-            urllib.error.HTTPError,
-            urllib.error.HTTPError,
-            urllib.error.ContentTooShortError,
-        ):
-            self.fail()
+    async def test_start_report_not_awaited(self):
+        from twisted.internet import reactor
+        from twisted.web.resource import Resource
+        from twisted.web.server import NOT_DONE_YET, Site
+
+        received = []
+
+        class Collector(Resource):
+            isLeaf = True
+
+            def render_POST(self, request):
+                received.append(request)
+                return NOT_DONE_YET
+
+        port = reactor.listenTCP(0, Site(Collector()), interface="127.0.0.1")
+        self.addCleanup(port.stopListening)
+        self.ext.info_report_url = f"http://127.0.0.1:{port.getHost().port}/"
+        # spider_opened handler returns while collector hasn't answered yet
+        await self.ext.default_start_callback()
+        self.assertFalse(self.ext._start_report.called)
+
+        while not received:
+            await deferLater(reactor, 0.01, lambda: None)
+        received[0].write(b"OK")
+        received[0].finish()
+        await self.ext._start_report
+        self.ext.info_report_url = None
+        await self.ext.report_client.close()
+
+    async def test_aggregator(self):
+        from twisted.internet import reactor
+        from twisted.web.resource import Resource
+        from twisted.web.server import Site
+
+        from spider_info_webservice.aggregator import (
+            Aggregator,
+            SpiderRegistry,
+            build_resource,
+        )
+        from spider_info_webservice.auth import CredentialsChecker
+        from spider_info_webservice.client import HTTPClient, HTTPError
+
+        client = HTTPClient(reactor, concurrency=2, timeout=2)
+        self.addCleanup(client.close)
+        registry = SpiderRegistry()
+        aggregator = Aggregator(
+            registry, client, {b"Authorization": [b"Basic c2NyYXB5OnNjcmFweQ=="]}
+        )
+        checker = CredentialsChecker({"admin": "secret"})
+        site = Site(build_resource(aggregator, checker))
+        port = reactor.listenTCP(0, site, interface="127.0.0.1")
+        self.addCleanup(port.stopListening)
+        aggregator_url = f"http://127.0.0.1:{port.getHost().port}/"
+        admin = {b"Authorization": [b"Basic YWRtaW46c2VjcmV0"]}
+
+        # spiders report without credentials
+        self.ext.info_report_url = aggregator_url + "register"
+        await self.ext.default_start_callback()
+        await self.ext._start_report
+        spider_id = f"127.0.0.1:{self.ext.port.getHost().port}"
+        self.assertEqual(list(registry.spiders), [spider_id])
+        self.assertTrue(registry.spiders[spider_id]["trusted"])
+        with self.assertRaises(HTTPError) as e:
+            await client.get_json(aggregator_url + "stats")
+        self.assertEqual(e.exception.code, 401)
+
+        # spider that has gone away without unregistering
+        gone = reactor.listenTCP(0, Site(Resource()), interface="127.0.0.1")
+        gone_port = gone.getHost().port
+        await gone.stopListening()
+        registry.register(
+            {"info_service_host": "127.0.0.1", "info_service_port": gone_port}
+        )
+        gone_id = f"127.0.0.1:{gone_port}"
+
+        self.crawler.stats.set_stats(
+            {"log_count/ERROR": 3, "downloader/request_count": 10, "start_time": "x"}
+        )
+        stats = await client.get_json(aggregator_url + "stats", admin)
+        self.assertEqual(stats["spiders"], 1)
+        self.assertEqual(list(stats["failed"]), [gone_id])
+        self.assertEqual(stats["stats"]["downloader/request_count"], 10)
+        self.assertEqual(stats["stats"]["log_count/ERROR"], 3)
+        self.assertNotIn("start_time", stats["stats"])
+
+        status = await client.get_json(aggregator_url + "status", admin)
+        self.assertTrue(status[spider_id]["ok"])
+        self.assertEqual(status[spider_id]["spider_name"], self.crawler.spider.name)
+        self.assertIn("engine", status[spider_id])
+        self.assertFalse(status[gone_id]["ok"])
+
+        top = await client.get_json(aggregator_url + "top?n=1", admin)
+        self.assertEqual(
+            top,
+            [
+                {
+                    "id": spider_id,
+                    "spider_name": self.crawler.spider.name,
+                    "error_rate": 0.3,
+                }
+            ],
+        )
+
+        # credentials aren't sent to spiders reported by someone else
+        registry.register(self.ext.general_data, "10.0.0.1")
+        self.assertFalse(registry.spiders[spider_id]["trusted"])
+        stats = await client.get_json(aggregator_url + "stats", admin)
+        self.assertEqual(stats["failed"][spider_id], "HTTP 401")
+        url = registry.spiders[spider_id]["url"]
+        self.assertTrue(SpiderRegistry(trusted_hosts=["127.0.0.0/8"]).trusts(url))
+        self.assertTrue(SpiderRegistry(trusted_hosts=["127.0.0.1"]).trusts(url))
+        self.assertFalse(SpiderRegistry(trusted_hosts=["localhost"]).trusts(url))
+
+    async def test_reports(self):
+        from twisted.internet import reactor
+        from twisted.web.server import Site
+
+        from spider_info_webservice.aggregator import (
+            Aggregator,
+            SpiderRegistry,
+            build_resource,
+        )
+        from spider_info_webservice.client import HTTPClient
+        from spider_info_webservice.relay import RelayResource, ReportRelay
+
+        client = HTTPClient(reactor)
+        self.addCleanup(client.close)
+        registry = SpiderRegistry()
+        site = Site(build_resource(Aggregator(registry, client)))
+        aggregator_port = reactor.listenTCP(0, site, interface="127.0.0.1")
+        self.addCleanup(aggregator_port.stopListening)
+        relay = ReportRelay(
+            client, f"http://127.0.0.1:{aggregator_port.getHost().port}/register"
+        )
+        relay_port = reactor.listenTCP(
+            0, Site(RelayResource(relay)), interface="127.0.0.1"
+        )
+        self.addCleanup(relay_port.stopListening)
+
+        self.ext.info_report_url = f"http://127.0.0.1:{relay_port.getHost().port}/"
+        self.ext.report_interval = 60
+        await self.ext.default_start_callback()
+        await self.ext._start_report
+        self.assertTrue(self.ext._heartbeat_start.active())
+
+        for count in (1, 2):
+            self.crawler.stats.set_value("item_scraped_count", count)
+            await self.ext.send_heartbeat()
+        # start report and the latest heartbeat
+        self.assertEqual(len(relay.pending), 2)
+        await relay.flush()
+        spider = registry.spiders[f"127.0.0.1:{self.ext.port.getHost().port}"]
+        self.assertEqual(spider["report"], self.ext.general_data)
+        self.assertEqual(spider["stats"]["item_scraped_count"], 2)
+
+        self.ext._record_finish_reason(self.crawler.spider, "finished")
+        await self.ext.default_stop_callback()
+        self.assertFalse(self.ext._heartbeat_start.active())
+        [stop] = relay.pending.values()
+        self.assertEqual(stop["event"], "stop")
+        self.assertEqual(stop["finish_reason"], "finished")
+        self.assertEqual(stop["stats"]["item_scraped_count"], 2)
+        await relay.flush()
+        self.assertEqual(registry.spiders, {})
+        self.ext.info_report_url = None  # already reported stop
+
+    async def test_shared_service(self):
+        await self.ext._stop()
+        self.ext.shared = True
+        self.ext._start()
+        other = InfoService.from_crawler(self.crawler)
+        other.shared = True
+        other.spider_id = self.ext.spider_id
+        other._start()
+        self.assertIs(other.port, self.ext.port)
+        self.assertEqual(other.spider_id, self.ext.spider_id + "-2")
+        self.assertEqual(
+            other.general_data["info_service_path"], f"/info/{other.spider_id}/"
+        )
+        self.assertIn(
+            f"/info/{other.spider_id}/stats",
+            [r["name"] for r in other.general_data["available_resources"]],
+        )
+
+        crawlers = await self._req("crawlers", b"scrapy", b"scrapy")
+        self.assertEqual(
+            [crawler["crawler_id"] for crawler in crawlers["crawlers"]],
+            [self.ext.spider_id, other.spider_id],
+        )
+        self.assertIn("Scrapy", crawlers["base_versions"])
+        self.crawler.stats.set_stats({"item_scraped_count": 2})
+        rollup = await self._req("rollup", b"scrapy", b"scrapy")
+        self.assertEqual(rollup["crawlers"], 2)
+        self.assertEqual(rollup["stats"]["item_scraped_count"], 4)
+        stats = await self._req(f"{other.spider_id}/stats", b"scrapy", b"scrapy")
+        self.assertEqual(stats["item_scraped_count"], 2)
+
+        await other._stop()
+        crawlers = await self._req("crawlers", b"scrapy", b"scrapy")
+        self.assertEqual(len(crawlers["crawlers"]), 1)
+        await self.ext._stop()
+        self.assertFalse(self.ext.port.connected)
+
+    async def test_aggregator_shared(self):
+        from twisted.internet import reactor
+        from twisted.web.server import Site
+
+        from spider_info_webservice.aggregator import (
+            Aggregator,
+            SpiderRegistry,
+            build_resource,
+        )
+        from spider_info_webservice.client import HTTPClient
+
+        await self.ext._stop()
+        self.ext.shared = True
+        self.ext._start()
+        other = InfoService.from_crawler(self.crawler)
+        other.shared = True
+        other.spider_id = self.ext.spider_id
+        other._start()
+
+        client = HTTPClient(
+            reactor, headers={b"Authorization": [b"Basic c2NyYXB5OnNjcmFweQ=="]}
+        )
+        self.addCleanup(client.close)
+        registry = SpiderRegistry()
+        site = Site(build_resource(Aggregator(registry, client)))
+        port = reactor.listenTCP(0, site, interface="127.0.0.1")
+        self.addCleanup(port.stopListening)
+        aggregator_url = f"http://127.0.0.1:{port.getHost().port}/"
+        for ext in (self.ext, other):
+            ext.info_report_url = aggregator_url + "register"
+            await ext.send_report(ext.general_data)
+
+        address = f"127.0.0.1:{self.ext.port.getHost().port}"
+        self.assertEqual(
+            list(registry.spiders),
+            [f"{address}/{self.ext.spider_id}", f"{address}/{other.spider_id}"],
+        )
+        self.assertEqual(
+            registry.spiders[f"{address}/{other.spider_id}"]["url"],
+            f"http://{address}/info/{other.spider_id}/",
+        )
+        self.crawler.stats.set_stats({"item_scraped_count": 2})
+        stats = await client.get_json(aggregator_url + "stats")
+        self.assertEqual((stats["spiders"], stats["failed"]), (2, {}))
+        self.assertEqual(stats["stats"]["item_scraped_count"], 4)
+
+        # stop of one crawler doesn't unregister the other
+        await other.send_report(other.compact_report("stop"))
+        self.assertEqual(list(registry.spiders), [f"{address}/{self.ext.spider_id}"])
+        for ext in (self.ext, other):
+            ext.info_report_url = None
+            await ext.report_client.close()
+        await other._stop()
+
+    async def test_lazy_start(self):
+        from twisted.internet import reactor
+
+        await self.ext._stop()
+        self.ext.lazy_start = True
+        self.ext.root_resource = None
+        self.ext.general_data = {}
+        self.ext._start()
+        self.assertIsNone(self.ext.root_resource)
+        self.assertNotIn("available_resources", self.ext.general_data)
+        self.assertIn("spider_name", self.ext.general_data)
+
+        self.crawler.stats.set_stats({"item_scraped_count": 3})
+        stats = await self._req("stats", b"scrapy", b"scrapy")
+        self.assertEqual(stats["item_scraped_count"], 3)
+        self.assertIsNotNone(self.ext.root_resource)
+        general = await self._req("general", b"scrapy", b"scrapy")
+        self.assertEqual(general, self.ext.general_data)
+        self.assertIn("/info/stats", [r["name"] for r in general["available_resources"]])
+
+        await self.ext._stop()
+        self.ext.root_resource = None
+        self.ext.general_data = {}
+        self.ext._start()
+
+        reports = []
+
+        async def send_report(report):
+            reports.append(dict(report))
+
+        self.ext.send_report = send_report
+        self.ext.info_report_url = "http://127.0.0.1:1/"
+        # spider_opened handler doesn't load resources
+        await self.ext.default_start_callback()
+        self.assertIsNone(self.ext.root_resource)
+        await deferLater(reactor, 0, lambda: None)
+        self.assertIsNotNone(self.ext.root_resource)
+        self.assertIn("available_resources", reports[0])
+        self.ext.info_report_url = None
+
+    async def test_unix_socket(self):
+        import os
+        import shutil
+        import tempfile
+        import urllib.parse
+
+        from twisted.internet import reactor
+        from twisted.internet.endpoints import UNIXClientEndpoint
+        from twisted.web.client import readBody
+        from twisted.web.server import Site
+
+        from spider_info_webservice.aggregator import Aggregator, SpiderRegistry
+        from spider_info_webservice.client import HTTPClient
+        from spider_info_webservice.front import build_resource
+        from spider_info_webservice.utils import BadRequest, RateLimiter
+
+        socket_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, socket_dir, True)
+        await self.ext._stop()
+        self.ext.socket_dir = socket_dir
+        self.ext.spider_id = "test-spider"
+        self.ext._start()
+        socket_path = os.path.join(socket_dir, "test-spider.sock")
+        self.assertEqual(self.ext.general_data["info_service_socket"], socket_path)
+        self.assertIsNone(self.ext.general_data["info_service_port"])
+        self.assertTrue(os.path.exists(socket_path))
+
+        port = reactor.listenTCP(
+            0, Site(build_resource(socket_dir)), interface="127.0.0.1"
+        )
+        self.addCleanup(port.stopListening)
+        front_url = f"http://127.0.0.1:{port.getHost().port}/spiders"
+        agent = Agent(reactor)
+        headers = Headers({b"authorization": [b"Basic c2NyYXB5OnNjcmFweQ=="]})
+
+        resp = await agent.request(b"GET", front_url.encode())
+        self.assertEqual(json.loads(await readBody(resp)), ["test-spider"])
+
+        self.crawler.stats.set_value("item_scraped_count", 7)
+        resp = await agent.request(
+            b"GET", f"{front_url}/test-spider/info/stats".encode(), headers
+        )
+        self.assertEqual(resp.code, 200)
+        self.assertEqual(json.loads(await readBody(resp))["item_scraped_count"], 7)
+
+        resp = await agent.request(
+            b"GET", f"{front_url}/test-spider/info/stats".encode()
+        )
+        self.assertEqual(resp.code, 401)
+        await readBody(resp)
+
+        # aggregator reaches the spider through the front
+        registry = SpiderRegistry(front_port=port.getHost().port)
+        spider_id = registry.register(self.ext.general_data, "127.0.0.1")
+        self.assertEqual(
+            spider_id, f"127.0.0.1:{port.getHost().port}/spiders/test-spider"
+        )
+        client = HTTPClient(
+            reactor, headers={b"Authorization": [b"Basic c2NyYXB5OnNjcmFweQ=="]}
+        )
+        self.addCleanup(client.close)
+        results = await Aggregator(registry, client).fan_out("stats")
+        ok, stats = results[spider_id]
+        self.assertTrue(ok)
+        self.assertEqual(stats["item_scraped_count"], 7)
+        with self.assertRaises(BadRequest):
+            SpiderRegistry(front_port=None).register(
+                self.ext.general_data, "127.0.0.1"
+            )
+
+        # clients connected over the socket don't share a rate limit bucket
+        class SocketEndpoints:
+            def endpointForURI(self, uri):
+                return UNIXClientEndpoint(reactor, socket_path)
+
+        socket_agent = Agent.usingEndpointFactory(reactor, SocketEndpoints())
+        self.ext.root_resource.rate_limiter = RateLimiter(0.01, burst=1)
+        for forwarded, code in ((None, 200), (None, 200), (b"10.0.0.1", 200)):
+            request_headers = headers.copy()
+            if forwarded is not None:
+                request_headers.setRawHeaders(b"x-forwarded-for", [forwarded])
+            resp = await socket_agent.request(
+                b"GET", b"http://localhost/info/stats", request_headers
+            )
+            self.assertEqual(resp.code, code)
+            await readBody(resp)
+        # clients forwarded by the front are limited by their address
+        resp = await socket_agent.request(
+            b"GET", b"http://localhost/info/stats", request_headers
+        )
+        self.assertEqual(resp.code, 429)
+        await readBody(resp)
+
+        resp = await agent.request(b"GET", f"{front_url}/gone/info/stats".encode())
+        self.assertEqual(resp.code, 404)
+        await readBody(resp)
+
+        # ids can't point at sockets outside of the socket directory
+        outside_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, outside_dir, True)
+        outside = os.path.join(outside_dir, "evil")
+        open(outside + ".sock", "w").close()
+        relative = os.path.relpath(outside, socket_dir)
+        for spider_id in (outside, relative):
+            quoted = urllib.parse.quote(spider_id, safe="")
+            resp = await agent.request(
+                b"GET", f"{front_url}/{quoted}/info/stats".encode(), headers
+            )
+            self.assertEqual(resp.code, 404)
+            await readBody(resp)
+
+        await self.ext._stop()
+        self.assertFalse(os.path.exists(socket_path))
+
+    async def test_shm_snapshots(self):
+        import os
+        import shutil
+        import tempfile
+
+        from scrapy.statscollectors import MemoryStatsCollector
+
+        from spider_info_webservice.shm import (
+            SnapshotDirectory,
+            SnapshotPublisher,
+            SnapshotReader,
+        )
+
+        shm_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, shm_dir, True)
+        await self.ext._stop()
+        self.crawler.stats.set_stats({"item_scraped_count": 2, "start_time": "x"})
+        self.ext.shm_dir = shm_dir
+        self.ext._start()
+        publisher = self.ext.snapshot_publisher
+        spider_id = self.ext.spider_id
+
+        other_stats = MemoryStatsCollector(self.crawler)
+        other_stats.set_stats({"item_scraped_count": 3, "other": 1})
+        other = SnapshotPublisher(f"{shm_dir}/other.snapshot", other_stats)
+        other.publish()
+
+        directory = SnapshotDirectory(shm_dir)
+        self.addCleanup(directory.close)
+        result = directory.aggregate(per_spider=True)
+        self.assertEqual(result["spiders"], 2)
+        self.assertEqual(result["stats"]["item_scraped_count"], 5)
+        self.assertEqual(result["stats"]["other"], 1)
+        self.assertNotIn("start_time", result["stats"])
+        spider = result["per_spider"][spider_id]
+        self.assertEqual(spider["spider_name"], self.crawler.spider.name)
+        self.assertEqual(spider["stats"]["item_scraped_count"], 2)
+        self.assertEqual(spider["engine"]["len(engine.slot.inprogress)"], 2)
+
+        # names are decoded again only when new keys appear
+        reader = directory.readers[spider_id]
+        keys = reader.keys
+        self.crawler.stats.set_value("item_scraped_count", 4)
+        publisher.publish()
+        self.assertIs(reader.read().keys, keys)
+        self.crawler.stats.set_value("new_key", 1)
+        publisher.publish()
+        self.assertEqual(reader.read().stats["new_key"], 1)
+
+        other.stop()
+        result = directory.aggregate()
+        self.assertEqual(result["finished"], 1)
+        self.assertEqual(result["stats"]["item_scraped_count"], 4)
+        self.assertNotIn("other", result["stats"])
+        result = directory.aggregate(include_finished=True)
+        self.assertEqual(result["stats"]["item_scraped_count"], 7)
+
+        # general data changed in place, e.g. by lazy start, is written again
+        self.ext.general_data["late"] = "data"
+        publisher.publish()
+        self.assertEqual(reader.read().general["late"], "data")
+
+        # restarted spider writes a new file, readers of the old one aren't hurt
+        old_reader = directory.readers["other"]
+        other_stats.set_stats({"item_scraped_count": 1})
+        restarted = SnapshotPublisher(f"{shm_dir}/other.snapshot", other_stats)
+        restarted.publish()
+        self.addCleanup(restarted.stop)
+        self.assertEqual(old_reader.read().stats["item_scraped_count"], 3)
+        result = directory.aggregate()
+        self.assertEqual(result["stats"]["item_scraped_count"], 5)
+        self.assertEqual(
+            sorted(os.listdir(shm_dir)),
+            sorted([f"{spider_id}.snapshot", "other.snapshot"]),
+        )
+
+        # names that don't fit are skipped, readers aren't left waiting
+        long_stats = MemoryStatsCollector(self.crawler)
+        long_stats.set_stats({"short": 1, "x" * 100_000: 2})
+        publisher = SnapshotPublisher(
+            f"{shm_dir}/long.snapshot", long_stats, max_keys=2
+        )
+        publisher.publish()
+        self.assertEqual(publisher.seq % 2, 0)
+        reader = SnapshotReader(f"{shm_dir}/long.snapshot")
+        self.addCleanup(reader.close)
+        self.assertEqual(reader.read().stats, {"short": 1})
+        long_stats.set_value("later", 3)
+        publisher.publish()
+        publisher.stop()
+
+    async def test_auth(self):
+        import hashlib
+        from base64 import b64encode
+
+        from spider_info_webservice.auth import hash_password
+        from spider_info_webservice.utils import RateLimiter
+
+        checker = self.ext.credentials_checker
+        resp, _ = await self._request("stats", b"scrapy", b"wrong")
+        self.assertEqual(resp.code, 401)
+        self.assertEqual(
+            resp.headers.getRawHeaders(b"www-authenticate"), [b'Basic realm="auth"']
+        )
+        self.assertEqual(len(checker.cache), 0)
+
+        checker.users["hashed"] = hash_password("pbkdf2")
+        checker.users["scrypted"] = hash_password("scrypt", "scrypt")
+        for user, passwd in ((b"hashed", b"pbkdf2"), (b"scrypted", b"scrypt")):
+            resp, _ = await self._request("stats", user, passwd)
+            self.assertEqual(resp.code, 200)
+            resp, _ = await self._request("stats", user, b"wrong")
+            self.assertEqual(resp.code, 401)
+        self.assertEqual(len(checker.cache), 2)
+        # rejected headers aren't verified again
+        self.assertEqual(len(checker.rejected), 3)
+        self.assertIs(checker.lookup(b"Basic " + b64encode(b"hashed:wrong")), False)
+        # hashes are verified in a thread, not in lookup
+        self.assertIsNone(checker.lookup(b"Basic " + b64encode(b"hashed:other")))
+
+        checker.hashed_tokens.add(hashlib.sha256(b"token").hexdigest())
+        for token, code in ((b"token", 200), (b"wrong", 401)):
+            resp, _ = await self._request(
+                "stats", b"", b"", headers={b"authorization": [b"Bearer " + token]}
+            )
+            self.assertEqual(resp.code, code)
+
+        checker.verify_limiter = RateLimiter(0.01, burst=1)
+        resp, _ = await self._request("stats", b"hashed", b"guess1")
+        self.assertEqual(resp.code, 401)
+        resp, _ = await self._request("stats", b"hashed", b"guess2")
+        self.assertEqual(resp.code, 429)
+        self.assertEqual(resp.headers.getRawHeaders(b"retry-after"), [b"100"])
+        # known headers don't need verification
+        resp, _ = await self._request("stats", b"hashed", b"pbkdf2")
+        self.assertEqual(resp.code, 200)
 
     async def test_sensitive_keys(self):
         import re
@@ -194,6 +751,28 @@ class TestInfoService(TestCase):
             else:
                 self.assertNotEqual(v, "******")
 
+    def test_redactor(self):
+        from spider_info_webservice.utils import SensitiveDataRedactor
+
+        redactor = SensitiveDataRedactor([r".*_PASS(?:WORD)?$"])
+        data = {
+            "DB_PASS": "secret",
+            "FEEDS": [{"uri": "ftp://", "FTP_PASSWORD": "secret"}],
+            "NESTED": ({"API_PASS": "secret", "keep": 1},),
+        }
+        self.assertEqual(
+            redactor.redact(data),
+            {
+                "DB_PASS": "******",
+                "FEEDS": [{"uri": "ftp://", "FTP_PASSWORD": "******"}],
+                "NESTED": ({"API_PASS": "******", "keep": 1},),
+            },
+        )
+        self.assertEqual(data["FEEDS"][0]["FTP_PASSWORD"], "secret")
+        self.assertTrue(redactor.plan[("FEEDS", "FTP_PASSWORD")])
+        self.assertFalse(redactor.plan[("NESTED", "keep")])
+        self.assertEqual(SensitiveDataRedactor([]).redact(data), data)
+
     async def test_all_settings(self):
         import re
 
@@ -216,6 +795,84 @@ class TestInfoService(TestCase):
             else:
                 self.assertEqual(settings[k], v)
 
+    async def test_settings_etag(self):
+        self.crawler.settings.freeze()
+        for params in ({"all": "true"}, {"all": "false"}):
+            resp, content = await self._request(
+                "settings", b"scrapy", b"scrapy", params
+            )
+            self.assertEqual(resp.code, 200)
+            etag = resp.headers.getRawHeaders(b"etag")[0]
+            resp, cached = await self._request(
+                "settings", b"scrapy", b"scrapy", params, {b"if-none-match": [etag]}
+            )
+            self.assertEqual(resp.code, 304)
+            self.assertEqual(cached, b"")
+        self.assertEqual(
+            set(self.ext.root_resource.child_settings.body_cache), {True, False}
+        )
+
+    async def test_general_data_etag(self):
+        resp, content = await self._request("general", b"scrapy", b"scrapy")
+        etag = resp.headers.getRawHeaders(b"etag")[0]
+        resp, _ = await self._request(
+            "general", b"scrapy", b"scrapy", headers={b"if-none-match": [etag]}
+        )
+        self.assertEqual(resp.code, 304)
+        self.ext.root_resource.child_general.general_data = {"changed": True}
+        resp, content = await self._request(
+            "general", b"scrapy", b"scrapy", headers={b"if-none-match": [etag]}
+        )
+        self.assertEqual(resp.code, 200)
+        self.assertEqual(json.loads(content), {"changed": True})
+
+    async def test_compression(self):
+        import gzip
+
+        from spider_info_webservice.utils import COMPRESSORS
+
+        self.crawler.settings.freeze()
+        params = {"all": "true"}
+        resp, plain = await self._request("settings", b"scrapy", b"scrapy", params)
+        self.assertIsNone(resp.headers.getRawHeaders(b"content-encoding"))
+
+        headers = {b"accept-encoding": [b"gzip;q=1.0, identity; q=0.5, *;q=0"]}
+        resp, content = await self._request(
+            "settings", b"scrapy", b"scrapy", params, headers
+        )
+        self.assertEqual(resp.headers.getRawHeaders(b"content-encoding"), [b"gzip"])
+        self.assertEqual(resp.headers.getRawHeaders(b"vary"), [b"Accept-Encoding"])
+        self.assertEqual(gzip.decompress(content), plain)
+        etag = resp.headers.getRawHeaders(b"etag")[0]
+        self.assertTrue(etag.endswith(b'-gzip"'))
+        self.assertIn(
+            (True, b"gzip"), self.ext.root_resource.child_settings.compressed_cache
+        )
+
+        resp, content = await self._request(
+            "settings",
+            b"scrapy",
+            b"scrapy",
+            params,
+            {**headers, b"if-none-match": [etag]},
+        )
+        self.assertEqual(resp.code, 304)
+
+        if b"br" in COMPRESSORS:
+            resp, content = await self._request(
+                "settings",
+                b"scrapy",
+                b"scrapy",
+                params,
+                {b"accept-encoding": [b"gzip, br"]},
+            )
+            self.assertEqual(resp.headers.getRawHeaders(b"content-encoding"), [b"br"])
+
+        resp, content = await self._request(
+            "stats", b"scrapy", b"scrapy", headers=headers
+        )
+        self.assertIsNone(resp.headers.getRawHeaders(b"content-encoding"))
+
     async def test_general_data(self):
         general = await self._req("general", b"scrapy", b"scrapy")
         self.assertEqual(general, self.ext.general_data)
@@ -229,6 +886,296 @@ class TestInfoService(TestCase):
                 stats_from_ext[k] = 0
         self.assertEqual(stats, stats_from_ext)
 
+    async def test_stats_since(self):
+        from spider_info_webservice.statscollectors import VersionedStatsCollector
+
+        stats = VersionedStatsCollector(self.crawler)
+        self.ext.root_resource.child_stats.stats = stats
+        stats.set_value("a", 1)
+        stats.inc_value("b")
+
+        full = await self._req("stats", b"scrapy", b"scrapy", {"since": 0})
+        self.assertEqual(full, {"version": 2, "full": True, "stats": {"a": 1, "b": 1}})
+
+        stats.inc_value("b")
+        stats.max_value("a", 0)
+        delta = await self._req(
+            "stats", b"scrapy", b"scrapy", {"since": full["version"]}
+        )
+        self.assertEqual(delta, {"version": 3, "full": False, "stats": {"b": 2}})
+
+        stats.clear_stats()
+        stats.set_value("c", 1)
+        delta = await self._req(
+            "stats", b"scrapy", b"scrapy", {"since": delta["version"]}
+        )
+        self.assertEqual(delta, {"version": 5, "full": True, "stats": {"c": 1}})
+
+        self.ext.root_resource.child_stats.stats = self.crawler.stats
+        error = await self._req("stats", b"scrapy", b"scrapy", {"since": 1})
+        self.assertIn("error", error)
+
+    async def test_latency(self):
+        from scrapy import Request
+        from scrapy.http import HtmlResponse
+
+        from spider_info_webservice.collectors import LatencyCollector
+        from spider_info_webservice.resources import LatencyResource
+
+        collector = LatencyCollector(max_domains=2)
+        for domain, latency, n in (("a", 0.1, 100), ("b", 1.0, 10), ("c", 0.5, 5)):
+            if domain == "c":
+                # a was seen after b, b is evicted by c
+                collector.response_received(
+                    HtmlResponse("http://a.example/", body=b""),
+                    Request("http://a.example/"),
+                    None,
+                )
+            for i in range(n):
+                request = Request(
+                    f"http://{domain}.example/{i}",
+                    meta={"download_latency": latency * (1 + i % 2)},
+                )
+                response = HtmlResponse(request.url, body=b"x" * 1000, request=request)
+                collector.response_received(response, request, None)
+            collector.item_scraped({}, response, None)
+        self.ext.root_resource.putChild(b"latency", LatencyResource(collector))
+
+        latency = await self._req(
+            "latency", b"scrapy", b"scrapy", {"percentiles": "50,99", "top": "1"}
+        )
+        self.assertEqual(latency["tracked"], 2)
+        self.assertEqual(latency["evicted"], 1)
+        self.assertEqual(latency["total"]["responses"], 116)
+        self.assertEqual(latency["total"]["items"], 3)
+        self.assertEqual(list(latency["domains"]), ["a.example"])
+        a = latency["domains"]["a.example"]
+        self.assertEqual(a["responses"], 101)
+        self.assertEqual(a["latency"]["count"], 100)
+        self.assertEqual(a["latency"]["max"], 0.2)
+        # buckets are within 1/8 of the value
+        self.assertTrue(0.1 <= a["latency"]["p50"] <= 0.1 * 9 / 8)
+        self.assertTrue(0.2 <= a["latency"]["p99"] <= 0.2 * 9 / 8)
+        self.assertEqual(a["bytes"], 100_000)
+
+        latency = await self._req(
+            "latency", b"scrapy", b"scrapy", {"domain": "c.example,b.example"}
+        )
+        self.assertEqual(list(latency["domains"]), ["c.example"])
+        self.assertEqual(latency["domains"]["c.example"]["items"], 1)
+
+        # values at the top of the range get their own buckets too
+        from spider_info_webservice.collectors import LogHistogram
+
+        histogram = LogHistogram(-13, 11)
+        for value in (1500, 2000):
+            histogram.record(value)
+        self.assertTrue(1500 <= histogram.percentile(50) <= 1500 * 9 / 8)
+        self.assertEqual(histogram.counts[-1], 1)
+
+    async def test_memory(self):
+        import tracemalloc
+
+        from spider_info_webservice.resources import MemoryResource
+
+        self.addCleanup(tracemalloc.stop)
+        # opt-in
+        resp, _ = await self._request("memory", b"scrapy", b"scrapy")
+        self.assertEqual(resp.code, 404)
+        self.ext.memory_enabled = True
+        self.ext.prep_resources()
+        self.assertIn(b"memory", [r["name"] for r in self.ext.resources])
+
+        self.ext.root_resource.putChild(b"memory", MemoryResource(max_snapshots=2))
+        memory = await self._req("memory", b"scrapy", b"scrapy")
+        self.assertGreater(memory["max_rss"], 0)
+        self.assertEqual(len(memory["gc"]["counts"]), 3)
+        self.assertIn(type(self.crawler.spider).__name__, memory["live_refs"])
+        self.assertEqual(memory["tracemalloc"]["tracing"], False)
+
+        resp, _ = await self._request("memory", b"scrapy", b"scrapy", {"top": "5"})
+        self.assertEqual(resp.code, 409)
+        memory = await self._req(
+            "memory", b"scrapy", b"scrapy", {"tracemalloc": "start"}
+        )
+        self.assertEqual(memory["tracemalloc"]["tracing"], True)
+
+        for expected_id in (1, 2, 3):
+            memory = await self._req(
+                "memory", b"scrapy", b"scrapy", {"tracemalloc": "snapshot", "top": "3"}
+            )
+            self.assertEqual(memory["snapshot"], expected_id)
+            self.assertLessEqual(len(memory["top"]), 3)
+        # only the latest two are kept
+        self.assertEqual([s["id"] for s in memory["tracemalloc"]["snapshots"]], [2, 3])
+        resp, _ = await self._request("memory", b"scrapy", b"scrapy", {"diff": "1"})
+        self.assertEqual(resp.code, 404)
+
+        allocated = [bytearray(1000) for _ in range(1000)]
+        memory = await self._req(
+            "memory", b"scrapy", b"scrapy", {"diff": "3", "top": "1"}
+        )
+        self.assertEqual(memory["diff"]["base"], 3)
+        [top] = memory["diff"]["top"]
+        self.assertTrue(top["file"].endswith("__init__.py"))
+        self.assertGreaterEqual(top["size_diff"], 1_000_000)
+        del allocated
+
+        memory = await self._req(
+            "memory", b"scrapy", b"scrapy", {"tracemalloc": "stop"}
+        )
+        self.assertEqual(memory["tracemalloc"], {"tracing": False, "snapshots": []})
+
+    def test_settings_from_command_line(self):
+        # -s values are strings
+        crawler = get_crawler(
+            TestSpider,
+            {
+                "INFO_SERVICE_STATS_HISTORY_INTERVAL": "0.5",
+                "INFO_SERVICE_STATS_HISTORY_SIZE": "100",
+                "INFO_SERVICE_STATS_HISTORY_MAX_KEYS": "8",
+                "INFO_SERVICE_OFFLOAD_THRESHOLD": "500",
+                "INFO_SERVICE_OFFLOAD_POOL_SIZE": "4",
+            },
+        )
+        ext = InfoService.from_crawler(crawler)
+        self.assertEqual(ext.stats_history_interval, 0.5)
+        self.assertEqual(ext.stats_history.size, 100)
+        self.assertEqual(ext.stats_history.max_keys, 8)
+        self.assertEqual(ext.serialization_pool.threshold, 500)
+        self.assertEqual(ext.serialization_pool.threadpool.max, 4)
+
+        for value, extra in (
+            ('{"slots": "len(engine.slots)"}', {"slots": "len(engine.slots)"}),
+            ('["max(1, 2)"]', ["max(1, 2)"]),
+            ("len(engine.slots),time()", ["len(engine.slots)", "time()"]),
+        ):
+            crawler = get_crawler(TestSpider, {"INFO_SERVICE_ENGINE_STATUS_EXTRA": value})
+            ext = InfoService.from_crawler(crawler)
+            self.assertEqual(ext.engine_status_extra, extra)
+
+    async def test_stats_history(self):
+        from spider_info_webservice.history import StatsHistory
+        from spider_info_webservice.resources import StatsHistoryResource
+
+        history = StatsHistory(self.crawler.stats, size=3, max_keys=2)
+        self.crawler.stats.set_stats({"items": 0, "start_time": "now"})
+        for now, items in ((1.0, 0), (2.0, 10), (3.0, 30), (4.0, 60)):
+            self.crawler.stats.set_value("items", items)
+            history.sample(now)
+        self.ext.root_resource.child_stats.putChild(
+            b"history", StatsHistoryResource(history)
+        )
+
+        response = await self._req("stats/history", b"scrapy", b"scrapy", {"window": 2})
+        self.assertEqual(response["timestamps"], [2.0, 3.0, 4.0])
+        self.assertEqual(response["series"], {"items": [10.0, 30.0, 60.0]})
+        self.assertEqual(response["rates"], {"items": [20.0, 30.0]})
+        self.assertEqual(response["moving_average"], {"items": [20.0, 25.0]})
+        stats = await self._req("stats", b"scrapy", b"scrapy")
+        self.assertEqual(stats["items"], 60)
+
+    async def test_stream(self):
+        from base64 import b64encode
+
+        from twisted.internet import defer, protocol, reactor
+
+        stream = self.ext.root_resource.child_stream
+        stream.interval = 0.01
+        received = defer.Deferred()
+
+        class EventsReader(protocol.Protocol):
+            buffer = b""
+
+            def dataReceived(self, data):
+                self.buffer += data
+                if self.buffer.count(b"\n\n") >= 2 and not received.called:
+                    self.transport.stopProducing()
+                    received.callback(self.buffer)
+
+        url = f"http://{self.ext.host}:{self.ext.port.getHost().port}/info/stream"
+        resp = await Agent(reactor).request(
+            b"GET",
+            url.encode(),
+            Headers({b"authorization": [b"Basic " + b64encode(b"scrapy:scrapy")]}),
+        )
+        self.assertEqual(
+            resp.headers.getRawHeaders(b"content-type"), [b"text/event-stream"]
+        )
+        self.crawler.stats.set_value("stream", 1)
+        resp.deliverBody(EventsReader())
+        events = (await received).split(b"\n\n")
+
+        self.assertTrue(events[0].startswith(b"id: 1\nevent: snapshot\ndata: "))
+        snapshot = json.loads(events[0].split(b"data: ")[1])
+        self.assertNotIn("stream", snapshot["stats"])
+        self.assertTrue(events[1].startswith(b"id: 2\nevent: update\ndata: "))
+        update = json.loads(events[1].split(b"data: ")[1])
+        self.assertEqual(update["stats"], {"stream": 1})
+        self.assertIn("len(engine.slot.inprogress)", update["engine"])
+
+        while stream.subscribers:
+            await deferLater(reactor, 0.01)
+        self.assertFalse(stream._loop.running)
+
+    async def test_metrics(self):
+        from datetime import datetime, timezone
+
+        self.crawler.stats.set_stats(
+            {
+                "downloader/response_status_count/200": 2,
+                "downloader/response_status_count/404": 1,
+                "log_count/INFO": 4,
+                "scheduler/enqueued/memory": 2,
+                "start_time": datetime(2024, 1, 1, tzinfo=timezone.utc),
+                "finish_reason": "finished",
+            }
+        )
+        resp, content = await self._request("metrics", b"scrapy", b"scrapy")
+        self.assertTrue(
+            resp.headers.getRawHeaders(b"content-type")[0].startswith(
+                b"application/openmetrics-text"
+            )
+        )
+        lines = content.decode().splitlines()
+        for line in (
+            "# TYPE scrapy_downloader_response_status_count gauge",
+            'scrapy_downloader_response_status_count{status="200"} 2',
+            'scrapy_downloader_response_status_count{status="404"} 1',
+            'scrapy_log_count{level="INFO"} 4',
+            "scrapy_scheduler_enqueued_memory 2",
+            "scrapy_start_time 1704067200.0",
+            "scrapy_engine_slot_inprogress 2",
+        ):
+            self.assertIn(line, lines)
+        self.assertFalse([line for line in lines if "finish_reason" in line])
+        self.assertEqual(lines[-1], "# EOF")
+        self.assertEqual(
+            lines.index('scrapy_downloader_response_status_count{status="404"} 1'),
+            lines.index('scrapy_downloader_response_status_count{status="200"} 2') + 1,
+        )
+
+        from spider_info_webservice.openmetrics import MetricsRenderer
+
+        renderer = MetricsRenderer("spider")
+        lines = (
+            renderer.render(
+                renderer.stats_samples(
+                    {"nan": float("nan"), "inf": float("inf"), "ninf": float("-inf")}
+                ),
+                renderer.engine_samples([("len(engine.slot.inprogress)", 2)]),
+            )
+            .decode()
+            .splitlines()
+        )
+        for line in (
+            "spider_nan NaN",
+            "spider_inf +Inf",
+            "spider_ninf -Inf",
+            "spider_engine_slot_inprogress 2",
+        ):
+            self.assertIn(line, lines)
+
     async def test_slot(self):
         slot = await self._req("slot", b"scrapy", b"scrapy")
         self.assertEqual(
@@ -241,6 +1188,308 @@ class TestInfoService(TestCase):
             },
         )
 
+    async def test_slot_pagination(self):
+        slot = await self._req("slot", b"scrapy", b"scrapy", {"offset": 1, "limit": 1})
+        self.assertEqual(slot["total"], 2)
+        self.assertEqual(
+            slot["in_progress_requests"],
+            [
+                prepare_for_serialisation(elem.to_dict())
+                for elem in self.crawler.engine.slot.inprogress[1:2]
+            ],
+        )
+
+    async def test_slot_fields(self):
+        slot = await self._req(
+            "slot", b"scrapy", b"scrapy", {"fields": "url,method,meta.download_slot"}
+        )
+        self.assertEqual(
+            slot["in_progress_requests"],
+            [
+                {
+                    "url": elem.url,
+                    "method": "GET",
+                    "meta": {"download_slot": "quotes.toscrape.com"},
+                }
+                for elem in self.crawler.engine.slot.inprogress
+            ],
+        )
+        error = await self._req("slot", b"scrapy", b"scrapy", {"fields": "__class__"})
+        self.assertIn("error", error)
+
+    async def test_batch(self):
+        from io import BytesIO
+
+        from twisted.internet import reactor
+        from twisted.web.client import FileBodyProducer, readBody
+
+        self.crawler.stats.set_stats({"item_scraped_count": 1})
+        batch = await self._req(
+            "batch",
+            b"scrapy",
+            b"scrapy",
+            {"r": "stats,engine,slot,metrics,stream,nope", "slot.limit": "1"},
+        )
+        self.assertEqual(
+            list(batch), ["stats", "engine", "slot", "metrics", "stream", "nope"]
+        )
+        self.assertEqual(batch["stats"]["item_scraped_count"], 1)
+        self.assertEqual(batch["engine"]["len(engine.slot.inprogress)"], 2)
+        self.assertEqual(len(batch["slot"]["in_progress_requests"]), 1)
+        self.assertEqual(batch["slot"]["total"], 2)
+        self.assertIn("scrapy_item_scraped_count 1", batch["metrics"])
+        self.assertIn("error", batch["stream"])
+        self.assertIn("error", batch["nope"])
+
+        error = await self._req("batch", b"scrapy", b"scrapy")
+        self.assertIn("error", error)
+
+        url = f"http://127.0.0.1:{self.ext.port.getHost().port}/info/batch"
+        headers = Headers({b"authorization": [b"Basic c2NyYXB5OnNjcmFweQ=="]})
+        for body, code in (
+            ({"slot": {"fields": ["url"], "limit": 1}, "general": None}, 200),
+            ({"slot": {"fields": "__class__"}}, 200),
+            (["slot"], 400),
+        ):
+            resp = await Agent(reactor).request(
+                b"POST",
+                url.encode(),
+                headers,
+                FileBodyProducer(BytesIO(json.dumps(body).encode())),
+            )
+            self.assertEqual(resp.code, code)
+            batch = json.loads(await readBody(resp))
+            if code != 200:
+                self.assertIn("error", batch)
+            elif "general" in batch:
+                self.assertEqual(
+                    batch["slot"]["in_progress_requests"],
+                    [{"url": self.crawler.engine.slot.inprogress[0].url}],
+                )
+                self.assertEqual(batch["general"], self.ext.general_data)
+            else:
+                self.assertIn("error", batch["slot"])
+
+    async def test_slot_ndjson(self):
+        self.ext.root_resource.child_slot.stream_batch_size = 1
+        content = await self._req(
+            "slot", b"scrapy", b"scrapy", {"format": "ndjson", "fields": "url"}
+        )
+        self.assertEqual(
+            [json.loads(line) for line in content.decode().splitlines()],
+            [{"url": elem.url} for elem in self.crawler.engine.slot.inprogress],
+        )
+
+        # nothing is written while the transport has the stream paused
+        from twisted.internet import reactor
+        from twisted.web.test.requesthelper import DummyRequest
+
+        class StreamedRequest(DummyRequest):
+            producer = None
+
+            def registerProducer(self, producer, streaming):
+                self.producer = producer
+
+            def unregisterProducer(self):
+                self.producer = None
+
+        request = StreamedRequest([b""])
+        request.args = {b"format": [b"ndjson"], b"fields": [b"url"]}
+        self.ext.root_resource.child_slot.render_GET(request)
+        request.producer.pauseProducing()
+        await deferLater(reactor, 0.05)
+        self.assertEqual(request.written, [])
+        request.producer.resumeProducing()
+        while not request.finished:
+            await deferLater(reactor, 0.01)
+        self.assertEqual(len(request.written), 2)
+        self.assertIsNone(request.producer)
+
+    async def test_slot_summary(self):
+        first, second = self.crawler.engine.slot.inprogress
+        self.crawler.signals.send_catch_log(
+            scrapy.signals.request_reached_downloader, request=first, spider=None
+        )
+        summary = await self._req(
+            "slot/summary", b"scrapy", b"scrapy", {"percentiles": "50,100"}
+        )
+        self.assertEqual(summary["total"], 2)
+        self.assertEqual(summary["slots"], 1)
+        self.assertEqual(summary["by_method"], {"GET": 2})
+        self.assertEqual(summary["by_depth"], {"0": 2})
+        self.assertGreaterEqual(summary["oldest_age"], 0)
+        latency = {
+            "count": 2,
+            "p50": first.meta["download_latency"],
+            "p100": second.meta["download_latency"],
+            "max": second.meta["download_latency"],
+        }
+        self.assertEqual(summary["latency"], latency)
+        slot = summary["by_slot"]["quotes.toscrape.com"]
+        self.assertEqual(slot["count"], 2)
+        self.assertEqual(slot["oldest_age"], summary["oldest_age"])
+        self.assertEqual(slot["latency"], latency)
+
+        error = await self._req(
+            "slot/summary", b"scrapy", b"scrapy", {"percentiles": "0"}
+        )
+        self.assertIn("error", error)
+
+    async def test_downloader(self):
+        from scrapy.core.downloader import Slot
+
+        slots = self.crawler.engine.downloader.slots
+        for i in range(5):
+            slots[f"{i}.example"] = Slot(concurrency=8, delay=i, randomize_delay=False)
+        slots["2.example"].queue.extend([(None, None)] * 3)
+        slots["2.example"].transferring.add(1)
+
+        downloader = await self._req(
+            "downloader", b"scrapy", b"scrapy", {"sort": "-queue", "top": "2"}
+        )
+        self.assertEqual(downloader["total_slots"], 5)
+        self.assertEqual(downloader["queued"], 3)
+        self.assertEqual(downloader["transferring"], 1)
+        self.assertEqual(
+            [slot["key"] for slot in downloader["slots"]], ["2.example", "0.example"]
+        )
+        self.assertEqual(downloader["slots"][0]["free_transfer_slots"], 7)
+        downloader = await self._req(
+            "downloader", b"scrapy", b"scrapy", {"sort": "delay", "top": "1"}
+        )
+        self.assertEqual(downloader["slots"][0]["key"], "0.example")
+        error = await self._req("downloader", b"scrapy", b"scrapy", {"sort": "nope"})
+        self.assertIn("error", error)
+
+    async def test_scheduler(self):
+        from scrapy import Request
+        from scrapy.core.scheduler import Scheduler
+
+        scheduler = Scheduler.from_crawler(self.crawler)
+        scheduler.open(self.crawler.spider)
+        self.crawler.engine.slot.scheduler = scheduler
+        requests = [
+            Request(f"http://a.example/{i}", priority=i % 2, meta={"depth": 1})
+            for i in range(6)
+        ] + [Request("http://b.example/", dont_filter=True)] * 2
+        for request in requests:
+            self.crawler.signals.send_catch_log(
+                scrapy.signals.request_scheduled, request=request, spider=None
+            )
+            if not scheduler.enqueue_request(request):
+                self.crawler.signals.send_catch_log(
+                    scrapy.signals.request_dropped, request=request, spider=None
+                )
+
+        info = await self._req("scheduler", b"scrapy", b"scrapy", {"top": "1"})
+        self.assertEqual(info["total"], 8)
+        self.assertEqual(
+            info["queues"], {"memory": {"total": 8, "priorities": {"1": 3, "0": 5}}}
+        )
+        self.assertEqual(
+            info["sample"],
+            {"size": 8, "domains": {"a.example": 6}, "depths": {"0": 2, "1": 6}},
+        )
+        self.assertEqual(info["counters"]["scheduled"], 8)
+        self.assertEqual(info["counters"]["domains"], {"a.example": 6})
+
+        info = await self._req("scheduler", b"scrapy", b"scrapy", {"sample": "2"})
+        self.assertEqual(info["sample"]["size"], 2)
+
+    async def test_service_instrumentation(self):
+        await self._req("stats", b"scrapy", b"scrapy")
+        await self._req("stats", b"scrapy", b"scrapy")
+        await self._req("engine", b"scrapy", b"scrapy", {"fields": "nope"})
+        service = await self._req("_service", b"scrapy", b"scrapy")
+        stats = service["resources"]["stats"]
+        self.assertEqual(stats["requests"], 2)
+        self.assertEqual(stats["errors"], 0)
+        self.assertGreater(stats["bytes_out"], 0)
+        self.assertEqual(stats["render"]["count"], 2)
+        self.assertEqual(sum(stats["render"]["buckets"]), 2)
+        self.assertEqual(stats["serialise"]["count"], 2)
+        self.assertEqual(len(stats["render"]["buckets"]), len(service["buckets"]))
+        self.assertEqual(service["resources"]["engine"]["errors"], 1)
+        # this request is counted after its snapshot is taken
+        self.assertEqual(service["total"]["requests"], 3)
+
+    async def test_coalescing_and_rate_limit(self):
+        import time
+
+        from twisted.internet import defer
+
+        from spider_info_webservice.utils import RateLimiter, SerializationPool
+
+        pool = SerializationPool(size=2, threshold=0)
+        pool.start()
+        self.addCleanup(pool.stop)
+        stats = self.ext.root_resource.child_stats
+        stats.serialization_pool = pool
+        converted = []
+
+        def convert(snapshot):
+            converted.append(snapshot)
+            time.sleep(0.2)
+            return snapshot
+
+        stats.convert = convert
+        self.crawler.stats.set_stats({"item_scraped_count": 1})
+        responses = await defer.gatherResults(
+            [
+                defer.ensureDeferred(self._req("stats", b"scrapy", b"scrapy"))
+                for _ in range(2)
+            ]
+        )
+        self.assertEqual(len(converted), 1)
+        self.assertEqual(responses[0], responses[1])
+        self.assertEqual(stats.in_flight, {})
+
+        stats.cache_ttl = 60
+        await self._req("stats", b"scrapy", b"scrapy")
+        self.crawler.stats.set_value("item_scraped_count", 2)
+        cached = await self._req("stats", b"scrapy", b"scrapy")
+        self.assertEqual(cached["item_scraped_count"], 1)
+        self.assertEqual(len(converted), 2)
+
+        self.ext.root_resource.rate_limiter = RateLimiter(rate=0.01, burst=1)
+        resp, _ = await self._request("engine", b"scrapy", b"scrapy")
+        self.assertEqual(resp.code, 200)
+        resp, _ = await self._request("engine", b"scrapy", b"scrapy")
+        self.assertEqual(resp.code, 429)
+        self.assertEqual(resp.headers.getRawHeaders(b"retry-after"), [b"100"])
+
+    async def test_offloaded_serialisation(self):
+        from spider_info_webservice.utils import SerializationPool
+
+        pool = SerializationPool(size=1, threshold=0)
+        pool.start()
+        self.addCleanup(pool.stop)
+        for name in ("slot", "settings", "stats", "general"):
+            getattr(self.ext.root_resource, "child_" + name).serialization_pool = pool
+
+        slot = await self._req("slot", b"scrapy", b"scrapy")
+        self.assertEqual(
+            slot["in_progress_requests"],
+            [
+                prepare_for_serialisation(elem.to_dict())
+                for elem in self.crawler.engine.slot.inprogress
+            ],
+        )
+        slot = await self._req(
+            "slot", b"scrapy", b"scrapy", {"fields": "url,headers.User-Agent"}
+        )
+        self.assertEqual(
+            slot["in_progress_requests"][0],
+            {
+                "url": self.crawler.engine.slot.inprogress[0].url,
+                "headers": {"User-Agent": "Scrapy/2.11.2 (+https://scrapy.org)"},
+            },
+        )
+        settings = await self._req("settings", b"scrapy", b"scrapy", {"all": "true"})
+        self.assertEqual(settings["VERY_SENSETIVE_INFO"], "******")
+        general = await self._req("general", b"scrapy", b"scrapy")
+        self.assertEqual(general, self.ext.general_data)
+
     async def test_engine(self):
         engine_status_from_ext = await self._req("engine", b"scrapy", b"scrapy")
         engine_status = dict(get_engine_status(self.crawler.engine))
@@ -248,9 +1497,49 @@ class TestInfoService(TestCase):
         engine_status_from_ext.pop("time()-engine.start_time")
         self.assertEqual(engine_status_from_ext, engine_status)
 
+    async def test_engine_fields(self):
+        from spider_info_webservice.collectors import EngineStatusCollector
+
+        engine = self.crawler.engine
+        collector = EngineStatusCollector(
+            engine, {"downloader_slots": "len(engine.downloader.slots)"}
+        )
+        self.assertEqual(
+            collector()[1:], get_engine_status(engine)[1:] + [("downloader_slots", 0)]
+        )
+        self.ext.root_resource.child_engine.collector = collector
+
+        fields = "len(engine.slot.inprogress),downloader_slots"
+        status = await self._req("engine", b"scrapy", b"scrapy", {"fields": fields})
+        self.assertEqual(
+            status, {"len(engine.slot.inprogress)": 2, "downloader_slots": 0}
+        )
+        error = await self._req("engine", b"scrapy", b"scrapy", {"fields": "nope"})
+        self.assertIn("error", error)
+
     def test_start(self):
         self.assertIsNotNone(self.ext.port)
 
     async def test_stop(self):
+        from base64 import b64encode
+
+        from twisted.internet import reactor
+        from twisted.web.client import readBody
+
+        stream = self.ext.root_resource.child_stream
+        url = f"http://{self.ext.host}:{self.ext.port.getHost().port}/info/stream"
+        resp = await Agent(reactor).request(
+            b"GET",
+            url.encode(),
+            Headers({b"authorization": [b"Basic " + b64encode(b"scrapy:scrapy")]}),
+        )
+        self.assertEqual(len(stream.subscribers), 1)
+        self.assertTrue(stream._loop.running)
+
         await self.ext._stop()
         assert self.ext.port.disconnected == 1
+        # open streams are finished, not left hanging on the stopped listener
+        body = await readBody(resp)
+        self.assertTrue(body.startswith(b"id: 1\nevent: snapshot\n"))
+        self.assertEqual(stream.subscribers, [])
+        self.assertFalse(stream._loop.running)